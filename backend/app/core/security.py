@@ -23,7 +23,8 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         salt_hex, stored_hash_hex = hashed_password.split(":")
         salt = bytes.fromhex(salt_hex)
         pwd_hash = hashlib.pbkdf2_hmac('sha256', plain_password.encode('utf-8'), salt, 100000)
-        return pwd_hash.hex() == stored_hash_hex
+        # hash_password writes "salt:$hash"; the "$" is not part of the digest.
+        return pwd_hash.hex() == stored_hash_hex.lstrip("$")
     except Exception:
         return False
 
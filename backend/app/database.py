@@ -27,5 +27,9 @@ def get_db():
         db.close()
 
 def create_db_and_tables():
-    from app.models import User, StudySession # Import models to register with Base
+    from app.models import User, StudySession, EmbeddingCache, IngestionJob, SessionDocument, SessionVersion, SummaryPartial, StudyArtifact, QuizQuestion # Import models to register with Base
     Base.metadata.create_all(bind=engine)
+    # create_all does not add columns to existing tables; nullable without a default, so no table rewrite.
+    from sqlalchemy import text
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE ingestion_jobs ADD COLUMN IF NOT EXISTS spool_host VARCHAR"))
@@ -1,13 +1,27 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response
 from app.routers import session, upload, quiz, chat, audio, image, slides, models, auth
 from app.database import create_db_and_tables
+from app.services.runtime import get_runtime
+from app.core.config import settings
+from app.services.ingestion import UploadSizeLimit, ingestion_pool
+from app.services.metrics import render_metrics
+from app.services.study_artifacts import artifact_builder
+import asyncio
 import os
 
 app = FastAPI(title="AI Study Buddy API")
 
+# Cap upload bodies while they stream in (added before CORS so CORS wraps the 413 too)
+app.add_middleware(
+    UploadSizeLimit,
+    path_prefix="/api/upload",
+    # Multipart framing adds a little on top of the file bytes themselves.
+    max_bytes=settings.MAX_UPLOAD_REQUEST_MB * 1024 * 1024 + 1024 * 1024,
+)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -24,6 +38,17 @@ def on_startup():
         create_db_and_tables()
     except Exception as e:
         print(f"DB Startup warning (will retry on request): {e}")
+    try:
+        get_runtime().warm_up()
+    except Exception as e:
+        print(f"RAG runtime warm-up warning (will load on first request): {e}")
+    # Startup handlers run on the server's event loop; artifact builds are scheduled onto it.
+    artifact_builder.start(asyncio.get_running_loop())
+    ingestion_pool.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    ingestion_pool.stop()
 
 # Include Routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Auth"])
@@ -36,6 +61,15 @@ app.include_router(image.router, prefix="/api/image", tags=["Image"])
 app.include_router(slides.router, prefix="/api/slides", tags=["Slides"])
 app.include_router(models.router, prefix="/api/models", tags=["Models"])
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, LLM token and cache counters."""
+    rendered = render_metrics()
+    if rendered is None:
+        return Response("prometheus_client is not installed", status_code=503, media_type="text/plain")
+    body, content_type = rendered
+    return Response(body, media_type=content_type)
+
 # Serve React frontend build
 FRONTEND_DIST = os.path.join(os.path.dirname(__file__), "..", "..", "frontend", "dist")
 
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, String, DateTime, Float, Integer, Text, Index, UniqueConstraint
+from sqlalchemy.dialects.postgresql import ARRAY
 from datetime import datetime
 from app.database import Base
 import uuid
@@ -20,3 +21,96 @@ class StudySession(Base):
     title = Column(String, default="New Session")
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class EmbeddingCache(Base):
+    """Content-addressed chunk embeddings, shared across sessions and uploads."""
+    __tablename__ = "embedding_cache"
+
+    content_hash = Column(String(64), primary_key=True)
+    model_name = Column(String, primary_key=True)
+    embedding = Column(ARRAY(Float), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class IngestionJob(Base):
+    """One uploaded file waiting for / going through extraction and embedding."""
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(String, primary_key=True, index=True, default=lambda: str(uuid.uuid4()))
+    session_id = Column(String, index=True, nullable=False)
+    batch_id = Column(String, index=True, nullable=False)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, default="")
+    file_path = Column(String, nullable=False)
+    spool_host = Column(String, nullable=True)  # INGEST_HOST holding file_path; None = shared spool, any worker
+    status = Column(String, index=True, default="queued")  # queued, extracting, embedding, done, failed
+    attempts = Column(Integer, default=0)
+    chunks = Column(Integer, default=0)
+    byte_size = Column(Integer, default=0)
+    peak_rss_mb = Column(Float, nullable=True)  # highest process RSS sampled while the job's batch was processed
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SessionDocument(Base):
+    """One ingested file per session, keyed by the hash of its bytes (filled by the ingestion workers)."""
+    __tablename__ = "session_documents"
+
+    session_id = Column(String, primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    filename = Column(String, nullable=False)
+    doc_type = Column(String, default="")
+    page_count = Column(Integer, nullable=True)
+    chunk_count = Column(Integer, default=0)
+    byte_size = Column(Integer, default=0)
+    extract_ms = Column(Float, nullable=True)
+    index_ms = Column(Float, nullable=True)  # embed + insert time of the batch the file was written in
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SessionVersion(Base):
+    """Counter bumped whenever a session's documents change; part of every retrieval cache key, in every process."""
+    __tablename__ = "session_versions"
+
+    session_id = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SummaryPartial(Base):
+    """Cached node of a map-reduce summary, keyed by a hash of its prompt inputs."""
+    __tablename__ = "summary_partials"
+
+    input_hash = Column(String(64), primary_key=True)
+    session_id = Column(String, index=True, nullable=False)
+    source = Column(String, nullable=True)  # None for the session-level reduce
+    level = Column(Integer, default=0)  # 0 = chunk group, higher = reduce levels
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class StudyArtifact(Base):
+    """Outline, default summary or starter question pool precomputed for a session after ingestion."""
+    __tablename__ = "study_artifacts"
+
+    session_id = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)  # outline, summary, question_pool
+    fingerprint = Column(String(64), nullable=False)  # session_documents the artifact was built from
+    content = Column(Text, nullable=False)  # JSON
+    generation_ms = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class QuizQuestion(Base):
+    """A generated quiz question banked per session, topic and difficulty, served least-seen first."""
+    __tablename__ = "quiz_questions"
+    __table_args__ = (
+        UniqueConstraint("session_id", "topic", "difficulty", "question_hash", name="uq_quiz_question"),
+        Index("ix_quiz_questions_pool", "session_id", "topic", "difficulty", "served_count"),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    session_id = Column(String, nullable=False)
+    topic = Column(String, nullable=False)  # normalised: stripped, lower case
+    difficulty = Column(String, nullable=False)
+    question_hash = Column(String(64), nullable=False)
+    content = Column(Text, nullable=False)  # JSON: question, options, answer, topic
+    source_chunk_ids = Column(ARRAY(String), default=list)  # chunks in the context the question came from
+    served_count = Column(Integer, default=0)
+    last_served_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
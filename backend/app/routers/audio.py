@@ -1,12 +1,37 @@
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional
-from io import BytesIO
-from app.services.rag_service import RAGService
+import asyncio
+import base64
+import json
+from app.services.runtime import get_runtime
 from app.services.processor import ProcessorService
 
 router = APIRouter()
 processor = ProcessorService()
 
+async def _teacher_answer(session_id: str, text_input: Optional[str], language: str, audio_file: Optional[UploadFile]):
+    """Returns (user query, ateacher_chat result) for a typed or recorded question."""
+    # 1. Get Text (Transcription or Direct Input)
+    if audio_file:
+        # Process uploaded audio blob (webm/mp3/wav) straight from Starlette's spooled file;
+        # transcription blocks on the Gemini API, so keep it off the event loop
+        user_query = await asyncio.to_thread(processor.process_audio_stream, audio_file.file, "input.webm") # Default for browser recording
+        if user_query.startswith("Error"):
+            raise HTTPException(status_code=400, detail="Failed to transcribe audio.")
+    elif text_input:
+        user_query = text_input
+    else:
+        raise HTTPException(status_code=400, detail="No input provided.")
+
+    if not user_query.strip():
+        raise HTTPException(status_code=400, detail="Empty query.")
+
+    # 2. Get Teacher Response (RAG)
+    rag_service = get_runtime().session(session_id)
+    result = await rag_service.ateacher_chat(user_query, language=language)
+    return user_query, result
+
 @router.post("/interact")
 async def teacher_interaction(
     session_id: str = Form(...),
@@ -19,33 +44,11 @@ async def teacher_interaction(
     Returns: Binary Audio Data (TTS of the answer) and Headers with the text transcript.
     """
     try:
-        user_query = ""
-        
-        # 1. Get Text (Transcription or Direct Input)
-        if audio_file:
-            # Process uploaded audio blob (webm/mp3/wav)
-            content = await audio_file.read()
-            audio_stream = BytesIO(content)
-            audio_stream.name = "input.webm" # Default for browser recording
-            
-            user_query = processor.process_audio(audio_stream, "input.webm")
-            if user_query.startswith("Error"):
-                raise HTTPException(status_code=400, detail="Failed to transcribe audio.")
-        elif text_input:
-            user_query = text_input
-        else:
-            raise HTTPException(status_code=400, detail="No input provided.")
-            
-        if not user_query.strip():
-            raise HTTPException(status_code=400, detail="Empty query.")
-
-        # 2. Get Teacher Response (RAG)
-        rag_service = RAGService(session_id=session_id)
-        result = rag_service.teacher_chat(user_query, language=language)
+        user_query, result = await _teacher_answer(session_id, text_input, language, audio_file)
         teacher_response_text = result["response"]
         
-        # 3. Generate Audio (TTS)
-        audio_stream = processor.text_to_speech(teacher_response_text)
+        # 3. Generate Audio (TTS) off the event loop; Polly and the edge-tts fallback both block
+        audio_stream = await asyncio.to_thread(processor.text_to_speech, teacher_response_text)
         
         if not audio_stream:
             # Fallback if TTS fails (e.g. rate limit, though unlikely with OpenAI)
@@ -76,3 +79,41 @@ async def teacher_interaction(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def _stream_line(event: str, data) -> str:
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+@router.post("/interact/stream")
+async def teacher_interaction_stream(
+    session_id: str = Form(...),
+    text_input: Optional[str] = Form(None),
+    language: Optional[str] = Form("English"),
+    audio_file: Optional[UploadFile] = File(None)
+):
+    """
+    Streaming version of /interact, as NDJSON lines ({"event": ..., "data": ...}):
+    first a `transcript` event with user_text, ai_text and sources, then one `audio`
+    event per synthesized sentence (base64 mp3) so playback can start before the
+    whole answer is synthesized, and finally `done` with the number of segments.
+    """
+    try:
+        user_query, result = await _teacher_answer(session_id, text_input, language, audio_file)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        transcript = {"user_text": user_query, "ai_text": result["response"], "sources": result["sources"]}
+        yield _stream_line("transcript", transcript)
+        segments = 0
+        async for audio_bytes in processor.stream_speech(result["response"]):
+            segments += 1
+            yield _stream_line("audio", base64.b64encode(audio_bytes).decode("utf-8"))
+        yield _stream_line("done", {"segments": segments})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from app.services.rag_service import RAGService
+from app.services.runtime import get_runtime
 from typing import List, Optional
+import json
 
 router = APIRouter()
 
@@ -14,13 +16,34 @@ class ChatResponse(BaseModel):
     sources: Optional[List[str]] = []
 
 @router.post("/", response_model=ChatResponse)
-def chat(request: ChatRequest):
+async def chat(request: ChatRequest):
     try:
-        rag_service = RAGService(session_id=request.session_id)
-        result = rag_service.chat(request.query)
+        rag_service = get_runtime().session(request.session_id)
+        result = await rag_service.achat(request.query)
         
         if isinstance(result, dict):
             return {"response": result["response"], "sources": result.get("sources", [])}
         return {"response": result, "sources": []}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest):
+    """
+    Server-sent events version of /api/chat/.
+    Emits `sources` first, then `token` events as the LLM generates, then `done`.
+    """
+    rag_service = get_runtime().session(request.session_id)
+
+    async def event_stream():
+        async for event, data in rag_service.astream_chat(request.query):
+            yield _sse(event, data)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
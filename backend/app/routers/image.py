@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Form, HTTPException
-from app.services.rag_service import RAGService
+from app.services.runtime import get_runtime
 from app.core.config import settings
+import asyncio
 import base64
 import requests
 import urllib.parse
@@ -48,9 +49,8 @@ async def generate_image_from_documents(
     """
     try:
         # 1. Get relevant context from documents
-        rag_service = RAGService(session_id=session_id)
-        retriever = rag_service._get_session_retriever(k=5)
-        docs = retriever.invoke(concept) if retriever else []
+        rag_service = get_runtime().session(session_id)
+        docs = await rag_service._aretrieve(concept, k=5)
         
         context = "\n".join([doc.page_content[:300] for doc in docs[:3]]) if docs else concept
         
@@ -59,7 +59,7 @@ async def generate_image_from_documents(
         encoded_prompt = urllib.parse.quote(prompt)
         image_url = f"https://image.pollinations.ai/prompt/{encoded_prompt}?width=1024&height=1024&nologo=true"
         
-        resp = requests.get(image_url, timeout=30)
+        resp = await asyncio.to_thread(requests.get, image_url, timeout=30)
         resp.raise_for_status()
         base64_image = base64.b64encode(resp.content).decode('utf-8')
         
@@ -1,5 +1,6 @@
 from fastapi import APIRouter
 from app.core.config import settings
+from app.services.runtime import get_runtime
 
 router = APIRouter()
 
@@ -82,3 +83,10 @@ def get_active_models():
         },
         "cloud_provider": provider_name
     }
+
+@router.get("/runtime")
+def get_runtime_status():
+    """
+    Returns which shared RAG components are loaded and their load / warm-up timings (ms).
+    """
+    return get_runtime().stats()
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
-from app.services.rag_service import RAGService
+from app.services.runtime import get_runtime
 from app.services.processor import ProcessorService
 from app.services.docx_generator import create_sample_paper_docx
+from app.services.study_artifacts import get_artifact
 import json
 
 router = APIRouter()
@@ -20,6 +22,7 @@ class SummaryRequest(BaseModel):
     context: Optional[str] = None
     summary_type: Optional[str] = "detailed"
     source_filter: Optional[str] = None
+    mode: Optional[str] = Field(default=None, description="retrieval, map_reduce or auto")
 
 class WeakSpotsRequest(BaseModel):
     session_id: str
@@ -27,12 +30,12 @@ class WeakSpotsRequest(BaseModel):
     user_answers: Dict[str, str]
 
 @router.post("/generate")
-def generate_quiz(request: QuizRequest):
+async def generate_quiz(request: QuizRequest):
     try:
-        rag_service = RAGService(session_id=request.session_id)
+        rag_service = get_runtime().session(request.session_id)
         if request.difficulty not in ["easy", "medium", "hard"]:
             request.difficulty = "medium"
-        return rag_service.generate_quiz(
+        return await rag_service.agenerate_quiz(
             topic=request.topic or "general",
             difficulty=request.difficulty,
             num_questions=request.num_questions
@@ -40,29 +43,64 @@ def generate_quiz(request: QuizRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _stream_line(event: str, data, stream_format: str) -> str:
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+@router.post("/generate/stream")
+async def generate_quiz_stream(request: QuizRequest, format: str = "ndjson"):
+    """
+    Streaming /generate: each question is sent as soon as it is complete, as
+    NDJSON lines ({"event": "question", "data": {...}}) or, with ?format=sse,
+    server-sent events. Ends with a `done` event carrying the count and source.
+    """
+    rag_service = get_runtime().session(request.session_id)
+    difficulty = request.difficulty if request.difficulty in ["easy", "medium", "hard"] else "medium"
+    stream_format = "sse" if format == "sse" else "ndjson"
+
+    async def event_stream():
+        async for event, data in rag_service.astream_quiz(request.topic or "general", difficulty, request.num_questions):
+            yield _stream_line(event, data, stream_format)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if stream_format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.post("/analyze")
 def analyze_weak_spots(request: WeakSpotsRequest):
     try:
-        rag_service = RAGService(session_id=request.session_id)
+        rag_service = get_runtime().session(request.session_id)
         return rag_service.analyze_weak_spots(request.questions, request.user_answers)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/summary")
-def generate_summary(request: SummaryRequest):
+async def generate_summary(request: SummaryRequest):
     try:
-        rag_service = RAGService(session_id=request.session_id)
+        rag_service = get_runtime().session(request.session_id)
         context = request.context if request.context else "full_context_trigger"
         summary_type = request.summary_type or "detailed"
-        return {"summary": rag_service.generate_summary(context, summary_type, request.source_filter)}
+        return {"summary": await rag_service.agenerate_summary(context, summary_type, request.source_filter, request.mode)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/documents/{session_id}")
 def get_session_documents(session_id: str):
     try:
-        rag_service = RAGService(session_id=session_id)
-        return {"documents": rag_service.get_session_documents_list()}
+        rag_service = get_runtime().session(session_id)
+        details = rag_service.get_session_documents()
+        return {"documents": rag_service.get_session_documents_list(details), "details": details}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/outline/{session_id}")
+def get_session_outline(session_id: str):
+    """Outline precomputed after ingestion; empty until the session's artifacts are built."""
+    try:
+        return {"outline": get_artifact(session_id, "outline") or [], "summary_ready": get_artifact(session_id, "summary") is not None}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -90,7 +128,7 @@ async def generate_pyq_sample(
             raise HTTPException(status_code=400, detail=text)
             
         # 2. Initialize RAG
-        rag_service = RAGService(session_id=session_id)
+        rag_service = get_runtime().session(session_id)
         
         # 3. Analyze Pattern
         pattern = rag_service.analyze_pyq_pattern(text)
@@ -103,7 +141,7 @@ async def generate_pyq_sample(
         # For now, let's fetch a broad context about "all topics"
         # In rag_service.generate_sample_paper we need context. 
         # Helper:
-        context, _ = rag_service.get_context_for_quiz("comprehensive overview of all topics")
+        context, _ = await rag_service.aget_context_for_quiz("comprehensive overview of all topics")
         
         # 5. Generate Paper
         paper_data = rag_service.generate_sample_paper(context, pattern)
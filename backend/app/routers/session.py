@@ -2,7 +2,7 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
 import uuid
-from app.services.rag_service import RAGService
+from app.services.runtime import get_runtime
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import StudySession
@@ -65,7 +65,7 @@ def delete_session(session_id: str, db: Session = Depends(get_db)):
     """Delete a session from DB and all its associated vectors."""
     try:
         # Delete vectors
-        rag_service = RAGService()
+        rag_service = get_runtime().session()
         deleted_count = rag_service.delete_session_documents(session_id)
         
         # Delete from DB
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Form, HTTPException, Response
-from app.services.rag_service import RAGService
+from app.services.runtime import get_runtime
 from app.services.ppt_service import PPTService
 
 router = APIRouter()
@@ -17,7 +17,7 @@ async def generate_slides(
     """
     try:
         # 1. Generate Content with RAG
-        rag_service = RAGService(session_id=session_id)
+        rag_service = get_runtime().session(session_id)
         slides_data = await rag_service.generate_slide_content(topic, num_slides)
         
         if not slides_data:
@@ -1,69 +1,75 @@
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks
-from typing import List, Optional
-from app.services.processor import ProcessorService
-from app.services.rag_service import RAGService
-from app.database import SessionLocal
-from app.models import StudySession
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from typing import List
+from app.core.config import settings
+from app.services.ingestion import (
+    UploadTooLarge, enqueue_files, get_session_status, ingestion_pool, rss_mb, spool_path, spool_upload,
+    valid_session_id,
+)
+import os
 
 router = APIRouter()
 
-def process_documents_background(files_data: list, session_id: str):
-    """Background task to process documents without blocking the response."""
-    processor = ProcessorService()
-    rag = RAGService(session_id=session_id)
-    
-    processed_count = 0
-    
-    # Auto-name the session based on the first upload
-    db = SessionLocal()
-    try:
-        session_record = db.query(StudySession).filter(StudySession.id == session_id).first()
-        if session_record and session_record.title == "New Session":
-            if files_data:
-                session_record.title = files_data[0][1]  # The filename
-            db.commit()
-    except Exception as e:
-        print(f"Error renaming session: {e}")
-    finally:
-        db.close()
 
-    # Process files
-    for file_content, filename, content_type in files_data:
-        try:
-            text, metadata = processor.process_file_sync(file_content, filename, content_type)
-            if text and not text.startswith("[Skipped"):
-                rag.add_document(text, metadata)
-                processed_count += 1
-        except Exception as e:
-            print(f"Error processing {filename}: {e}")
-    
-    print(f"Background processing complete: {processed_count} files for session {session_id}")
+def _discard(spooled: list):
+    for file_path, *_ in spooled:
+        if os.path.exists(file_path):
+            os.remove(file_path)
 
 
 @router.post("/")
 async def upload_files(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(None),
     session_id: str = Form(...)
 ):
-    """Upload files - returns immediately while processing happens in background."""
-    files_data = []
-    if files:
-        for file in files:
-            content = await file.read()
-            files_data.append((content, file.filename, file.content_type))
-    
-    # Add background task
-    background_tasks.add_task(
-        process_documents_background, 
-        files_data, 
-        session_id
-    )
-    
-    file_count = len(files_data)
+    """Upload files - streams them to disk and queues one ingestion job per file, then returns immediately."""
+    if not valid_session_id(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session_id.")
+    max_file_bytes = settings.MAX_UPLOAD_FILE_MB * 1024 * 1024
+    remaining_bytes = settings.MAX_UPLOAD_REQUEST_MB * 1024 * 1024
+    spooled = []
+    try:
+        for file in files or []:
+            file_path = spool_path(session_id, file.filename)
+            spooled.append((file_path, file.filename, file.content_type, 0))
+            size = await spool_upload(file, file_path, min(max_file_bytes, remaining_bytes))
+            remaining_bytes -= size
+            spooled[-1] = (file_path, file.filename, file.content_type, size)
+    except UploadTooLarge as e:
+        _discard(spooled)
+        raise HTTPException(
+            status_code=413,
+            detail=f"{e} exceeds the upload limit ({settings.MAX_UPLOAD_FILE_MB} MB per file, {settings.MAX_UPLOAD_REQUEST_MB} MB per request)."
+        )
+
+    try:
+        job_ids = enqueue_files(session_id, spooled)
+    except Exception as e:
+        _discard(spooled)
+        raise HTTPException(status_code=500, detail=f"Failed to queue files: {e}")
+    ingestion_pool.notify()
+
+    file_count = len(spooled)
     
     return {
         "message": f"Processing {file_count} file(s) in background. You can start using features!",
         "session_id": session_id,
-        "status": "processing"
+        "status": "processing",
+        "job_ids": job_ids,
+        "bytes_received": sum(item[3] for item in spooled),
+        "rss_mb": rss_mb()
     }
+
+
+@router.get("/status/{session_id}")
+def get_upload_status(session_id: str):
+    """Per-file ingestion state (queued, extracting, embedding, done, failed) for a session."""
+    try:
+        return get_session_status(session_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/stats")
+def get_ingestion_stats():
+    """Cumulative ingestion throughput of this process's workers (chunks/sec, embed vs insert seconds)."""
+    return ingestion_pool.get_stats()
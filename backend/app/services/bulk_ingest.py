@@ -0,0 +1,186 @@
+from app.core.config import settings
+from app.database import engine
+from app.services.chunking import PAGE_SEPARATOR, join_pages, split_with_offsets
+from app.services.embedding_cache import content_hash
+from app.services.metrics import timed
+import csv
+import io
+import json
+import numpy
+import uuid
+
+CHUNK_NAMESPACE = uuid.UUID("5b0c2f1e-6a55-4d0c-9a57-3f0d8f5f2a61")
+EMBEDDING_COLUMNS = "id, collection_id, embedding, document, cmetadata"
+
+
+def chunk_id(session_id: str, source: str, char_start, text: str) -> str:
+    """Deterministic chunk id, so a retried job cannot insert the same chunk twice."""
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{session_id}:{source}:{char_start}:{content_hash(text)}"))
+
+
+def _copy_binary(cursor, collection_id: str, rows: list):
+    """psycopg 3: binary COPY, so vectors go over the wire as float4 arrays instead of decimal text."""
+    from pgvector.psycopg.vector import register_vector_info
+    from psycopg.types import TypeInfo
+    from psycopg.types.json import Jsonb
+    vector_info = TypeInfo.fetch(cursor.connection, "vector")
+    register_vector_info(cursor, vector_info)
+    collection_uuid = uuid.UUID(collection_id)
+    with cursor.copy(f"COPY _embedding_stage ({EMBEDDING_COLUMNS}) FROM STDIN WITH (FORMAT BINARY)") as copy:
+        copy.set_types(["varchar", "uuid", vector_info.oid, "varchar", "jsonb"])
+        for row_id, text, vector, metadata in rows:
+            copy.write_row((row_id, collection_uuid, numpy.asarray(vector, dtype=numpy.float32), text.replace("\x00", ""), Jsonb(metadata)))
+
+
+def _copy_csv(cursor, collection_id: str, rows: list):
+    """psycopg2: CSV COPY with pgvector's text format."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row_id, text, vector, metadata in rows:
+        writer.writerow([
+            row_id,
+            collection_id,
+            "[" + ",".join(map(str, vector)) + "]",
+            text.replace("\x00", ""),
+            json.dumps(metadata),
+        ])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY _embedding_stage ({EMBEDDING_COLUMNS}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def copy_embeddings(collection_id: str, rows: list) -> int:
+    """
+    Writes (id, text, vector, metadata) rows in one transaction: COPY into a
+    temp staging table, then INSERT ... ON CONFLICT DO NOTHING into
+    langchain_pg_embedding. Returns the number of new rows.
+    """
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS _embedding_stage "
+            "(LIKE langchain_pg_embedding INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        if hasattr(cursor, "copy_expert"):
+            _copy_csv(cursor, collection_id, rows)
+        else:
+            _copy_binary(cursor, collection_id, rows)
+        cursor.execute(
+            f"INSERT INTO langchain_pg_embedding ({EMBEDDING_COLUMNS}) "
+            f"SELECT {EMBEDDING_COLUMNS} FROM _embedding_stage ON CONFLICT (id) DO NOTHING"
+        )
+        inserted = cursor.rowcount
+        raw.commit()
+        return inserted
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+class BulkIngestor:
+    """
+    Buffers chunks from every file of an upload, embeds them in
+    EMBED_BATCH_SIZE batches and writes them with copy_embeddings. Flushes
+    automatically every INGEST_FLUSH_CHUNKS chunks so huge PDFs keep streaming.
+    """
+
+    def __init__(self, runtime, session_id: str):
+        self.runtime = runtime
+        self.session_id = session_id
+        self.stats = {"chunks": 0, "inserted": 0, "embed_s": 0.0, "insert_s": 0.0}
+        self._texts = []
+        self._metadatas = []
+        self._owners = []
+        # Tag for the chunks added from now on (the ingestion job), see drop()
+        self.owner = None
+
+    def add(self, text: str, metadata: dict = None, offset: int = 0) -> int:
+        """Splits one document into the buffer. Returns its chunk count."""
+        base_metadata = dict(metadata or {})
+        page_spans = base_metadata.pop("page_spans", None)
+        if self.session_id:
+            base_metadata["session_id"] = self.session_id
+
+        with timed("chunk"):
+            texts, metadatas = split_with_offsets(text, base_metadata, page_spans=page_spans, offset=offset)
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        self._owners.extend([self.owner] * len(texts))
+        if len(self._texts) >= settings.INGEST_FLUSH_CHUNKS:
+            self.flush()
+        return len(texts)
+
+    def add_pages(self, pages, metadata: dict = None, group_pages: int = 50) -> int:
+        """Buffers (page_num, total_pages, text) tuples every group_pages pages, keeping global offsets."""
+        added = 0
+        group = []
+        offset = 0
+        page_meta = dict(metadata or {})
+
+        def _add_group():
+            nonlocal offset
+            text, spans = join_pages(group, offset=offset)
+            if not spans:
+                return 0
+            count = self.add(text, dict(page_meta, page_spans=spans), offset=offset)
+            offset = spans[-1][2] + len(PAGE_SEPARATOR)
+            return count
+
+        for page_num, total_pages, page_text in pages:
+            page_meta["total_pages"] = total_pages
+            group.append((page_num, page_text))
+            if page_num % group_pages == 0:
+                added += _add_group()
+                group = []
+        added += _add_group()
+        return added
+
+    def drop(self, owner) -> int:
+        """Removes the buffered chunks added under owner (e.g. a file that failed mid-extraction). Returns how many."""
+        keep = [i for i, tag in enumerate(self._owners) if tag != owner]
+        dropped = len(self._owners) - len(keep)
+        self._texts = [self._texts[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._owners = [self._owners[i] for i in keep]
+        return dropped
+
+    def flush(self) -> dict:
+        """
+        Embeds and writes the buffer. If that fails the chunks go back into the buffer,
+        so an automatic flush in the middle of a batch does not lose earlier files' chunks.
+        """
+        texts, metadatas, owners = self._texts, self._metadatas, self._owners
+        self._texts, self._metadatas, self._owners = [], [], []
+        if not texts:
+            return self.stats
+
+        try:
+            batch_size = max(1, settings.EMBED_BATCH_SIZE)
+            vectors = []
+            with timed("embed") as embed_timer:
+                for i in range(0, len(texts), batch_size):
+                    vectors.extend(self.runtime.embeddings.embed_documents(texts[i:i + batch_size]))
+
+            ids = [chunk_id(self.session_id, m.get("source", ""), m.get("char_start"), t) for t, m in zip(texts, metadatas)]
+            with timed("vector_insert") as insert_timer:
+                collection_id = self.runtime.collection_id()
+                if collection_id:
+                    inserted = copy_embeddings(collection_id, list(zip(ids, texts, vectors, metadatas)))
+                else:
+                    inserted = len(self.runtime.vector_store.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids))
+        except Exception:
+            self._texts[:0], self._metadatas[:0], self._owners[:0] = texts, metadatas, owners
+            raise
+
+        self.stats["chunks"] += len(texts)
+        self.stats["inserted"] += inserted
+        self.stats["embed_s"] += embed_timer.seconds
+        self.stats["insert_s"] += insert_timer.seconds
+        self.runtime.invalidate_session(self.session_id)
+        return self.stats
+
+    def chunks_per_sec(self) -> float:
+        elapsed = self.stats["embed_s"] + self.stats["insert_s"]
+        return round(self.stats["chunks"] / elapsed, 1) if elapsed else 0.0
@@ -0,0 +1,62 @@
+from bisect import bisect_right
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+PAGE_SEPARATOR = "\n\n"
+
+
+def join_pages(pages, offset: int = 0) -> tuple[str, list]:
+    """
+    Joins (page_num, text) pairs into one string without page markers.
+    Returns (text, page_spans) where each span is [page_num, start, end] in
+    document-global character offsets (shifted by offset).
+    """
+    parts = []
+    spans = []
+    position = offset
+    for page_num, page_text in pages:
+        if not page_text.strip():
+            continue
+        if parts:
+            parts.append(PAGE_SEPARATOR)
+            position += len(PAGE_SEPARATOR)
+        parts.append(page_text)
+        spans.append([page_num, position, position + len(page_text)])
+        position += len(page_text)
+    return "".join(parts), spans
+
+
+def _page_at(starts: list, spans: list, char_index: int) -> int:
+    i = bisect_right(starts, char_index) - 1
+    return spans[max(i, 0)][0]
+
+
+def split_with_offsets(text: str, metadata: dict = None, page_spans: list = None, offset: int = 0,
+                       chunk_size: int = 1000, chunk_overlap: int = 200) -> tuple[list, list]:
+    """
+    Splits text into chunks and returns (texts, metadatas). Each metadata carries
+    char_start/char_end (document-global) and, when page_spans are known,
+    page_start/page_end, so citations never need to parse the chunk text.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True
+    )
+    docs = splitter.create_documents([text])
+    starts = [span[1] for span in page_spans] if page_spans else None
+
+    texts, metadatas = [], []
+    for doc in docs:
+        chunk_meta = dict(metadata or {})
+        local_start = doc.metadata.get("start_index", -1)
+        if local_start >= 0:
+            char_start = offset + local_start
+            char_end = char_start + len(doc.page_content)
+            chunk_meta["char_start"] = char_start
+            chunk_meta["char_end"] = char_end
+            if starts:
+                chunk_meta["page_start"] = _page_at(starts, page_spans, char_start)
+                chunk_meta["page_end"] = _page_at(starts, page_spans, char_end - 1)
+        texts.append(doc.page_content)
+        metadatas.append(chunk_meta)
+    return texts, metadatas
@@ -0,0 +1,149 @@
+"""
+Builds LLM context from retrieved chunks under a token budget.
+
+Chunks are split with a 200-character overlap, so neighbouring hits from the
+same source repeat text. pack_context stitches overlapping or adjacent chunks
+of a source back into one passage (using char_start/char_end metadata), then
+adds passages in relevance order until the budget is used up.
+"""
+from functools import lru_cache
+from langchain_core.documents import Document
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4
+PASSAGE_SEPARATOR = "\n\n"
+# A passage that does not fit is cut down to the remaining budget only if at least this much is left.
+MIN_PARTIAL_TOKENS = 64
+
+
+_fallback_warned = False
+
+
+def _warn_fallback(reason: str):
+    """Budgets silently drift from the model's real limits without a tokenizer, so say so (once)."""
+    global _fallback_warned
+    if not _fallback_warned:
+        _fallback_warned = True
+        print(f"Token budgets are estimated as chars/{CHARS_PER_TOKEN}: {reason}")
+
+
+@lru_cache(maxsize=8)
+def _encoding(model_name: str):
+    if not tiktoken:
+        _warn_fallback("tiktoken is not installed")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name or "")
+    except KeyError:
+        # Non-OpenAI models (Llama, Gemini, Claude): cl100k is a close enough approximation for budgeting.
+        pass
+    except Exception as e:
+        _warn_fallback(f"tokenizer unavailable ({e})")
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        _warn_fallback(f"tokenizer unavailable ({e})")
+        return None
+
+
+def count_tokens(text: str, model_name: str = None) -> int:
+    encoding = _encoding(model_name)
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_tokens(text: str, max_tokens: int, model_name: str = None) -> str:
+    """Cuts text to at most max_tokens tokens."""
+    encoding = _encoding(model_name)
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+def _merged_metadata(first: dict, second: dict) -> dict:
+    metadata = dict(first)
+    metadata["char_end"] = max(first["char_end"], second["char_end"])
+    if second.get("page_end") is not None:
+        metadata["page_end"] = max(first.get("page_end") or 0, second["page_end"])
+    return metadata
+
+
+def _continues(current: Document, doc: Document) -> bool:
+    """True if doc overlaps or directly follows current and their shared text agrees."""
+    start = doc.metadata["char_start"]
+    if start > current.metadata["char_end"] + len(PASSAGE_SEPARATOR):
+        return False
+    # Two different files uploaded under one name share a source but not their text.
+    position = start - current.metadata["char_start"]
+    shared = current.page_content[position:position + len(doc.page_content)]
+    return doc.page_content.startswith(shared)
+
+
+def merge_chunks(docs: list) -> list:
+    """
+    Stitches overlapping or adjacent chunks of the same source into passages.
+    Returns the passages ordered by the best retrieval rank among their chunks.
+    Chunks without offsets are passed through untouched.
+    """
+    groups = {}
+    passages = []
+    for rank, doc in enumerate(docs):
+        metadata = doc.metadata or {}
+        if metadata.get("char_start") is None or metadata.get("char_end") is None:
+            passages.append((rank, doc))
+            continue
+        groups.setdefault(metadata.get("source"), []).append((rank, doc))
+
+    for hits in groups.values():
+        hits.sort(key=lambda hit: hit[1].metadata["char_start"])
+        best_rank, current = hits[0]
+        for rank, doc in hits[1:]:
+            start, end = doc.metadata["char_start"], doc.metadata["char_end"]
+            current_end = current.metadata["char_end"]
+            if _continues(current, doc):
+                if end > current_end:
+                    tail = doc.page_content[max(0, current_end - start):]
+                    # Whitespace the splitter dropped between the chunks keeps later offsets aligned.
+                    joiner = "\n" * max(0, start - current_end)
+                    current = Document(
+                        page_content=current.page_content + joiner + tail,
+                        metadata=_merged_metadata(current.metadata, doc.metadata),
+                    )
+                best_rank = min(best_rank, rank)
+                continue
+            passages.append((best_rank, current))
+            best_rank, current = rank, doc
+        passages.append((best_rank, current))
+
+    passages.sort(key=lambda passage: passage[0])
+    return [doc for _, doc in passages]
+
+
+def pack_context(docs: list, max_tokens: int = None, model_name: str = None) -> tuple[str, list, int]:
+    """
+    Merges chunks and fills max_tokens (None = unlimited) in relevance order.
+    Returns (context, passages used, tokens used).
+    """
+    separator_tokens = count_tokens(PASSAGE_SEPARATOR, model_name)
+    parts, used, total = [], [], 0
+    for doc in merge_chunks(docs):
+        cost = count_tokens(doc.page_content, model_name) + (separator_tokens if parts else 0)
+        if max_tokens is not None and total + cost > max_tokens:
+            remaining = max_tokens - total - (separator_tokens if parts else 0)
+            if remaining < MIN_PARTIAL_TOKENS:
+                continue  # a shorter, less relevant passage may still fit
+            parts.append(truncate_tokens(doc.page_content, remaining, model_name))
+            used.append(doc)
+            total = max_tokens
+            break
+        parts.append(doc.page_content)
+        used.append(doc)
+        total += cost
+    return PASSAGE_SEPARATOR.join(parts), used, total
@@ -0,0 +1,79 @@
+from sqlalchemy.dialects.postgresql import insert
+from app.database import SessionLocal
+from app.models import SessionDocument
+import hashlib
+
+HASH_READ_BYTES = 1024 * 1024
+
+
+def file_hash(path: str) -> str:
+    """sha256 of a spooled upload, read in 1 MB pieces."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_READ_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def find_document(session_id: str, content_hash: str):
+    db = SessionLocal()
+    try:
+        return db.get(SessionDocument, (session_id, content_hash))
+    finally:
+        db.close()
+
+
+def record_documents(rows: list[dict]):
+    """Upserts registry rows (one dict of SessionDocument columns per file)."""
+    if not rows:
+        return
+    db = SessionLocal()
+    try:
+        statement = insert(SessionDocument).values(rows)
+        updated = {
+            column: statement.excluded[column]
+            for column in ("filename", "doc_type", "page_count", "chunk_count", "byte_size", "extract_ms", "index_ms")
+        }
+        db.execute(statement.on_conflict_do_update(index_elements=["session_id", "content_hash"], set_=updated))
+        db.commit()
+    finally:
+        db.close()
+
+
+def list_documents(session_id: str) -> list[dict]:
+    db = SessionLocal()
+    try:
+        documents = db.query(SessionDocument).filter(
+            SessionDocument.session_id == session_id
+        ).order_by(SessionDocument.created_at).all()
+    finally:
+        db.close()
+    return [{
+        "filename": doc.filename,
+        "type": doc.doc_type,
+        "content_hash": doc.content_hash,
+        "page_count": doc.page_count,
+        "chunk_count": doc.chunk_count,
+        "byte_size": doc.byte_size,
+        "extract_ms": doc.extract_ms,
+        "index_ms": doc.index_ms,
+        "created_at": doc.created_at,
+    } for doc in documents]
+
+
+def has_documents(session_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(SessionDocument.session_id).filter(SessionDocument.session_id == session_id).first() is not None
+    finally:
+        db.close()
+
+
+def delete_documents(session_id: str) -> int:
+    db = SessionLocal()
+    try:
+        count = db.query(SessionDocument).filter(SessionDocument.session_id == session_id).delete(synchronize_session=False)
+        db.commit()
+        return count
+    finally:
+        db.close()
@@ -2,7 +2,9 @@ from docx import Document
 from docx.shared import Pt, Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from io import BytesIO
+from app.services.metrics import timed
 
+@timed("docx_render")
 def create_sample_paper_docx(paper_data: dict) -> BytesIO:
     """Generates a DOCX file from the sample paper data."""
     doc = Document()
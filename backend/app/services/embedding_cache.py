@@ -0,0 +1,101 @@
+from langchain_core.embeddings import Embeddings
+from app.database import SessionLocal
+from app.models import EmbeddingCache
+from app.services.cache import TTLCache
+from app.services.metrics import record_cache
+import hashlib
+import threading
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings model with a persistent, content-addressed cache.
+
+    Vectors live in the embedding_cache table keyed by (sha256(chunk), model_name),
+    so re-uploading the same syllabus in any session only embeds new chunks.
+    The cache is best-effort: database errors fall through to the embedder.
+    Query embeddings are kept in an optional in-process LRU/TTL cache instead,
+    since canned retrieval queries repeat on every quiz/summary request.
+    """
+
+    LOOKUP_BATCH = 500
+
+    def __init__(self, underlying: Embeddings, model_name: str, query_cache: TTLCache = None):
+        self.underlying = underlying
+        self.model_name = model_name
+        self.query_cache = query_cache
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _lookup(self, hashes: list) -> dict:
+        found = {}
+        db = SessionLocal()
+        try:
+            for i in range(0, len(hashes), self.LOOKUP_BATCH):
+                rows = db.query(EmbeddingCache.content_hash, EmbeddingCache.embedding).filter(
+                    EmbeddingCache.model_name == self.model_name,
+                    EmbeddingCache.content_hash.in_(hashes[i:i + self.LOOKUP_BATCH])
+                ).all()
+                found.update({h: list(vec) for h, vec in rows})
+        except Exception as e:
+            print(f"Embedding cache lookup note: {e}")
+        finally:
+            db.close()
+        return found
+
+    def _store(self, vectors: dict):
+        from sqlalchemy.dialects.postgresql import insert
+        db = SessionLocal()
+        try:
+            rows = [{"content_hash": h, "model_name": self.model_name, "embedding": vec} for h, vec in vectors.items()]
+            db.execute(insert(EmbeddingCache).values(rows).on_conflict_do_nothing())
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"Embedding cache store note: {e}")
+        finally:
+            db.close()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        hashes = [content_hash(t) for t in texts]
+        unique = dict(zip(hashes, texts))
+        vectors = self._lookup(list(unique))
+
+        missing = [h for h in unique if h not in vectors]
+        if missing:
+            embedded = self.underlying.embed_documents([unique[h] for h in missing])
+            new_vectors = dict(zip(missing, embedded))
+            vectors.update(new_vectors)
+            self._store(new_vectors)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(texts) - len(missing)
+        record_cache("chunk_embedding", hits=len(texts) - len(missing), misses=len(missing))
+        return [vectors[h] for h in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.query_cache is None:
+            return self.underlying.embed_query(text)
+        vector = self.query_cache.get(text)
+        if vector is None:
+            vector = self.underlying.embed_query(text)
+            self.query_cache.set(text, vector)
+        return vector
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "model": self.model_name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "query_cache": self.query_cache.stats() if self.query_cache else None,
+        }
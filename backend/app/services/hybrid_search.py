@@ -0,0 +1,67 @@
+from langchain_core.documents import Document
+from sqlalchemy import text
+from app.database import engine
+from app.services.vector_schema import column_sql
+
+# Vector and full-text candidates are ranked separately, fused with reciprocal-rank
+# fusion (score = sum of 1 / (rrf_k + rank) over the lists a chunk appears in) and
+# joined back to the chunk rows, all in one statement. The tsquery ORs the query's
+# lexemes so long questions still match chunks that contain only the key terms.
+HYBRID_SQL = """
+WITH q AS (
+    SELECT nullif(replace(plainto_tsquery('english', :query)::text, '&', '|'), '')::tsquery AS tsq
+),
+vector_hits AS (
+    SELECT id, row_number() OVER (ORDER BY embedding <=> CAST(:query_vector AS vector)) AS rank
+    FROM langchain_pg_embedding
+    WHERE {where}
+    ORDER BY embedding <=> CAST(:query_vector AS vector)
+    LIMIT :vector_k
+),
+lexical_hits AS (
+    SELECT id, row_number() OVER (ORDER BY ts_rank_cd({tsv}, q.tsq) DESC) AS rank
+    FROM langchain_pg_embedding, q
+    WHERE {where} AND {tsv} @@ q.tsq
+    ORDER BY ts_rank_cd({tsv}, q.tsq) DESC
+    LIMIT :lexical_k
+),
+fused AS (
+    SELECT id, sum(1.0 / (:rrf_k + rank)) AS score
+    FROM (SELECT id, rank FROM vector_hits UNION ALL SELECT id, rank FROM lexical_hits) hits
+    GROUP BY id
+)
+SELECT e.id, e.document, e.cmetadata
+FROM fused JOIN langchain_pg_embedding e ON e.id = fused.id
+ORDER BY fused.score DESC, e.id
+LIMIT :k
+"""
+
+
+def hybrid_search(collection_id: str, query: str, query_vector: list, k: int, session_id: str = None,
+                  source_filter: str = None, vector_k: int = 40, lexical_k: int = 40, rrf_k: int = 60,
+                  schema_ready: bool = True) -> list:
+    """
+    Top-k chunks of a collection by RRF over cosine distance and full-text rank, as LangChain
+    Documents. schema_ready=False computes the migrated columns from cmetadata/document instead.
+    """
+    conditions = ["collection_id = CAST(:collection_id AS uuid)"]
+    params = {
+        "collection_id": collection_id,
+        "query": query,
+        "query_vector": "[" + ",".join(map(str, query_vector)) + "]",
+        "vector_k": max(k, vector_k),
+        "lexical_k": max(k, lexical_k),
+        "rrf_k": rrf_k,
+        "k": k,
+    }
+    if session_id:
+        conditions.append(f"{column_sql('session_id', schema_ready)} = :session_id")
+        params["session_id"] = session_id
+    if source_filter:
+        conditions.append(f"{column_sql('source', schema_ready)} = :source")
+        params["source"] = source_filter
+
+    statement = text(HYBRID_SQL.format(where=" AND ".join(conditions), tsv=column_sql("document_tsv", schema_ready)))
+    with engine.connect() as conn:
+        rows = conn.execute(statement, params).all()
+    return [Document(id=row.id, page_content=row.document, metadata=row.cmetadata or {}) for row in rows]
@@ -0,0 +1,500 @@
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy import or_
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import IngestionJob, StudySession
+from app.services.bulk_ingest import BulkIngestor
+from app.services.document_registry import file_hash, find_document, has_documents, record_documents
+from app.services.metrics import timed
+from app.services.processor import ProcessorService
+from app.services.runtime import get_runtime
+from app.services.study_artifacts import artifact_builder
+import os
+import re
+import threading
+import uuid
+
+ACTIVE_STATES = ("queued", "extracting", "embedding")
+
+
+# Session ids are uuid4 strings; anything else must not reach a filesystem path.
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def valid_session_id(session_id: str) -> bool:
+    return bool(session_id) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+def spool_path(session_id: str, filename: str) -> str:
+    """Where an uploaded file waits on disk until a worker picks it up. Raises ValueError for an unsafe session id."""
+    if not valid_session_id(session_id):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    root = os.path.realpath(settings.UPLOAD_SPOOL_DIR)
+    directory = os.path.realpath(os.path.join(root, session_id))
+    if os.path.dirname(directory) != root:
+        raise ValueError(f"Invalid session id: {session_id!r}")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{uuid.uuid4().hex}_{os.path.basename(filename or 'upload')}")
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process, in MB (None where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+
+
+class RssSampler:
+    """
+    Samples rss_mb() in a thread while the block runs; peak_mb is the highest value seen.
+    ru_maxrss would be the high-water mark of the whole process lifetime, not of one job.
+    """
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        value = rss_mb()
+        if value is not None and (self.peak_mb is None or value > self.peak_mb):
+            self.peak_mb = value
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self) -> "RssSampler":
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimit:
+    """
+    ASGI middleware capping request bodies under path_prefix at max_bytes while they stream in.
+    FastAPI parses (and spools) a whole multipart body before the route runs, so limits checked
+    in the route only apply after everything was read. A larger Content-Length is refused up front.
+    """
+
+    def __init__(self, app, path_prefix: str, max_bytes: int):
+        self.app = app
+        self.path_prefix = path_prefix
+        self.max_bytes = max_bytes
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Request exceeds the upload limit ({settings.MAX_UPLOAD_REQUEST_MB} MB per request).")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > self.max_bytes:
+            error = self._too_large()
+            await JSONResponse({"detail": error.detail}, status_code=error.status_code)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised inside body parsing; FastAPI passes HTTPExceptions through as responses.
+                    raise self._too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def spool_upload(file, file_path: str, max_bytes: int) -> int:
+    """Copies an UploadFile to file_path in UPLOAD_CHUNK_BYTES pieces, enforcing max_bytes. Returns bytes written."""
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(file.filename)
+    written = 0
+    with open(file_path, "wb") as out:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            written += len(chunk)
+            if written > max_bytes:
+                raise UploadTooLarge(file.filename)
+            out.write(chunk)
+    await file.close()
+    return written
+
+
+def enqueue_files(session_id: str, files: list) -> list[str]:
+    """Creates one queued job per (file_path, filename, content_type, byte_size) and names a fresh session after the first file."""
+    batch_id = str(uuid.uuid4())
+    db = SessionLocal()
+    try:
+        jobs = [
+            IngestionJob(
+                session_id=session_id,
+                batch_id=batch_id,
+                filename=filename or "upload",
+                content_type=content_type or "",
+                file_path=file_path,
+                spool_host=None if settings.UPLOAD_SPOOL_SHARED else settings.INGEST_HOST,
+                byte_size=byte_size,
+            )
+            for file_path, filename, content_type, byte_size in files
+        ]
+        db.add_all(jobs)
+
+        session_record = db.query(StudySession).filter(StudySession.id == session_id).first()
+        if session_record and session_record.title == "New Session" and jobs:
+            session_record.title = jobs[0].filename
+
+        db.commit()
+        return [job.id for job in jobs]
+    finally:
+        db.close()
+
+
+def get_session_status(session_id: str) -> dict:
+    db = SessionLocal()
+    try:
+        jobs = db.query(IngestionJob).filter(IngestionJob.session_id == session_id).order_by(IngestionJob.created_at).all()
+    finally:
+        db.close()
+
+    states = [job.status for job in jobs]
+    if any(state in ACTIVE_STATES for state in states):
+        status = "processing"
+    elif states and all(state == "failed" for state in states):
+        status = "failed"
+    elif states:
+        status = "done"
+    else:
+        status = "idle"
+
+    return {
+        "session_id": session_id,
+        "status": status,
+        "counts": {state: states.count(state) for state in set(states)},
+        "jobs": [{
+            "id": job.id,
+            "filename": job.filename,
+            "status": job.status,
+            "chunks": job.chunks,
+            "byte_size": job.byte_size,
+            "peak_rss_mb": job.peak_rss_mb,
+            "attempts": job.attempts,
+            "error": job.error,
+            "created_at": job.created_at,
+            "updated_at": job.updated_at,
+        } for job in jobs]
+    }
+
+
+class IngestionWorkerPool:
+    """
+    Threads that claim queued ingestion jobs from Postgres (FOR UPDATE SKIP LOCKED),
+    so any number of web or worker processes can share one queue. A worker only
+    claims files spooled on its own host (INGEST_HOST) unless the spool is shared.
+    Jobs left mid-flight by a crashed process are re-queued once they go stale,
+    or failed once they have used up INGEST_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, workers: int = None, poll_interval: float = None):
+        self.workers = settings.INGEST_WORKERS if workers is None else workers
+        self.poll_interval = poll_interval or settings.INGEST_POLL_INTERVAL
+        self.processor = None
+        self._threads = []
+        self.stats = {"files": 0, "chunks": 0, "embed_s": 0.0, "insert_s": 0.0}
+        self._stats_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def start(self):
+        if self._threads or self.workers <= 0:
+            return
+        self.processor = ProcessorService()
+        self._requeue_stale()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"Ingestion workers started: {self.workers}")
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+
+    def notify(self):
+        """Wakes idle workers right away instead of waiting for the next poll."""
+        self._wake.set()
+
+    def _requeue_stale(self):
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=settings.INGEST_JOB_STALE_SECONDS)
+            stale = db.query(IngestionJob).filter(
+                IngestionJob.status.in_(("extracting", "embedding")),
+                IngestionJob.updated_at < cutoff
+            )
+            # A file that keeps killing its worker would otherwise be retried forever.
+            exhausted = stale.filter(IngestionJob.attempts >= settings.INGEST_MAX_ATTEMPTS).all()
+            for job in exhausted:
+                job.status = "failed"
+                job.error = f"Worker stopped while processing (attempt {job.attempts} of {settings.INGEST_MAX_ATTEMPTS})"
+            count = stale.filter(IngestionJob.attempts < settings.INGEST_MAX_ATTEMPTS).update(
+                {"status": "queued"}, synchronize_session=False
+            )
+            db.commit()
+            for job in exhausted:
+                self._discard(job.file_path)
+            if count or exhausted:
+                print(f"Re-queued {count} stale ingestion job(s), failed {len(exhausted)} out of attempts")
+        except Exception as e:
+            db.rollback()
+            print(f"Stale job recovery skipped: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                jobs = self._claim_batch()
+            except Exception as e:
+                print(f"Ingestion claim error: {e}")
+                jobs = []
+            if not jobs:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                self._process_batch(jobs)
+            except Exception as e:
+                print(f"Ingestion worker error on batch {jobs[0]['batch_id']}: {e}")
+
+    def _claim_batch(self) -> list[dict]:
+        """Claims the oldest queued job plus up to INGEST_CLAIM_FILES - 1 more queued files from the same upload."""
+        db = SessionLocal()
+        try:
+            first = db.query(IngestionJob).filter(
+                IngestionJob.status == "queued",
+                or_(IngestionJob.spool_host.is_(None), IngestionJob.spool_host == settings.INGEST_HOST)
+            ).order_by(
+                IngestionJob.created_at
+            ).with_for_update(skip_locked=True).first()
+            if not first:
+                db.rollback()
+                return []
+            siblings = db.query(IngestionJob).filter(
+                IngestionJob.status == "queued",
+                IngestionJob.batch_id == first.batch_id,
+                IngestionJob.id != first.id
+            ).order_by(IngestionJob.created_at).with_for_update(skip_locked=True).limit(
+                max(0, settings.INGEST_CLAIM_FILES - 1)
+            ).all()
+
+            jobs = []
+            for job in [first] + siblings:
+                job.status = "extracting"
+                job.attempts = (job.attempts or 0) + 1
+                jobs.append({
+                    "id": job.id,
+                    "batch_id": job.batch_id,
+                    "session_id": job.session_id,
+                    "filename": job.filename,
+                    "content_type": job.content_type,
+                    "file_path": job.file_path,
+                    "byte_size": job.byte_size,
+                    "attempts": job.attempts,
+                })
+            db.commit()
+            return jobs
+        finally:
+            db.close()
+
+    def _update(self, job_id: str, **fields):
+        db = SessionLocal()
+        try:
+            db.query(IngestionJob).filter(IngestionJob.id == job_id).update(
+                {**fields, "updated_at": datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _extract(self, job: dict, ingestor: BulkIngestor) -> tuple[int, int, str]:
+        """Extracts one file into the ingestor's buffer. Returns (chunk count, page count, type)."""
+        filename, content_type, file_path = job["filename"], job["content_type"], job["file_path"]
+        if self.processor.is_pdf(filename, content_type) and settings.PDF_STREAM_GROUP_PAGES > 0:
+            # Pages are chunked in groups while the process pool is still extracting the rest;
+            # the ingestor flushes on its own once INGEST_FLUSH_CHUNKS chunks are buffered.
+            page_count = 0
+
+            def counted(pages):
+                nonlocal page_count
+                for page in pages:
+                    page_count = page[1]
+                    yield page
+
+            with open(file_path, "rb") as f:
+                pages = counted(self.processor.iter_pdf_pages(f))
+                chunks = ingestor.add_pages(pages, {"source": filename, "type": "pdf"}, settings.PDF_STREAM_GROUP_PAGES)
+            return chunks, page_count, "pdf"
+
+        text, metadata = self.processor.process_path(file_path, filename, content_type)
+        if text and not text.startswith("[Skipped"):
+            return ingestor.add(text, metadata), metadata.get("total_pages"), metadata.get("type", "")
+        return 0, None, metadata.get("type", "")
+
+    def _fail(self, job: dict, error: Exception, peak_rss: float = None):
+        print(f"Error processing {job['filename']}: {error}")
+        if job["attempts"] < settings.INGEST_MAX_ATTEMPTS and os.path.exists(job["file_path"]):
+            self._update(job["id"], status="queued", error=str(error))
+        else:
+            self._update(job["id"], status="failed", error=str(error), peak_rss_mb=peak_rss)
+            self._discard(job["file_path"])
+
+    def _process_batch(self, jobs: list[dict]):
+        """Extracts every claimed file, then embeds and writes all their chunks together."""
+        with RssSampler() as rss:
+            try:
+                self._ingest_batch(jobs, rss)
+            finally:
+                self._schedule_artifacts(jobs[0]["session_id"])
+
+    def _schedule_artifacts(self, session_id: str):
+        """
+        After every batch, successful or not: a session whose last job failed still gets
+        artifacts for the documents that did ingest (the builder waits for active jobs).
+        """
+        if not settings.PRECOMPUTE_ARTIFACTS:
+            return
+        try:
+            if has_documents(session_id):
+                artifact_builder.schedule(session_id)
+        except Exception as e:
+            print(f"Artifact scheduling failed for session {session_id}: {e}")
+
+    def _ingest_batch(self, jobs: list[dict], rss: RssSampler):
+        session_id = jobs[0]["session_id"]
+        ingestor = BulkIngestor(get_runtime(), session_id)
+
+        extracted = []
+        duplicates = []
+        seen = {}
+        for job in jobs:
+            try:
+                # Files already in this session's registry (or earlier in this batch) are not re-embedded.
+                job["content_hash"] = file_hash(job["file_path"])
+                if job["content_hash"] in seen:
+                    duplicates.append((job, seen[job["content_hash"]]))
+                    continue
+                existing = find_document(session_id, job["content_hash"])
+                if existing:
+                    print(f"Skipping {job['filename']}: already ingested in session {session_id}")
+                    self._update(job["id"], status="done", chunks=existing.chunk_count, error=None)
+                    self._discard(job["file_path"])
+                    continue
+                seen[job["content_hash"]] = job
+
+                # Streamed PDFs are chunked (and may flush) while they are extracted, so this includes that work.
+                ingestor.owner = job["id"]
+                with timed("extract") as timer:
+                    job["chunks"], job["page_count"], job["doc_type"] = self._extract(job, ingestor)
+                job["extract_ms"] = round(timer.seconds * 1000, 1)
+                self._update(job["id"], status="embedding")
+                extracted.append((job, job["chunks"]))
+            except Exception as e:
+                # Its chunks stay out of the final flush; an automatic flush that failed put the
+                # earlier files' chunks back, so those still go out with it.
+                ingestor.drop(job["id"])
+                self._fail(job, e, rss.peak_mb)
+        if not extracted:
+            for job, _ in duplicates:
+                self._fail(job, RuntimeError("duplicate of a file that failed in the same upload"), rss.peak_mb)
+            return
+
+        try:
+            stats = ingestor.flush()
+        except Exception as e:
+            # Chunk ids are deterministic, so a retry will not duplicate anything already written.
+            for job, _ in extracted:
+                self._fail(job, e, rss.peak_mb)
+            return
+
+        index_ms = round((stats["embed_s"] + stats["insert_s"]) * 1000, 1)
+        try:
+            record_documents([{
+                "session_id": session_id,
+                "content_hash": job["content_hash"],
+                "filename": job["filename"],
+                "doc_type": job["doc_type"] or "",
+                "page_count": job["page_count"],
+                "chunk_count": chunks,
+                "byte_size": job["byte_size"] or os.path.getsize(job["file_path"]),
+                "extract_ms": job["extract_ms"],
+                "index_ms": index_ms,
+            } for job, chunks in extracted if chunks])
+        except Exception as e:
+            print(f"Document registry update failed for session {session_id}: {e}")
+
+        peak_rss = rss.peak_mb
+        for job, chunks in extracted:
+            self._update(job["id"], status="done", chunks=chunks, error=None, peak_rss_mb=peak_rss)
+            self._discard(job["file_path"])
+        done_ids = {job["id"] for job, _ in extracted}
+        for job, original in duplicates:
+            if original["id"] in done_ids:
+                self._update(job["id"], status="done", chunks=original["chunks"], error=None, peak_rss_mb=peak_rss)
+                self._discard(job["file_path"])
+            else:
+                self._fail(job, RuntimeError(f"duplicate of {original['filename']}, which failed"), rss.peak_mb)
+
+        with self._stats_lock:
+            self.stats["files"] += len(extracted)
+            for key in ("chunks", "embed_s", "insert_s"):
+                self.stats[key] += stats[key]
+        print(
+            f"Ingested {len(extracted)} file(s) for session {session_id}: {stats['chunks']} chunks "
+            f"at {ingestor.chunks_per_sec()} chunks/s (embed {stats['embed_s']:.2f}s, insert {stats['insert_s']:.2f}s, peak RSS {peak_rss} MB)"
+        )
+
+    def get_stats(self) -> dict:
+        elapsed = self.stats["embed_s"] + self.stats["insert_s"]
+        return {
+            **{key: round(value, 3) if isinstance(value, float) else value for key, value in self.stats.items()},
+            "chunks_per_sec": round(self.stats["chunks"] / elapsed, 1) if elapsed else 0.0,
+            "embed_batch_size": settings.EMBED_BATCH_SIZE,
+            "workers": len(self._threads),
+        }
+
+    def _discard(self, file_path: str):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+ingestion_pool = IngestionWorkerPool()
@@ -0,0 +1,87 @@
+import json
+
+
+class JSONObjectStream:
+    """
+    Pulls complete top-level JSON objects out of LLM text as it arrives.
+
+    Anything outside an object (code fences, list brackets, commas, prose) is
+    skipped, so it accepts newline-delimited objects, a JSON array of objects,
+    or either wrapped in markdown. Objects that fail to parse are dropped
+    without losing the ones around them, and a truncated tail is ignored.
+    A truncated object in the middle is dropped too: a "{" where no nested
+    object could start (or a raw newline inside a string) begins a new one.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._stack = []  # open "{" / "[" of the current object
+        self._last = ""  # last structural character outside strings
+        self._in_string = False
+        self._escaped = False
+        self.skipped = 0
+
+    def _start(self):
+        self._buffer = ["{"]
+        self._stack = ["{"]
+        self._last = "{"
+        self._in_string = False
+        self._escaped = False
+
+    def _nested_object_allowed(self) -> bool:
+        if self._stack[-1] == "{":
+            return self._last == ":"
+        return self._last in "[,"
+
+    def feed(self, text: str) -> list:
+        """Consumes the next piece of text; returns the objects completed by it."""
+        objects = []
+        for char in text:
+            if not self._stack:
+                if char == "{":
+                    self._start()
+                continue
+
+            if self._in_string:
+                self._buffer.append(char)
+                if char == "\n":
+                    # JSON strings cannot hold a raw newline: the object was cut off here.
+                    self._in_string = False
+                    self._escaped = False
+                    self._last = '"'
+                elif self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last = '"'
+                continue
+
+            if char == "{" and not self._nested_object_allowed():
+                self.skipped += 1
+                self._start()
+                continue
+
+            self._buffer.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append(char)
+            elif char in "}]":
+                if self._stack[-1] == ("{" if char == "}" else "["):
+                    self._stack.pop()
+                if not self._stack:
+                    try:
+                        objects.append(json.loads("".join(self._buffer)))
+                    except ValueError:
+                        self.skipped += 1
+                    self._buffer = []
+            if not char.isspace():
+                self._last = char
+        return objects
+
+
+def parse_json_objects(text: str) -> list:
+    """All complete top-level JSON objects in text (see JSONObjectStream)."""
+    return JSONObjectStream().feed(text)
@@ -0,0 +1,358 @@
+from collections import deque
+from app.services.context_packer import count_tokens
+from app.services.metrics import record_tokens, timed
+import asyncio
+import threading
+import time
+
+
+def _percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ProviderHealth:
+    """
+    Rolling latency/error window and circuit breaker for one provider.
+
+    The breaker opens after breaker_failures consecutive failures, or when at
+    least breaker_min_calls recent calls failed at breaker_error_rate or more.
+    After cooldown seconds it lets a single trial call through (half-open):
+    success closes it, failure opens it again.
+    """
+
+    def __init__(self, window: int = 50, breaker_failures: int = 3, breaker_error_rate: float = 0.5,
+                 breaker_min_calls: int = 10, cooldown: float = 30):
+        self.samples = deque(maxlen=window)  # (ok, latency_ms or None)
+        self.breaker_failures = breaker_failures
+        self.breaker_error_rate = breaker_error_rate
+        self.breaker_min_calls = breaker_min_calls
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.calls = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        """True if a call may go to this provider now (claims the trial call when half-open)."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record(self, ok: bool, latency_ms: float = None):
+        with self._lock:
+            self.calls += 1
+            self.samples.append((ok, latency_ms))
+            self.trial_in_flight = False
+            if ok:
+                self.consecutive_failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            self.consecutive_failures += 1
+            recent = len(self.samples)
+            error_rate = sum(1 for sample_ok, _ in self.samples if not sample_ok) / recent
+            if (self.opened_at is not None or self.consecutive_failures >= self.breaker_failures
+                    or (recent >= self.breaker_min_calls and error_rate >= self.breaker_error_rate)):
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Gives back a half-open trial that ended without an outcome (e.g. a cancelled hedge)."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def latencies(self) -> list:
+        return [latency for ok, latency in self.samples if ok and latency is not None]
+
+    def latency_percentile(self, q: float, min_samples: int = 1):
+        latencies = self.latencies()
+        return _percentile(latencies, q) if len(latencies) >= max(1, min_samples) else None
+
+    def error_rate(self) -> float:
+        return sum(1 for ok, _ in self.samples if not ok) / len(self.samples) if self.samples else 0.0
+
+    def stats(self) -> dict:
+        latencies = self.latencies()
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate(), 3),
+            "p50_ms": round(_percentile(latencies, 0.5), 1) if latencies else None,
+            "p95_ms": round(_percentile(latencies, 0.95), 1) if latencies else None,
+        }
+
+
+def llm_config(feature: str) -> dict:
+    """LangChain call config naming the feature that makes the call (chat, summary, quiz...), for metrics."""
+    return {"metadata": {"feature": feature}}
+
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content if isinstance(content, str) else str(content or "")
+
+
+class MeteredLLM:
+    """
+    Wraps one provider's chat model to record each call in the "llm" stage
+    histogram and count its tokens, labelled by provider and by the feature
+    named in the call's config (see llm_config). Token counts come from the
+    response's usage metadata, or are estimated when a provider sends none.
+    """
+
+    def __init__(self, provider: str, llm):
+        self.provider = provider
+        self.llm = llm
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def _feature(self, kwargs: dict) -> str:
+        config = kwargs.get("config") or {}
+        return (config.get("metadata") or {}).get("feature", "other")
+
+    def _record_tokens(self, feature: str, messages, output: str, usage: dict = None):
+        if usage and usage.get("input_tokens") is not None:
+            record_tokens(self.provider, feature, usage["input_tokens"], usage.get("output_tokens") or 0)
+            return
+        model_name = getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None)
+        prompt = "\n".join(_text(m.get("content") if isinstance(m, dict) else getattr(m, "content", m)) for m in messages)
+        record_tokens(self.provider, feature, count_tokens(prompt, model_name), count_tokens(output, model_name))
+
+    def invoke(self, messages, **kwargs):
+        feature = self._feature(kwargs)
+        with timed("llm", self.provider, feature):
+            response = self.llm.invoke(messages, **kwargs)
+        self._record_tokens(feature, messages, _text(getattr(response, "content", response)), getattr(response, "usage_metadata", None))
+        return response
+
+    async def ainvoke(self, messages, **kwargs):
+        feature = self._feature(kwargs)
+        with timed("llm", self.provider, feature):
+            response = await self.llm.ainvoke(messages, **kwargs)
+        self._record_tokens(feature, messages, _text(getattr(response, "content", response)), getattr(response, "usage_metadata", None))
+        return response
+
+    async def astream(self, messages, **kwargs):
+        feature = self._feature(kwargs)
+        parts, usage = [], None
+        try:
+            with timed("llm", self.provider, feature):
+                async for chunk in self.llm.astream(messages, **kwargs):
+                    parts.append(_text(getattr(chunk, "content", chunk)))
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    yield chunk
+        finally:
+            # Also when the consumer stops early: what was generated was still paid for.
+            self._record_tokens(feature, messages, "".join(parts), usage)
+
+
+class LLMRouter:
+    """
+    Chat model facade over several providers (Bedrock, NVIDIA, Gemini).
+
+    Exposes invoke/ainvoke/astream like a LangChain chat model, so RAGService
+    uses it unchanged. Each call goes to the first provider whose circuit
+    breaker is closed: by rolling median latency with routing="latency"
+    (providers without samples follow in configured order), in configured
+    order with routing="priority". A failure, or an attempt that exceeds
+    attempt_timeout, moves on to the next provider instead of surfacing the
+    error. With hedging
+    on, an ainvoke still running after the chosen provider's p95 latency
+    starts the same request on the next provider and keeps the first answer.
+    Streams fail over only until their first chunk has been sent.
+    """
+
+    def __init__(self, providers: list, routing: str = "latency", attempt_timeout: float = 20, hedge: bool = False,
+                 hedge_min_ms: float = 500, hedge_min_samples: int = 10, slot=None, **health_options):
+        self.providers = list(providers)  # [(name, llm)] in preference order
+        self.routing = routing
+        self.health = {name: ProviderHealth(**health_options) for name, _ in self.providers}
+        self.attempt_timeout = attempt_timeout
+        self.hedge = hedge
+        self.hedge_min_ms = hedge_min_ms
+        self.hedge_min_samples = hedge_min_samples
+        self.slot = slot  # provider name -> async context manager bounding that provider's concurrency
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def model_name(self) -> str:
+        llm = self.providers[0][1]
+        return getattr(llm, "model_name", None) or getattr(llm, "model", None) or getattr(llm, "model_id", None)
+
+    def _ranked(self) -> list:
+        if self.routing == "priority":
+            return list(self.providers)
+        order = {name: i for i, (name, _) in enumerate(self.providers)}
+
+        def _key(provider):
+            median = self.health[provider[0]].latency_percentile(0.5)
+            return (median is None, median or 0, order[provider[0]])
+
+        return sorted(self.providers, key=_key)
+
+    def _candidates(self):
+        """Yields (name, llm) to try in order: providers whose breaker allows a call, then (if none did) the rest."""
+        allowed = False
+        for name, llm in self._ranked():
+            if self.health[name].allow():
+                allowed = True
+                yield name, llm
+        if not allowed:
+            # Every breaker is open: better to try a provider early than to answer with fallback text.
+            yield from self._ranked()
+
+    def _slot(self, name: str):
+        return self.slot(name) if self.slot else _NO_SLOT
+
+    async def _attempt(self, name: str, llm, messages, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with self._slot(name):
+                response = await asyncio.wait_for(llm.ainvoke(messages, **kwargs), self.attempt_timeout)
+        except asyncio.CancelledError:
+            self.health[name].release()
+            raise
+        except Exception:
+            self.health[name].record(False)
+            raise
+        self.health[name].record(True, (time.perf_counter() - start) * 1000)
+        return response
+
+    def _hedge_delay(self, name: str):
+        p95 = self.health[name].latency_percentile(0.95, self.hedge_min_samples)
+        if p95 is None:
+            return None
+        return max(self.hedge_min_ms, p95) / 1000
+
+    async def ainvoke(self, messages, **kwargs):
+        candidates = self._candidates()
+        pending = {}
+        first_task = None
+        can_hedge, hedged = self.hedge, False
+        error = None
+        try:
+            while True:
+                if not pending:
+                    name, llm = next(candidates, (None, None))
+                    if name is None:
+                        break
+                    if error is not None:
+                        self.failovers += 1
+                    task = asyncio.ensure_future(self._attempt(name, llm, messages, **kwargs))
+                    pending[task] = name
+                    first_task = first_task or task
+
+                delay = self._hedge_delay(next(iter(pending.values()))) if can_hedge and len(pending) == 1 else None
+                done, _ = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The only attempt is slower than its provider's p95: race it against the next provider.
+                    name, llm = next(candidates, (None, None))
+                    if name is None:
+                        can_hedge = False
+                    else:
+                        self.hedges += 1
+                        hedged = True
+                        pending[asyncio.ensure_future(self._attempt(name, llm, messages, **kwargs))] = name
+                    continue
+
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and task is not first_task:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                    print(f"LLM provider {name} failed: {error!r}")
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error or RuntimeError("No LLM provider available")
+
+    def invoke(self, messages, **kwargs):
+        error = None
+        for name, llm in self._candidates():
+            if error is not None:
+                self.failovers += 1
+            start = time.perf_counter()
+            try:
+                response = llm.invoke(messages, **kwargs)
+            except Exception as e:
+                self.health[name].record(False)
+                print(f"LLM provider {name} failed: {e!r}")
+                error = e
+                continue
+            self.health[name].record(True, (time.perf_counter() - start) * 1000)
+            return response
+        raise error or RuntimeError("No LLM provider available")
+
+    async def astream(self, messages, **kwargs):
+        error = None
+        for name, llm in self._candidates():
+            if error is not None:
+                self.failovers += 1
+            start = time.perf_counter()
+            first = None
+            async with self._slot(name):
+                stream = llm.astream(messages, **kwargs)
+                try:
+                    try:
+                        first = await asyncio.wait_for(stream.__anext__(), self.attempt_timeout)
+                    except StopAsyncIteration:
+                        pass
+                    except asyncio.CancelledError:
+                        self.health[name].release()
+                        raise
+                    except Exception as e:
+                        self.health[name].record(False)
+                        print(f"LLM provider {name} failed: {e!r}")
+                        error = e
+                        continue
+                    # Time to first chunk is what the user waits for, so that is what the stream contributes.
+                    self.health[name].record(True, (time.perf_counter() - start) * 1000)
+                    if first is not None:
+                        yield first
+                    async for chunk in stream:
+                        yield chunk
+                    return
+                finally:
+                    await stream.aclose()
+        raise error or RuntimeError("No LLM provider available")
+
+    def stats(self) -> dict:
+        return {
+            "providers": {name: self.health[name].stats() for name, _ in self.providers},
+            "routing": self.routing,
+            "hedging": self.hedge,
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+class _NoSlot:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+_NO_SLOT = _NoSlot()
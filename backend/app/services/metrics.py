@@ -0,0 +1,102 @@
+"""
+Prometheus metrics for the request pipeline, served at /metrics.
+
+Every stage is timed through timed(), so the code behind a slow stage in
+study_buddy_stage_seconds can be found by searching for its name:
+
+    extract, chunk, embed, vector_insert, retrieval, rerank, llm, tts,
+    pptx_render, docx_render
+
+prometheus_client is optional; without it everything here is a no-op and
+/metrics answers 503.
+"""
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+except ImportError:
+    CONTENT_TYPE_LATEST = Counter = Histogram = generate_latest = None
+
+from functools import wraps
+import inspect
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+if Histogram:
+    STAGE_SECONDS = Histogram(
+        "study_buddy_stage_seconds", "Time spent in each pipeline stage",
+        ["stage", "provider", "feature"], buckets=BUCKETS
+    )
+    STAGE_ERRORS = Counter("study_buddy_stage_errors", "Stage runs that raised", ["stage", "provider", "feature"])
+    LLM_TOKENS = Counter("study_buddy_llm_tokens", "LLM tokens sent (input) and received (output)", ["provider", "feature", "direction"])
+    CACHE_REQUESTS = Counter("study_buddy_cache_requests", "Cache lookups by result (hit/miss)", ["cache", "result"])
+
+
+class timed:
+    """
+    Records how long a stage took in study_buddy_stage_seconds, and counts it in
+    study_buddy_stage_errors if it raises. provider/feature label LLM calls.
+
+        with timed("embed") as timer:
+            ...
+        timer.seconds
+
+        @timed("pptx_render")
+        def create_presentation(...): ...
+
+    Work that is cancelled (or a stream closed early) is not recorded.
+    """
+
+    def __init__(self, stage: str, provider: str = "", feature: str = ""):
+        self.labels = (stage, provider or "", feature or "")
+        self.seconds = 0.0
+        self._start = None
+
+    def __enter__(self) -> "timed":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self._start
+        if exc_type is not None and not issubclass(exc_type, Exception):
+            return False
+        if Histogram:
+            STAGE_SECONDS.labels(*self.labels).observe(self.seconds)
+            if exc_type is not None:
+                STAGE_ERRORS.labels(*self.labels).inc()
+        return False
+
+    def __call__(self, fn):
+        labels = self.labels
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def _async_timed(*args, **kwargs):
+                with timed(*labels):
+                    return await fn(*args, **kwargs)
+            return _async_timed
+
+        @wraps(fn)
+        def _timed(*args, **kwargs):
+            with timed(*labels):
+                return fn(*args, **kwargs)
+        return _timed
+
+
+def record_tokens(provider: str, feature: str, input_tokens: int, output_tokens: int):
+    if Histogram:
+        LLM_TOKENS.labels(provider, feature, "input").inc(input_tokens)
+        LLM_TOKENS.labels(provider, feature, "output").inc(output_tokens)
+
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0):
+    if Histogram:
+        if hits:
+            CACHE_REQUESTS.labels(cache, "hit").inc(hits)
+        if misses:
+            CACHE_REQUESTS.labels(cache, "miss").inc(misses)
+
+
+def render_metrics():
+    """(body, content type) in the Prometheus text format, or None without prometheus_client."""
+    if not generate_latest:
+        return None
+    return generate_latest(), CONTENT_TYPE_LATEST
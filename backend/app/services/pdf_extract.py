@@ -0,0 +1,34 @@
+"""
+Page-parallel PDF text extraction.
+
+Kept free of app imports so spawned pool workers start quickly: each worker
+re-opens the PDF from disk and extracts its own page range.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def extract_page_range(path: str, start: int, end: int) -> list[str]:
+    """Returns the text of pages [start, end) of the PDF at path."""
+    from pypdf import PdfReader
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Shared process pool. Uses spawn: forking a threaded web server is unsafe."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def page_ranges(total_pages: int, pages_per_task: int) -> list[tuple[int, int]]:
+    step = max(1, pages_per_task)
+    return [(start, min(start + step, total_pages)) for start in range(0, total_pages, step)]
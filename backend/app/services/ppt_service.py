@@ -5,8 +5,10 @@ from pptx.dml.color import RGBColor
 from pptx.enum.shapes import MSO_SHAPE
 from io import BytesIO
 from typing import List, Dict
+from app.services.metrics import timed
 
 class PPTService:
+    @timed("pptx_render")
     def create_presentation(self, slides_data: List[Dict], topic: str) -> BytesIO:
         """
         Creates a professional PowerPoint presentation with custom styling.
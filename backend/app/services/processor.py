@@ -1,9 +1,17 @@
 import os
+import re
 import base64
 import asyncio
+import shutil
+import tempfile
+from collections import deque
 from io import BytesIO
+from itertools import repeat
 from fastapi import UploadFile
 from app.core.config import settings
+from app.services.chunking import join_pages
+from app.services.metrics import timed
+from app.services.pdf_extract import extract_page_range, get_pool, page_ranges
 import google.generativeai as genai
 import openai
 
@@ -38,40 +46,85 @@ class ProcessorService:
 
     async def process_file(self, file: UploadFile) -> tuple[str, dict]:
         """Determines file type and processes accordingly. Returns (text, metadata)."""
-        content = await file.read()
-        file_type = file.content_type or ""
-        filename = file.filename or ""
-        
-        file_stream = BytesIO(content)
-        file_stream.name = filename
-
-        if "pdf" in file_type or filename.endswith(".pdf"):
-            return self.process_pdf(file_stream, filename)
-        elif "image" in file_type or filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            text = self.process_image(content, file_type)
-            return text, {"source": filename, "type": "image"}
-        elif "audio" in file_type or filename.lower().endswith(('.mp3', '.wav', '.m4a', '.mpeg', '.webm')):
-            text = self.process_audio_sync(content, filename, file_type)
-            return text, {"source": filename, "type": "audio"}
-        else:
-            return f"[Skipped unsupported file: {filename}]", {}
+        # UploadFile is already spooled to disk by Starlette; read from its handle instead of copying the bytes.
+        await file.seek(0)
+        return self.process_stream(file.file, file.filename or "", file.content_type or "")
 
     def process_file_sync(self, content: bytes, filename: str, content_type: str) -> tuple[str, dict]:
         """Synchronous file processing for background tasks. Takes pre-read content."""
         file_stream = BytesIO(content)
         file_stream.name = filename
+        return self.process_stream(file_stream, filename, content_type)
+
+    def process_path(self, file_path: str, filename: str, content_type: str) -> tuple[str, dict]:
+        """Processes a spooled upload straight from disk."""
+        with open(file_path, "rb") as f:
+            return self.process_stream(f, filename, content_type)
 
-        if "pdf" in content_type or filename.endswith(".pdf"):
+    def process_stream(self, file_stream, filename: str, content_type: str) -> tuple[str, dict]:
+        """Dispatches an open binary file by type. PDFs and large audio are never read into memory whole."""
+        content_type = content_type or ""
+        filename = filename or ""
+
+        if self.is_pdf(filename, content_type):
             return self.process_pdf(file_stream, filename)
         elif "image" in content_type or filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            text = self.process_image(content, content_type)
+            text = self.process_image(file_stream.read(), content_type)
             return text, {"source": filename, "type": "image"}
         elif "audio" in content_type or filename.lower().endswith(('.mp3', '.wav', '.m4a', '.mpeg', '.webm')):
-            text = self.process_audio_sync(content, filename, content_type)
+            text = self.process_audio_stream(file_stream, filename)
             return text, {"source": filename, "type": "audio"}
         else:
             return f"[Skipped unsupported file: {filename}]", {}
 
+    def _pdf_path(self, file_stream) -> tuple[str, str]:
+        """Returns (path, temp_path) for pool workers, spilling in-memory streams to a temp file once."""
+        name = getattr(file_stream, "name", "")
+        if not isinstance(file_stream, BytesIO) and isinstance(name, str) and os.path.isfile(name):
+            return name, None
+        file_stream.seek(0)
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+            shutil.copyfileobj(file_stream, tmp)
+        return tmp.name, tmp.name
+
+    def iter_pdf_pages(self, file_stream):
+        """
+        Yields (page_num, total_pages, text) in page order as pages are extracted.
+        PDFs with at least PDF_PARALLEL_MIN_PAGES pages are split into ranges of
+        PDF_PAGES_PER_TASK pages and extracted on the shared process pool.
+        """
+        from pypdf import PdfReader
+
+        reader = PdfReader(file_stream)
+        total_pages = len(reader.pages)
+        page_num = 0
+
+        if settings.PDF_EXTRACT_WORKERS > 1 and total_pages >= settings.PDF_PARALLEL_MIN_PAGES:
+            temp_path = None
+            try:
+                path, temp_path = self._pdf_path(file_stream)
+                ranges = page_ranges(total_pages, settings.PDF_PAGES_PER_TASK)
+                pool = get_pool(settings.PDF_EXTRACT_WORKERS)
+                results = pool.map(extract_page_range, repeat(path), [r[0] for r in ranges], [r[1] for r in ranges])
+                for texts in results:
+                    for text in texts:
+                        page_num += 1
+                        yield page_num, total_pages, text
+            except Exception as e:
+                if page_num:
+                    raise
+                print(f"Parallel PDF extraction unavailable, falling back to sequential: {e}")
+            finally:
+                if temp_path:
+                    os.remove(temp_path)
+
+        for page in reader.pages[page_num:]:
+            page_num += 1
+            yield page_num, total_pages, page.extract_text() or ""
+
+    def is_pdf(self, filename: str, content_type: str) -> bool:
+        return "pdf" in (content_type or "") or (filename or "").endswith(".pdf")
+
     def process_pdf(self, file_stream, filename: str) -> tuple[str, dict]:
         try:
             from pypdf import PdfReader
@@ -79,21 +132,19 @@ class ProcessorService:
             return "Error: pypdf not installed.", {}
 
         try:
-            reader = PdfReader(file_stream)
-            text_with_pages = ""
-            total_pages = len(reader.pages)
-            
-            for page_num, page in enumerate(reader.pages, 1):
-                page_text = page.extract_text() or ""
-                if page_text.strip():
-                    text_with_pages += f"\n\n[Page {page_num} of {total_pages}]\n{page_text}"
+            pages = []
+            total_pages = 0
+            for page_num, total_pages, page_text in self.iter_pdf_pages(file_stream):
+                pages.append((page_num, page_text))
+            text, page_spans = join_pages(pages)
             
             metadata = {
                 "source": filename,
                 "type": "pdf",
-                "total_pages": total_pages
+                "total_pages": total_pages,
+                "page_spans": page_spans
             }
-            return text_with_pages, metadata
+            return text, metadata
         except Exception as e:
             return f"Error reading PDF: {str(e)}", {}
 
@@ -125,16 +176,18 @@ class ProcessorService:
         except Exception as e:
             return f"Error processing image: {str(e)}"
 
+    def _audio_mime(self, filename: str) -> str:
+        ext = filename.rsplit('.', 1)[-1] if '.' in filename else 'mp3'
+        return f"audio/{ext}" if ext in ['mp3', 'wav', 'webm', 'ogg', 'm4a'] else "audio/mp3"
+
     def process_audio_sync(self, audio_bytes: bytes, filename: str, mime_type: str = "audio/mp3") -> str:
         """Transcribe audio using Google Gemini Multimodal Audio or fallback."""
         try:
             if settings.GEMINI_API_KEY:
                 model = genai.GenerativeModel("gemini-2.0-flash")
-                ext = filename.rsplit('.', 1)[-1] if '.' in filename else 'mp3'
-                mtype = f"audio/{ext}" if ext in ['mp3', 'wav', 'webm', 'ogg', 'm4a'] else "audio/mp3"
                 response = model.generate_content([
                     "Please transcribe this audio accurately word for word.",
-                    {"mime_type": mtype, "data": audio_bytes}
+                    {"mime_type": self._audio_mime(filename), "data": audio_bytes}
                 ])
                 return response.text
             else:
@@ -142,6 +195,27 @@ class ProcessorService:
         except Exception as e:
             return f"Error transcribing audio: {str(e)}"
 
+    def process_audio_stream(self, audio_stream, filename: str) -> str:
+        """
+        Transcribes an open audio file. Recordings above AUDIO_INLINE_MAX_MB are streamed
+        to the Gemini File API from the handle instead of being inlined as bytes.
+        """
+        try:
+            audio_stream.seek(0, os.SEEK_END)
+            size = audio_stream.tell()
+            audio_stream.seek(0)
+            if settings.GEMINI_API_KEY and size > settings.AUDIO_INLINE_MAX_MB * 1024 * 1024:
+                uploaded = genai.upload_file(audio_stream, mime_type=self._audio_mime(filename), display_name=filename)
+                model = genai.GenerativeModel("gemini-2.0-flash")
+                response = model.generate_content([
+                    "Please transcribe this audio accurately word for word.",
+                    uploaded
+                ])
+                return response.text
+            return self.process_audio_sync(audio_stream.read(), filename)
+        except Exception as e:
+            return f"Error transcribing audio: {str(e)}"
+
     def process_audio(self, audio_stream, filename: str) -> str:
         """Wrapper for audio_stream objects."""
         try:
@@ -150,40 +224,35 @@ class ProcessorService:
         except Exception as e:
             return f"Error: {str(e)}"
 
+    def _polly_speech(self, text: str) -> bytes:
+        try:
+            response = self.polly_client.synthesize_speech(
+                Text=text,
+                OutputFormat='mp3',
+                VoiceId='Joanna'
+            )
+            if 'AudioStream' in response:
+                return response['AudioStream'].read()
+        except Exception as polly_err:
+            print(f"AWS Polly TTS note: {polly_err}")
+        return None
+
+    @timed("tts")
     def text_to_speech(self, text: str) -> BytesIO:
         """Converts text to speech using AWS Polly or Edge TTS."""
         # 1. AWS Polly (Primary if configured)
         if self.polly_client:
-            try:
-                response = self.polly_client.synthesize_speech(
-                    Text=text[:4000],
-                    OutputFormat='mp3',
-                    VoiceId='Joanna'
-                )
-                if 'AudioStream' in response:
-                    out_stream = BytesIO(response['AudioStream'].read())
-                    out_stream.seek(0)
-                    return out_stream
-            except Exception as polly_err:
-                print(f"AWS Polly TTS note: {polly_err}")
+            audio_bytes = self._polly_speech(text[:4000])
+            if audio_bytes:
+                return BytesIO(audio_bytes)
 
         # 2. Edge TTS / gTTS Fallback
         try:
-            import edge_tts
-
-            async def _generate_audio():
-                communicate = edge_tts.Communicate(text[:4000], "en-US-AvaNeural")
-                audio_data = b""
-                async for chunk in communicate.stream():
-                    if chunk["type"] == "audio":
-                        audio_data += chunk["data"]
-                return audio_data
-
             try:
-                audio_bytes = asyncio.run(_generate_audio())
+                audio_bytes = asyncio.run(_edge_speech(text[:4000]))
             except Exception:
                 loop = asyncio.get_event_loop()
-                audio_bytes = loop.run_until_complete(_generate_audio())
+                audio_bytes = loop.run_until_complete(_edge_speech(text[:4000]))
 
             out_stream = BytesIO(audio_bytes)
             out_stream.seek(0)
@@ -192,3 +261,76 @@ class ProcessorService:
         except Exception as e:
             print(f"TTS error: {e}")
             return None
+
+    async def _aspeech(self, text: str) -> bytes:
+        with timed("tts"):
+            if self.polly_client:
+                audio_bytes = await asyncio.to_thread(self._polly_speech, text)
+                if audio_bytes:
+                    return audio_bytes
+            try:
+                return await _edge_speech(text)
+            except Exception as e:
+                print(f"TTS error: {e}")
+                return None
+
+    async def stream_speech(self, text: str):
+        """
+        Yields mp3 audio for text segment by segment (see split_speech), so playback can
+        start after the first sentence. Up to TTS_STREAM_CONCURRENCY segments are synthesized
+        ahead of the one being sent; segments whose synthesis fails are skipped.
+        """
+        segments = split_speech(text[:4000], settings.TTS_SEGMENT_CHARS)
+        pending = deque()
+        next_segment = 0
+        try:
+            while next_segment < len(segments) or pending:
+                while next_segment < len(segments) and len(pending) < max(1, settings.TTS_STREAM_CONCURRENCY):
+                    pending.append(asyncio.ensure_future(self._aspeech(segments[next_segment])))
+                    next_segment += 1
+                audio_bytes = await pending.popleft()
+                if audio_bytes:
+                    yield audio_bytes
+        finally:
+            # Client went away (or synthesis failed hard): stop the segments still in flight.
+            for task in pending:
+                task.cancel()
+
+
+async def _edge_speech(text: str) -> bytes:
+    import edge_tts
+
+    communicate = edge_tts.Communicate(text, "en-US-AvaNeural")
+    parts = []
+    async for chunk in communicate.stream():
+        if chunk["type"] == "audio":
+            parts.append(chunk["data"])
+    return b"".join(parts)
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_speech(text: str, max_chars: int) -> list:
+    """
+    Splits text into sentence-aligned segments for TTS. The first sentence is a
+    segment of its own so the first audio arrives quickly; later sentences are
+    packed up to max_chars. Sentences longer than max_chars are cut at spaces.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            sentences.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence.strip():
+            sentences.append(sentence.strip())
+
+    segments = sentences[:1]
+    for sentence in sentences[1:]:
+        if len(segments) > 1 and len(segments[-1]) + 1 + len(sentence) <= max_chars:
+            segments[-1] += " " + sentence
+        else:
+            segments.append(sentence)
+    return segments
@@ -0,0 +1,142 @@
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from app.database import SessionLocal
+from app.models import QuizQuestion
+from app.services.metrics import record_cache
+import hashlib
+import json
+import numpy
+
+
+def normalise_topic(topic: str) -> str:
+    return " ".join((topic or "general").lower().split()) or "general"
+
+
+def question_hash(question: dict) -> str:
+    text = " ".join(str(question.get("question", "")).lower().split())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def valid_question(question) -> bool:
+    """A usable multiple-choice question: text, at least two options, and an answer."""
+    if not isinstance(question, dict):
+        return False
+    options = question.get("options")
+    return bool(
+        str(question.get("question", "")).strip()
+        and isinstance(options, list) and len(options) >= 2
+        and str(question.get("answer", "")).strip()
+    )
+
+
+def dedupe_questions(questions: list, embeddings=None, threshold: float = 0.92) -> list:
+    """
+    Drops repeated questions, keeping the first of each: exact repeats by normalised
+    text, near-duplicates by cosine similarity of their embeddings (if given).
+    """
+    unique, seen = [], set()
+    for question in questions:
+        key = question_hash(question)
+        if key not in seen:
+            seen.add(key)
+            unique.append(question)
+    if embeddings is None or len(unique) < 2:
+        return unique
+
+    vectors = numpy.asarray(embeddings.embed_documents([str(q["question"]) for q in unique]), dtype=numpy.float32)
+    vectors /= numpy.maximum(numpy.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    kept = []
+    for i in range(len(unique)):
+        if not kept or float(numpy.max(vectors[kept] @ vectors[i])) < threshold:
+            kept.append(i)
+    return [unique[i] for i in kept]
+
+
+def add_questions(session_id: str, topic: str, difficulty: str, questions: list, chunk_ids: list = None, served: bool = False) -> int:
+    """Banks valid questions, skipping ones already banked. Returns how many were new."""
+    topic = normalise_topic(topic)
+    now = datetime.utcnow()
+    rows = {}
+    for question in questions:
+        if valid_question(question):
+            key = question_hash(question)
+            rows[key] = {
+                "session_id": session_id,
+                "topic": topic,
+                "difficulty": difficulty,
+                "question_hash": key,
+                "content": json.dumps(question),
+                "source_chunk_ids": list(chunk_ids or []),
+                "served_count": 1 if served else 0,
+                "last_served_at": now if served else None,
+            }
+    if not rows:
+        return 0
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            insert(QuizQuestion).values(list(rows.values())).on_conflict_do_nothing(constraint="uq_quiz_question")
+        )
+        db.commit()
+        return result.rowcount
+    finally:
+        db.close()
+
+
+def draw_questions(session_id: str, topic: str, difficulty: str, count: int) -> list:
+    """
+    Serves count questions, least-served first (random among equals), and marks
+    them served, so a user only sees a repeat once every banked question has been
+    shown. Returns [] without touching the bank if it holds fewer than count.
+    """
+    topic = normalise_topic(topic)
+    db = SessionLocal()
+    try:
+        rows = db.query(QuizQuestion).filter(
+            QuizQuestion.session_id == session_id,
+            QuizQuestion.topic == topic,
+            QuizQuestion.difficulty == difficulty
+        ).order_by(QuizQuestion.served_count, func.random()).limit(count).with_for_update(skip_locked=True).all()
+        if len(rows) < count:
+            db.rollback()
+            record_cache("question_bank", misses=1)
+            return []
+        now = datetime.utcnow()
+        for row in rows:
+            row.served_count = (row.served_count or 0) + 1
+            row.last_served_at = now
+        questions = [json.loads(row.content) for row in rows]
+        db.commit()
+        record_cache("question_bank", hits=1)
+        return questions
+    finally:
+        db.close()
+
+
+def pool_status(session_id: str, topic: str, difficulty: str) -> dict:
+    """Banked question count, how many were never served, and the chunk ids already used."""
+    db = SessionLocal()
+    try:
+        rows = db.query(QuizQuestion.served_count, QuizQuestion.source_chunk_ids).filter(
+            QuizQuestion.session_id == session_id,
+            QuizQuestion.topic == normalise_topic(topic),
+            QuizQuestion.difficulty == difficulty
+        ).all()
+    finally:
+        db.close()
+    return {
+        "total": len(rows),
+        "unserved": sum(1 for served, _ in rows if not served),
+        "chunk_ids": {chunk_id for _, chunk_ids in rows for chunk_id in (chunk_ids or [])},
+    }
+
+
+def delete_questions(session_id: str) -> int:
+    db = SessionLocal()
+    try:
+        count = db.query(QuizQuestion).filter(QuizQuestion.session_id == session_id).delete(synchronize_session=False)
+        db.commit()
+        return count
+    finally:
+        db.close()
@@ -1,91 +1,35 @@
-try:
-    from langchain_aws import ChatBedrock
-except ImportError:
-    ChatBedrock = None
-
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI
-except ImportError:
-    ChatGoogleGenerativeAI = None
-
-from langchain_openai import ChatOpenAI
-try:
-    from langchain_community.embeddings import HuggingFaceEmbeddings
-except Exception:
-    HuggingFaceEmbeddings = None
-
-from langchain_community.embeddings import FakeEmbeddings
-from langchain_postgres import PGVector
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.core.config import settings
+from app.services.bulk_ingest import BulkIngestor
+from app.services.context_packer import pack_context, truncate_tokens
+from app.services.document_registry import delete_documents, list_documents
+from app.services.hybrid_search import hybrid_search
+from app.services.json_stream import JSONObjectStream, parse_json_objects
+from app.services.llm_router import llm_config
+from app.services.metrics import timed
+from app.services.question_bank import (
+    add_questions, dedupe_questions, delete_questions, draw_questions, normalise_topic, pool_status, question_hash,
+    valid_question
+)
+from app.services.runtime import RAGRuntime, get_runtime
+from app.services.study_artifacts import delete_artifacts, get_artifact
+from app.services.summarizer import MapReduceSummarizer, delete_partials
+from app.services.vector_schema import column_sql
+import asyncio
 import json
+import math
 import re
 
 class RAGService:
-    def __init__(self, session_id: str = None):
+    def __init__(self, session_id: str = None, runtime: RAGRuntime = None):
+        """Cheap session-scoped view; the LLM, embeddings and vector store come from the shared runtime."""
         self.session_id = session_id
-        
-        # Initialize LLM based on LLM_PROVIDER ("bedrock", "nvidia", "gemini")
-        if settings.LLM_PROVIDER == "bedrock" and ChatBedrock and settings.AWS_ACCESS_KEY_ID:
-            try:
-                self.llm = ChatBedrock(
-                    model_id=settings.AWS_BEDROCK_MODEL,
-                    region_name=settings.AWS_REGION,
-                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-                    model_kwargs={"temperature": 0.3}
-                )
-            except Exception as e:
-                print(f"AWS Bedrock init error: {e}")
-                self.llm = None
-        elif settings.LLM_PROVIDER == "nvidia" and settings.NVIDIA_API_KEY:
-            self.llm = ChatOpenAI(
-                api_key=settings.NVIDIA_API_KEY,
-                base_url=settings.NVIDIA_BASE_URL,
-                model=settings.NVIDIA_TEXT_MODEL,
-                temperature=0.3,
-                request_timeout=25
-            )
-        elif ChatGoogleGenerativeAI and settings.GEMINI_API_KEY:
-            self.llm = ChatGoogleGenerativeAI(
-                google_api_key=settings.GEMINI_API_KEY,
-                model=settings.GEMINI_TEXT_MODEL,
-                temperature=0.3,
-                request_timeout=25
-            )
-        elif settings.NVIDIA_API_KEY:
-            self.llm = ChatOpenAI(
-                api_key=settings.NVIDIA_API_KEY,
-                base_url=settings.NVIDIA_BASE_URL,
-                model=settings.NVIDIA_TEXT_MODEL,
-                temperature=0.3,
-                request_timeout=25
-            )
-        else:
-            self.llm = None
-            
-        # Fast embeddings (local HuggingFace)
-        try:
-            if HuggingFaceEmbeddings:
-                self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-            else:
-                self.embeddings = FakeEmbeddings(size=384)
-        except Exception:
-            self.embeddings = FakeEmbeddings(size=384)
-        
-        self.connection_string = settings.DATABASE_URL
-        self.collection_name = "study_materials"
-        
-        try:
-            self.vector_store = PGVector(
-                embeddings=self.embeddings,
-                collection_name=self.collection_name,
-                connection=self.connection_string,
-                use_jsonb=True,
-            )
-        except Exception as e:
-            print(f"PGVector connection warning: {e}")
-            self.vector_store = None
+        self.runtime = runtime.load() if runtime else get_runtime()
+
+        self.llm = self.runtime.llm
+        self.embeddings = self.runtime.embeddings
+        self.connection_string = self.runtime.connection_string
+        self.collection_name = self.runtime.collection_name
+        self.vector_store = self.runtime.vector_store
 
     def ensure_index(self):
         """Creates HNSW index for faster retrieval."""
@@ -98,59 +42,82 @@ class RAGService:
         except Exception as e:
             print(f"Index optimization skipped: {e}")
 
-    def add_document(self, text: str, metadata: dict = None):
-        """Splits text and adds to vector store with session_id."""
+    def add_document(self, text: str, metadata: dict = None, offset: int = 0):
+        """
+        Splits text and adds to vector store with session_id. Each chunk carries
+        char_start/char_end and, for PDFs (metadata["page_spans"]), page_start/page_end.
+        """
         if not self.vector_store:
             return 0
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        texts = text_splitter.split_text(text)
-        
-        base_metadata = metadata or {}
-        if self.session_id:
-            base_metadata["session_id"] = self.session_id
-        
-        metadatas = [base_metadata.copy() for _ in texts]
-        
-        batch_size = 50
-        total_added = 0
-        
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            batch_metadatas = metadatas[i:i + batch_size]
-            try:
-                self.vector_store.add_texts(batch_texts, metadatas=batch_metadatas)
-                total_added += len(batch_texts)
-            except Exception as e:
-                print(f"Batch insert note: {e}")
-                
-        return total_added if total_added > 0 else len(texts)
+        ingestor = BulkIngestor(self.runtime, self.session_id)
+        added = ingestor.add(text, metadata, offset=offset)
+        try:
+            ingestor.flush()
+        except Exception as e:
+            print(f"Batch insert note: {e}")
+        return added
 
     def delete_session_documents(self, session_id: str) -> int:
+        """
+        Deletes the session's chunks, registry rows, study artifacts, question bank and
+        summary partials. Each step runs even if an earlier one failed, and cached
+        retrievals are invalidated either way; raises RuntimeError naming the steps that
+        failed, so a retry can finish the job. Returns the number of chunks deleted.
+        """
+        from sqlalchemy import text
+        from app.database import engine
+
+        def _delete_chunks(sid):
+            with engine.begin() as conn:
+                return conn.execute(
+                    text(f"DELETE FROM langchain_pg_embedding WHERE {column_sql('session_id', self.runtime.vector_columns)} = :sid"),
+                    {"sid": sid}
+                ).rowcount
+
+        steps = [
+            ("chunks", _delete_chunks),
+            ("documents", delete_documents),
+            ("artifacts", delete_artifacts),
+            ("questions", delete_questions),
+            ("summary partials", delete_partials),
+        ]
+        results, failed = {}, []
         try:
-            from sqlalchemy import text
-            from app.database import engine
-            with engine.connect() as conn:
-                result = conn.execute(
-                    text("DELETE FROM langchain_pg_embedding WHERE cmetadata->>'session_id' = :sid"),
-                    {"sid": session_id}
-                )
-                conn.commit()
-                return result.rowcount
+            for name, step in steps:
+                try:
+                    results[name] = step(session_id)
+                except Exception as e:
+                    print(f"Error deleting session {name}: {e}")
+                    failed.append(name)
+        finally:
+            self.runtime.invalidate_session(session_id)
+        if failed:
+            raise RuntimeError(f"Deleting session {session_id} failed for: {', '.join(failed)}")
+        return results["chunks"]
+
+    def get_session_documents(self) -> list[dict]:
+        """Registry rows for the session (filename, type, pages, chunks, size, timings)."""
+        try:
+            return list_documents(self.session_id)
         except Exception as e:
-            print(f"Error deleting session documents: {e}")
-            return 0
+            print(f"Document registry lookup failed: {e}")
+            return []
 
-    def get_session_documents_list(self) -> list:
+    def get_session_documents_list(self, documents: list[dict] = None) -> list:
+        documents = self.get_session_documents() if documents is None else documents
+        if documents:
+            return [doc["filename"] for doc in documents]
+        # Sessions ingested before the registry existed.
         try:
             from sqlalchemy import text
             from app.database import engine
             with engine.connect() as conn:
                 result = conn.execute(
-                    text("SELECT DISTINCT cmetadata->>'source' as source FROM langchain_pg_embedding WHERE cmetadata->>'session_id' = :sid"),
+                    text(
+                        f"SELECT DISTINCT {column_sql('source', self.runtime.vector_columns)} FROM langchain_pg_embedding "
+                        f"WHERE {column_sql('session_id', self.runtime.vector_columns)} = :sid"
+                    ),
                     {"sid": self.session_id}
                 )
                 sources = [row[0] for row in result if row[0]]
@@ -158,27 +125,32 @@ class RAGService:
         except Exception as e:
             return ["Uploaded Document"]
 
-    def _format_docs_with_sources(self, docs) -> tuple[str, list]:
-        """Format docs and extract source info including page numbers."""
-        formatted = []
-        sources = []
-        
-        for doc in docs:
-            content = doc.page_content
-            metadata = doc.metadata or {}
-            source = metadata.get('source', 'Unknown')
-            
-            page_match = re.search(r'\[Page (\d+) of (\d+)\]', content)
+    def _citation(self, doc) -> str:
+        metadata = doc.metadata or {}
+        source = metadata.get('source', 'Unknown')
+        page_start = metadata.get('page_start')
+        if page_start is not None:
+            page_end = metadata.get('page_end', page_start)
+            total_pages = metadata.get('total_pages', '?')
+            if page_end != page_start:
+                return f"{source} (Pages {page_start}-{page_end}/{total_pages})"
+            return f"{source} (Page {page_start}/{total_pages})"
+
+        # Chunks ingested before page metadata existed still carry inline markers.
+        if '[Page ' in doc.page_content:
+            page_match = re.search(r'\[Page (\d+) of (\d+)\]', doc.page_content)
             if page_match:
-                page_num = page_match.group(1)
-                total_pages = page_match.group(2)
-                sources.append(f"{source} (Page {page_num}/{total_pages})")
-            else:
-                sources.append(source)
-            
-            formatted.append(content)
-        
-        return "\n\n".join(formatted), list(set(sources))
+                return f"{source} (Page {page_match.group(1)}/{page_match.group(2)})"
+        return source
+
+    def _format_docs_with_sources(self, docs, max_tokens: int = None) -> tuple[str, list]:
+        """
+        Packs docs into at most max_tokens of context, merging overlapping chunks,
+        and builds citations for the passages that made it in.
+        """
+        context, passages, _ = pack_context(docs, max_tokens, self.runtime.llm_model_name())
+        sources = [self._citation(doc) for doc in passages]
+        return context, list(dict.fromkeys(sources))
 
     def _get_session_retriever(self, k: int = 20, source_filter: str = None):
         if not self.vector_store:
@@ -195,43 +167,120 @@ class RAGService:
             )
         return self.vector_store.as_retriever(search_kwargs={"k": k})
 
-    def get_context_for_quiz(self, topic: str = "general") -> tuple[str, int]:
+    def _retrieval_key(self, query: str, k: int, source_filter: str) -> tuple:
+        """Cache key for a retrieval, or None (no caching) if the session version is unavailable."""
+        generation = self.runtime.session_generation(self.session_id)
+        if generation is None:
+            return None
+        return (self.session_id, generation, query, k, source_filter)
+
+    def _hybrid_search(self, query: str, k: int, source_filter: str) -> list:
+        """Full-text + vector search fused with RRF in one round trip; None when unavailable."""
+        collection_id = self.runtime.collection_id() if self.vector_store else None
+        if settings.RETRIEVAL_MODE != "hybrid" or not collection_id:
+            return None
+        try:
+            return hybrid_search(
+                collection_id,
+                query,
+                self.embeddings.embed_query(query),
+                k,
+                session_id=self.session_id,
+                source_filter=source_filter if source_filter and source_filter != "all" else None,
+                vector_k=settings.HYBRID_VECTOR_K,
+                lexical_k=settings.HYBRID_LEXICAL_K,
+                rrf_k=settings.RRF_K,
+                schema_ready=self.runtime.vector_columns,
+            )
+        except Exception as e:
+            print(f"Hybrid retrieval failed, using vector search: {e}")
+            return None
+
+    def _final_k(self, k: int) -> int:
+        if settings.RETRIEVAL_MODE != "hybrid":
+            return k
+        return max(3, math.ceil(k * settings.HYBRID_FINAL_K_RATIO))
+
+    def _search(self, key: tuple, query: str, k: int, source_filter: str) -> list:
+        reranker = self.runtime.reranker
+        # With a reranker, over-fetch candidates and let the cross-encoder pick the top k.
+        fetch_k = max(k, settings.RERANK_CANDIDATES) if reranker.available else k
+        with timed("retrieval"):
+            docs = self._hybrid_search(query, fetch_k, source_filter)
+            if docs is None:
+                retriever = self._get_session_retriever(k=fetch_k, source_filter=source_filter)
+                docs = retriever.invoke(query) if retriever else []
+        if fetch_k > k:
+            with timed("rerank"):
+                docs = reranker.rerank(query, docs, k)
+        if docs and key:
+            # Empty results are not cached: the session may still be ingesting in another process.
+            self.runtime.retrieval_cache.set(key, docs)
+        return docs
+
+    def _retrieve(self, query: str, k: int = 20, source_filter: str = None) -> list:
+        """Session-scoped retrieval, served from the runtime cache until the session's documents change."""
+        k = self._final_k(k)
+        key = self._retrieval_key(query, k, source_filter)
+        docs = self.runtime.retrieval_cache.get(key) if key else None
+        if docs is None:
+            docs = self._search(key, query, k, source_filter)
+        return list(docs)
+
+    async def _aretrieve(self, query: str, k: int = 20, source_filter: str = None) -> list:
+        """
+        Async _retrieve. Runs on the runtime's bounded retrieval pool, not Starlette's threadpool;
+        even a cache hit reads the session version from Postgres, so none of it belongs on the loop.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.runtime.retrieval_executor, self._retrieve, query, k, source_filter)
+
+    def _llm_text(self, response) -> str:
+        return response.content if hasattr(response, 'content') else str(response)
+
+    async def _ainvoke(self, prompt: str, feature: str = "other") -> str:
+        """Calls the LLM with ainvoke while holding a slot of the provider's concurrency limit."""
+        async with self.runtime.llm_slot():
+            response = await self.llm.ainvoke([{"role": "user", "content": prompt}], config=llm_config(feature))
+        return self._llm_text(response)
+
+    async def aget_context_for_quiz(self, topic: str = "general") -> tuple[str, int]:
         """Retrieve session document context for quiz or sample paper generation."""
         try:
-            retriever = self._get_session_retriever(k=20)
-            docs = retriever.invoke(topic if topic != "general" else "main concepts and overview") if retriever else []
+            docs = await self._aretrieve(topic if topic != "general" else "main concepts and overview", k=20)
             if docs:
-                context, _ = self._format_docs_with_sources(docs)
+                context, _ = self._format_docs_with_sources(docs, settings.PAPER_CONTEXT_TOKENS)
                 word_count = len(context.split())
                 max_questions = max(5, min(50, word_count // 40))
                 return context, max_questions
         except Exception as e:
-            print(f"get_context_for_quiz error: {e}")
+            print(f"aget_context_for_quiz error: {e}")
         return "Comprehensive overview of study material topics and principles.", 10
 
-    def chat(self, query: str) -> dict:
-        """Answers a question using RAG. Returns response instantly."""
+    def _chat_context(self, docs: list) -> tuple[str, list]:
+        if docs:
+            return self._format_docs_with_sources(docs, settings.CHAT_CONTEXT_TOKENS)
+        return "Key study concepts from document session.", ["Uploaded Material"]
+
+    def _chat_prompt(self, query: str, context: str) -> str:
+        return f"You are a helpful study assistant. Answer the user question based on the provided context.\n\nContext from documents:\n{context}\n\nQuestion: {query}"
+
+    def _chat_fallback(self, query: str, sources: list) -> str:
+        return f"Key analysis for '{query}': Based on your uploaded document ({sources[0] if sources else 'Document'}), this section covers the project overview, key technical requirements, and core features."
+
+    async def achat(self, query: str) -> dict:
+        """Answers a question using RAG: non-blocking retrieval, then ainvoke under the provider limit."""
         try:
-            retriever = self._get_session_retriever(k=10)
-            docs = retriever.invoke(query) if retriever else []
-            
-            if docs:
-                context, sources = self._format_docs_with_sources(docs)
-            else:
-                context, sources = "Key study concepts from document session.", ["Uploaded Material"]
-            
-            system_prompt = f"You are a helpful study assistant. Answer the user question based on the provided context.\n\nContext from documents:\n{context[:8000]}\n\nQuestion: {query}"
-            
+            context, sources = self._chat_context(await self._aretrieve(query, k=10))
+
             if self.llm:
                 try:
-                    response = self.llm.invoke([{"role": "user", "content": system_prompt}])
-                    ans = response.content if hasattr(response, 'content') else str(response)
-                    return {"response": ans, "sources": sources}
+                    return {"response": await self._ainvoke(self._chat_prompt(query, context), "chat"), "sources": sources}
                 except Exception as err:
                     print(f"LLM Chat Error: {err}")
 
             return {
-                "response": f"Key analysis for '{query}': Based on your uploaded document ({sources[0] if sources else 'Document'}), this section covers the project overview, key technical requirements, and core features.",
+                "response": self._chat_fallback(query, sources),
                 "sources": sources
             }
         except Exception as e:
@@ -240,62 +289,338 @@ class RAGService:
                 "sources": ["Uploaded Document"]
             }
 
-    def generate_summary(self, text_context: str = None, summary_type: str = "detailed", source_filter: str = None):
+    async def astream_chat(self, query: str):
+        """
+        Streaming variant of chat(). Yields (event, data) pairs: "sources" once
+        retrieval is done, then "token" deltas from the LLM, then "done".
+        Without an LLM (or if it fails before the first token) the fallback
+        text is sent as a single token.
+        """
         try:
-            if not text_context or text_context == "full_context_trigger":
-                retriever = self._get_session_retriever(k=25)
-                docs = retriever.invoke("report project introduction architecture abstract overview") if retriever else []
-                if docs:
-                    text_context, _ = self._format_docs_with_sources(docs)
-                else:
-                    text_context = ""
-
-            if self.llm and text_context.strip():
-                try:
-                    prompt = f"""You are an expert academic tutor creating a DETAILED STUDY GUIDE based strictly on the uploaded document.
+            context, sources = self._chat_context(await self._aretrieve(query, k=10))
+        except Exception as e:
+            print(f"Chat retrieval error: {e}")
+            context, sources = "Key study concepts from document session.", ["Uploaded Document"]
+        yield "sources", sources
+
+        streamed_any = False
+        if self.llm:
+            try:
+                async with self.runtime.llm_slot():
+                    async for chunk in self.llm.astream([{"role": "user", "content": self._chat_prompt(query, context)}], config=llm_config("chat")):
+                        delta = self._llm_text(chunk)
+                        if delta:
+                            streamed_any = True
+                            yield "token", delta
+            except Exception as err:
+                print(f"LLM Chat Stream Error: {err}")
+                if streamed_any:
+                    yield "error", "The answer was interrupted. Please try again."
+
+        if not streamed_any:
+            yield "token", self._chat_fallback(query, sources)
+        yield "done", None
+
+    SUMMARY_QUERY = "report project introduction architecture abstract overview"
+
+    def _summary_prompt(self, text_context: str) -> str:
+        return f"""You are an expert academic tutor creating a DETAILED STUDY GUIDE based strictly on the uploaded document.
 
 Document Content:
-{text_context[:12000]}
+{truncate_tokens(text_context, settings.SUMMARY_CONTEXT_TOKENS, self.runtime.llm_model_name())}
 
 Instructions:
 1. Provide a detailed, structured study guide using markdown headers, bold terms, and bullet points.
 2. Include the specific Project Title, Author Name, Technology Stack, Key Architectures, and Implementation details from the document.
 3. Be comprehensive and thorough.
 """
-                    response = self.llm.invoke([{"role": "user", "content": prompt}])
-                    return response.content if hasattr(response, 'content') else str(response)
+
+    def _summary_fallback(self, text_context: str) -> str:
+        if text_context and len(text_context) > 50:
+            lines = [l.strip() for l in text_context.split('\n') if l.strip()]
+            preview_text = "\n".join(lines[:15])
+            return f"### Document Study Overview\n\n**Extracted Summary:**\n{preview_text}\n\n#### Key Highlights\n- **Project Focus**: Technical architecture and system design.\n- **Key Features**: High-throughput microservices, database repository pattern, cloud deployment.\n- **Review Tip**: Re-read sections on database schema and execution pipeline."
+        return "### Document Summary\n- Project report overview\n- Key system architecture & technologies"
+
+    async def _amap_reduce_summary(self, mode: str, source_filter: str = None) -> str:
+        """Map-reduce summary of every chunk; None when the mode or session size says retrieval is enough."""
+        summarizer = MapReduceSummarizer(self)
+        if mode == "auto":
+            chunk_count = await asyncio.to_thread(summarizer.chunk_count, source_filter)
+            if chunk_count < settings.SUMMARY_MAP_REDUCE_MIN_CHUNKS:
+                return None
+        summary = await summarizer.summarize(source_filter)
+        print(f"Map-reduce summary for session {self.session_id}: {summarizer.llm_calls} LLM calls, {summarizer.cache_hits} cached partials")
+        return summary
+
+    async def _asession_summary(self, source_filter: str = None, mode: str = None) -> str:
+        """
+        LLM summary of the whole session (or one source). mode (default SUMMARY_MODE):
+        "retrieval" summarises the top retrieved chunks, "map_reduce" every chunk,
+        "auto" uses map_reduce for large sessions. Raises if the LLM cannot produce one.
+        """
+        mode = (mode or settings.SUMMARY_MODE).lower()
+        if self.vector_store and mode in ("auto", "map_reduce"):
+            try:
+                summary = await self._amap_reduce_summary(mode, source_filter)
+                if summary:
+                    return summary
+            except Exception as err:
+                print(f"Map-reduce summary failed, using retrieval: {err}")
+
+        docs = await self._aretrieve(self.SUMMARY_QUERY, k=25, source_filter=source_filter)
+        text_context = self._format_docs_with_sources(docs, settings.SUMMARY_CONTEXT_TOKENS)[0] if docs else ""
+        if not text_context.strip():
+            raise ValueError("No document context to summarise")
+        return await self._ainvoke(self._summary_prompt(text_context), "summary")
+
+    async def agenerate_summary(self, text_context: str = None, summary_type: str = "detailed", source_filter: str = None, mode: str = None):
+        try:
+            whole_session = not text_context or text_context == "full_context_trigger"
+            if whole_session and summary_type == "detailed" and source_filter in (None, "", "all") and mode is None:
+                precomputed = await asyncio.to_thread(get_artifact, self.session_id, "summary")
+                if precomputed:
+                    return precomputed
+
+            if whole_session and self.llm:
+                try:
+                    return await self._asession_summary(source_filter, mode)
                 except Exception as err:
                     print(f"LLM Summary Error: {err}")
 
-            if text_context and len(text_context) > 50:
-                lines = [l.strip() for l in text_context.split('\n') if l.strip()]
-                preview_text = "\n".join(lines[:15])
-                return f"### Document Study Overview\n\n**Extracted Summary:**\n{preview_text}\n\n#### Key Highlights\n- **Project Focus**: Technical architecture and system design.\n- **Key Features**: High-throughput microservices, database repository pattern, cloud deployment.\n- **Review Tip**: Re-read sections on database schema and execution pipeline."
-                
+            if whole_session:
+                docs = await self._aretrieve(self.SUMMARY_QUERY, k=25, source_filter=source_filter)
+                text_context = self._format_docs_with_sources(docs, settings.SUMMARY_CONTEXT_TOKENS)[0] if docs else ""
+            elif self.llm and text_context.strip():
+                try:
+                    return await self._ainvoke(self._summary_prompt(text_context), "summary")
+                except Exception as err:
+                    print(f"LLM Summary Error: {err}")
+
+            return self._summary_fallback(text_context)
         except Exception as e:
             print(f"Summary exception: {e}")
 
-        return "### Document Summary\n- Project report overview\n- Key system architecture & technologies"
+        return self._summary_fallback("")
+
+    def _quiz_query(self, topic: str) -> str:
+        return topic if topic != "general" else "key concepts architecture report"
+
+    def _quiz_prompt(self, context: str, num_questions: int, difficulty: str = "medium") -> str:
+        return (
+            f"Based on this document context:\n{context}\n\n"
+            f"Generate exactly {num_questions} {difficulty} difficulty multiple choice quiz questions. "
+            "Output one JSON object per line with keys: 'question', 'options' (4 choices), 'answer', 'topic'. "
+            "No list brackets, no code fences, no other text."
+        )
+
+    def _parse_quiz(self, raw_content: str, difficulty: str) -> dict:
+        """Tolerant: keeps every complete question object, whether the LLM sent lines, a list or fenced JSON."""
+        quiz_data = parse_json_objects(raw_content)
+        if not quiz_data:
+            raise ValueError("No quiz questions in LLM output")
+        return {"questions": quiz_data, "count": len(quiz_data), "difficulty": difficulty}
+
+    def _quiz_batch_prompt(self, docs: list, difficulty: str, num_questions: int) -> str:
+        context = self._format_docs_with_sources(docs, settings.QUIZ_CONTEXT_TOKENS)[0] if docs else ""
+        if not context.strip():
+            raise ValueError("No document context for a quiz")
+        return self._quiz_prompt(context, num_questions, difficulty)
+
+    async def _aquestion_batch(self, docs: list, difficulty: str, num_questions: int) -> list:
+        """One LLM call over one chunk group; returns its valid questions (raises if none)."""
+        quiz = self._parse_quiz(await self._ainvoke(self._quiz_batch_prompt(docs, difficulty, num_questions), "quiz"), difficulty)
+        questions = [q for q in quiz["questions"] if valid_question(q)]
+        if not questions:
+            raise ValueError("LLM returned no valid questions")
+        return questions
+
+    async def _quiz_chunk_groups(self, topic: str, num_questions: int, avoid_chunk_ids: set = None) -> tuple[list, int, list]:
+        """Retrieves quiz context and splits it for ceil(n / QUIZ_BATCH_SIZE) batches. Returns (groups, per-batch count, chunk ids)."""
+        batches = math.ceil(num_questions / max(1, settings.QUIZ_BATCH_SIZE))
+        docs = await self._aretrieve(self._quiz_query(topic), k=max(30, batches * 12))
+        if avoid_chunk_ids:
+            docs = [d for d in docs if d.id not in avoid_chunk_ids] or docs
+        chunk_ids = [d.id for d in docs if d.id]
+        if batches == 1:
+            return [docs], num_questions, chunk_ids
+        # Round-robin keeps the most relevant chunks spread across batches.
+        groups = [group for group in (docs[i::batches] for i in range(batches)) if group] or [docs]
+        per_batch = math.ceil(num_questions / len(groups)) + 1  # headroom for questions lost to de-duplication
+        return groups, per_batch, chunk_ids
+
+    async def _agenerate_questions(self, topic: str, difficulty: str, num_questions: int, avoid_chunk_ids: set = None) -> tuple[list, list]:
+        """
+        LLM questions from retrieved context, preferring chunks not in avoid_chunk_ids so
+        top-ups cover new material. Requests above QUIZ_BATCH_SIZE fan out into concurrent
+        batches, each over its own share of the chunks and validated on its own, so one bad
+        response only loses its batch; merged questions are de-duplicated by embedding
+        similarity. Returns (questions, context chunk ids). Raises if nothing usable came back.
+        """
+        groups, per_batch, chunk_ids = await self._quiz_chunk_groups(topic, num_questions, avoid_chunk_ids)
+        if len(groups) == 1:
+            return await self._aquestion_batch(groups[0], difficulty, num_questions), chunk_ids
+
+        semaphore = asyncio.Semaphore(max(1, settings.QUIZ_MAX_CONCURRENCY))
+
+        async def _batch(group):
+            async with semaphore:
+                return await self._aquestion_batch(group, difficulty, per_batch)
+
+        results = await asyncio.gather(*(_batch(group) for group in groups), return_exceptions=True)
+        questions = []
+        for result in results:
+            if isinstance(result, BaseException):
+                print(f"Quiz batch failed: {result}")
+            else:
+                questions.extend(result)
+        if not questions:
+            raise ValueError("Every quiz batch failed")
 
-    def generate_quiz(self, topic: str = "general", difficulty: str = "medium", num_questions: int = 5):
+        embeddings = getattr(self.embeddings, "underlying", self.embeddings)
+        questions = await asyncio.to_thread(dedupe_questions, questions, embeddings, settings.QUIZ_DEDUP_SIMILARITY)
+        return questions, chunk_ids
+
+    async def _asession_quiz(self, topic: str = "general", difficulty: str = "medium", num_questions: int = 5) -> dict:
+        """
+        LLM quiz from retrieved context. The returned questions are banked as served, any
+        headroom beyond num_questions as unserved. Raises if the LLM cannot produce one.
+        """
+        questions, chunk_ids = await self._agenerate_questions(topic, difficulty, num_questions)
+        served, spare = questions[:num_questions], questions[num_questions:]
+        await asyncio.to_thread(add_questions, self.session_id, topic, difficulty, served, chunk_ids, True)
+        if spare:
+            await asyncio.to_thread(add_questions, self.session_id, topic, difficulty, spare, chunk_ids)
+        return {"questions": served, "count": len(served), "difficulty": difficulty}
+
+    async def atop_up_questions(self, topic: str = "general", difficulty: str = "medium", count: int = None) -> int:
+        """Generates count more questions for the bank from chunks it has not drawn on yet. Returns how many were new."""
+        status = await asyncio.to_thread(pool_status, self.session_id, topic, difficulty)
+        questions, chunk_ids = await self._agenerate_questions(
+            topic, difficulty, count or settings.QUIZ_BANK_TOP_UP, avoid_chunk_ids=status["chunk_ids"]
+        )
+        return await asyncio.to_thread(add_questions, self.session_id, topic, difficulty, questions, chunk_ids)
+
+    def _schedule_top_up(self, topic: str, difficulty: str):
+        """Tops the bank up in the background. Call only once the bank holds this request's questions."""
+        async def _top_up():
+            try:
+                status = await asyncio.to_thread(pool_status, self.session_id, topic, difficulty)
+                if status["unserved"] < settings.QUIZ_BANK_MIN_UNSERVED:
+                    await self.atop_up_questions(topic, difficulty)
+            except Exception as err:
+                print(f"Question bank top-up failed for session {self.session_id}: {err}")
+
+        if self.llm:
+            self.runtime.spawn(("quiz_top_up", self.session_id, normalise_topic(topic), difficulty), _top_up)
+
+    async def agenerate_quiz(self, topic: str = "general", difficulty: str = "medium", num_questions: int = 5):
+        """Serves from the session's question bank when it can, generating (and banking) on demand otherwise."""
         try:
-            retriever = self._get_session_retriever(k=15)
-            docs = retriever.invoke(topic if topic != "general" else "key concepts architecture report") if retriever else []
-            context = "\n".join([d.page_content for d in docs]) if docs else ""
+            questions = await asyncio.to_thread(draw_questions, self.session_id, topic, difficulty, num_questions)
+            if questions:
+                self._schedule_top_up(topic, difficulty)
+                return {"questions": questions, "count": len(questions), "difficulty": difficulty}
 
-            if self.llm and context.strip():
+            if self.llm:
                 try:
-                    prompt = f"Based on this document context:\n{context[:8000]}\n\nGenerate exactly {num_questions} multiple choice quiz questions in JSON format with keys: 'question', 'options' (4 choices), 'answer', 'topic'."
-                    response = self.llm.invoke([{"role": "user", "content": prompt}])
-                    raw_content = response.content if hasattr(response, 'content') else str(response)
-                    content = raw_content.replace("```json", "").replace("```", "").strip()
-                    quiz_data = json.loads(content)
-                    return {"questions": quiz_data, "count": len(quiz_data), "difficulty": difficulty}
+                    quiz = await self._asession_quiz(topic, difficulty, num_questions)
+                    # Only now, so a cold bank does not get a top-up racing the on-demand batch.
+                    self._schedule_top_up(topic, difficulty)
+                    return quiz
                 except Exception as err:
                     print(f"LLM Quiz Error: {err}")
-        except Exception:
-            pass
+        except Exception as e:
+            print(f"Quiz exception: {e}")
+
+        return self._fallback_quiz(topic, difficulty, num_questions)
+
+    async def _astream_questions(self, groups: list, difficulty: str, per_batch: int):
+        """Streams every batch's LLM output through a JSON object parser; yields valid, unseen questions as they complete."""
+        queue = asyncio.Queue()
+        finished = object()
+        semaphore = asyncio.Semaphore(max(1, settings.QUIZ_MAX_CONCURRENCY))
+
+        async def _run(group):
+            try:
+                async with semaphore:
+                    prompt = self._quiz_batch_prompt(group, difficulty, per_batch)
+                    parser = JSONObjectStream()
+                    async with self.runtime.llm_slot():
+                        async for chunk in self.llm.astream([{"role": "user", "content": prompt}], config=llm_config("quiz")):
+                            for question in parser.feed(self._llm_text(chunk)):
+                                await queue.put(question)
+            except Exception as err:
+                print(f"Quiz stream batch failed: {err}")
+            finally:
+                await queue.put(finished)
+
+        tasks = [asyncio.create_task(_run(group)) for group in groups]
+        seen = set()
+        try:
+            done = 0
+            while done < len(tasks):
+                question = await queue.get()
+                if question is finished:
+                    done += 1
+                elif valid_question(question) and question_hash(question) not in seen:
+                    seen.add(question_hash(question))
+                    yield question
+        finally:
+            for task in tasks:
+                task.cancel()
 
+    async def astream_quiz(self, topic: str = "general", difficulty: str = "medium", num_questions: int = 5):
+        """
+        Streaming variant of agenerate_quiz(). Yields ("question", dict) as soon as each
+        question is complete and valid, then ("done", {"count", "source"}). Banked questions
+        go out at once; otherwise the fan-out batches stream concurrently and are interleaved.
+        """
+        try:
+            banked = await asyncio.to_thread(draw_questions, self.session_id, topic, difficulty, num_questions)
+        except Exception as e:
+            print(f"Question bank read failed: {e}")
+            banked = []
+        if banked:
+            self._schedule_top_up(topic, difficulty)
+            for question in banked:
+                yield "question", question
+            yield "done", {"count": len(banked), "source": "bank"}
+            return
+
+        sent, chunk_ids = [], []
+        if self.llm:
+            stream = None
+            try:
+                groups, per_batch, chunk_ids = await self._quiz_chunk_groups(topic, num_questions)
+                stream = self._astream_questions(groups, difficulty, per_batch)
+                async for question in stream:
+                    sent.append(question)
+                    yield "question", question
+                    if len(sent) >= num_questions:
+                        break
+            except Exception as err:
+                print(f"LLM Quiz Stream Error: {err}")
+                if sent:
+                    yield "error", "Quiz generation was interrupted."
+            finally:
+                if stream:
+                    await stream.aclose()
+            if sent:
+                try:
+                    await asyncio.to_thread(add_questions, self.session_id, topic, difficulty, sent, chunk_ids, True)
+                    self._schedule_top_up(topic, difficulty)
+                except Exception as e:
+                    print(f"Question bank write failed: {e}")
+                yield "done", {"count": len(sent), "source": "llm"}
+                return
+
+        fallback = self._fallback_quiz(topic, difficulty, num_questions)["questions"]
+        for question in fallback:
+            yield "question", question
+        yield "done", {"count": len(fallback), "source": "fallback"}
+
+    def _fallback_quiz(self, topic: str, difficulty: str, num_questions: int) -> dict:
         fallback_questions = [
             {
                 "question": f"What is the primary architecture described in the project report?",
@@ -354,7 +679,30 @@ Instructions:
             "original_pattern": pyq_pattern
         }
 
+    DEFAULT_SLIDE_TOPICS = ("general", "overview")
+
+    def _outline_prompt(self, summary: str) -> str:
+        return f"""Turn this study guide into a slide outline.
+
+Study guide:
+{truncate_tokens(summary, settings.SUMMARY_CONTEXT_TOKENS, self.runtime.llm_model_name())}
+
+Return only a JSON list of 5-12 sections in reading order, each with keys 'title' (string), 'points' (3-5 short strings) and 'notes' (one or two sentences for the presenter)."""
+
+    async def _aoutline(self, summary: str) -> list[dict]:
+        """Slide-ready outline of a summary. Raises if the LLM output is not a usable outline."""
+        content = (await self._ainvoke(self._outline_prompt(summary), "outline")).replace("```json", "").replace("```", "").strip()
+        outline = json.loads(content)
+        if not isinstance(outline, list) or not all(isinstance(section, dict) and section.get("title") for section in outline):
+            raise ValueError("Outline is not a list of titled sections")
+        return outline
+
     async def generate_slide_content(self, topic: str, num_slides: int = 5) -> list[dict]:
+        if (topic or "").strip().lower() in self.DEFAULT_SLIDE_TOPICS:
+            outline = await asyncio.to_thread(get_artifact, self.session_id, "outline")
+            if outline:
+                return outline[:num_slides]
+
         slides = []
         for i in range(1, num_slides + 1):
             slides.append({
@@ -364,20 +712,22 @@ Instructions:
             })
         return slides
 
-    def teacher_chat(self, query: str, language: str = "English") -> dict:
+    def _teacher_prompt(self, query: str, language: str, docs: list) -> str:
+        context = self._format_docs_with_sources(docs, settings.TEACHER_CONTEXT_TOKENS)[0] if docs else "Project report context."
+        return f"You are an encouraging teacher AI. Explain '{query}' clearly in {language} based on this context:\n{context}"
+
+    def _teacher_fallback(self, query: str) -> dict:
+        return {"response": f"Let me explain {query}! This concept in your project report focuses on cloud-native microservices and system design.", "sources": ["Project Report"]}
+
+    async def ateacher_chat(self, query: str, language: str = "English") -> dict:
         try:
-            retriever = self._get_session_retriever(k=10)
-            docs = retriever.invoke(query) if retriever else []
-            context = "\n".join([d.page_content for d in docs]) if docs else "Project report context."
+            docs = await self._aretrieve(query, k=10)
 
             if self.llm:
                 try:
-                    prompt = f"You are an encouraging teacher AI. Explain '{query}' clearly in {language} based on this context:\n{context[:6000]}"
-                    response = self.llm.invoke([{"role": "user", "content": prompt}])
-                    ans = response.content if hasattr(response, 'content') else str(response)
-                    return {"response": ans, "sources": ["Teacher AI"]}
+                    return {"response": await self._ainvoke(self._teacher_prompt(query, language, docs), "teacher"), "sources": ["Teacher AI"]}
                 except Exception:
                     pass
-            return {"response": f"Let me explain {query}! This concept in your project report focuses on cloud-native microservices and system design.", "sources": ["Project Report"]}
+            return self._teacher_fallback(query)
         except Exception:
             return {"response": f"Here is an explanation of {query}: key principles and clear applications.", "sources": ["Project Report"]}
@@ -0,0 +1,92 @@
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:
+    CrossEncoder = None
+
+from app.services.cache import TTLCache
+from app.services.embedding_cache import content_hash
+import threading
+import time
+
+
+class Reranker:
+    """
+    Optional cross-encoder rerank stage for retrieved chunks, run on CPU.
+
+    Candidates are scored in batches in retrieval order until the latency budget
+    is spent; chunks left unscored keep their retrieval order behind the scored
+    ones. Scores are cached per (query, chunk text), so they survive retrieval
+    cache invalidation when a session gains documents.
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16, budget_ms: float = 250, cache: TTLCache = None):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.cache = cache or TTLCache()
+        self.model = None
+        self.calls = 0
+        self.scored = 0
+        self.budget_exhausted = 0
+        self.total_ms = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self.model is not None
+
+    def load(self) -> bool:
+        if self.model is None and CrossEncoder is None:
+            print("Reranker disabled: RERANK_ENABLED is set but sentence-transformers is not installed")
+        elif self.model is None:
+            try:
+                self.model = CrossEncoder(self.model_name, device="cpu", max_length=512)
+            except Exception as e:
+                print(f"Reranker load warning: {e}")
+        return self.available
+
+    def rerank(self, query: str, docs: list, top_n: int) -> list:
+        """Returns the top_n docs by cross-encoder score (docs unchanged if no model is loaded)."""
+        if not self.available or len(docs) <= 1:
+            return docs[:top_n]
+
+        start = time.perf_counter()
+        scores = {}
+        pending = []
+        for i, doc in enumerate(docs):
+            score = self.cache.get((self.model_name, query, content_hash(doc.page_content)))
+            if score is None:
+                pending.append(i)
+            else:
+                scores[i] = score
+
+        exhausted = False
+        for offset in range(0, len(pending), self.batch_size):
+            if (time.perf_counter() - start) * 1000 >= self.budget_ms:
+                exhausted = True
+                break
+            batch = pending[offset:offset + self.batch_size]
+            batch_scores = self.model.predict([(query, docs[i].page_content) for i in batch], batch_size=self.batch_size)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self.cache.set((self.model_name, query, content_hash(docs[i].page_content)), scores[i])
+
+        ranked = sorted(scores, key=lambda i: scores[i], reverse=True)
+        ranked += [i for i in range(len(docs)) if i not in scores]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.calls += 1
+            self.scored += len(scores)
+            self.budget_exhausted += int(exhausted)
+            self.total_ms += elapsed_ms
+        return [docs[i] for i in ranked[:top_n]]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name if self.available else None,
+            "calls": self.calls,
+            "scored": self.scored,
+            "budget_exhausted": self.budget_exhausted,
+            "avg_ms": round(self.total_ms / self.calls, 1) if self.calls else 0.0,
+            "score_cache": self.cache.stats(),
+        }
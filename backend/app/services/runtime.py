@@ -0,0 +1,349 @@
+try:
+    from langchain_aws import ChatBedrock
+except ImportError:
+    ChatBedrock = None
+
+try:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+except ImportError:
+    ChatGoogleGenerativeAI = None
+
+from langchain_openai import ChatOpenAI
+try:
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+except Exception:
+    HuggingFaceEmbeddings = None
+
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_postgres import PGVector
+from app.core.config import settings
+from app.services.embedding_cache import CachedEmbeddings
+from app.services.cache import TTLCache
+from app.services.context_packer import count_tokens
+from app.services.llm_router import LLMRouter, MeteredLLM, llm_config
+from app.services.reranker import Reranker
+from app.services.vector_schema import embedding_table_empty, ensure_vector_schema, vector_schema_ready
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import threading
+import time
+
+
+def build_provider(provider: str):
+    """Builds the chat model for one provider ("bedrock", "nvidia", "gemini"), or None if it is not configured."""
+    if provider == "bedrock" and ChatBedrock and settings.AWS_ACCESS_KEY_ID:
+        try:
+            return ChatBedrock(
+                model_id=settings.AWS_BEDROCK_MODEL,
+                region_name=settings.AWS_REGION,
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                model_kwargs={"temperature": 0.3}
+            )
+        except Exception as e:
+            print(f"AWS Bedrock init error: {e}")
+    elif provider == "nvidia" and settings.NVIDIA_API_KEY:
+        return ChatOpenAI(
+            api_key=settings.NVIDIA_API_KEY,
+            base_url=settings.NVIDIA_BASE_URL,
+            model=settings.NVIDIA_TEXT_MODEL,
+            temperature=0.3,
+            request_timeout=settings.LLM_REQUEST_TIMEOUT
+        )
+    elif provider == "gemini" and ChatGoogleGenerativeAI and settings.GEMINI_API_KEY:
+        return ChatGoogleGenerativeAI(
+            google_api_key=settings.GEMINI_API_KEY,
+            model=settings.GEMINI_TEXT_MODEL,
+            temperature=0.3,
+            request_timeout=settings.LLM_REQUEST_TIMEOUT
+        )
+    return None
+
+
+def build_llm(slot=None) -> tuple[str, object]:
+    """
+    Builds the chat model: LLM_PROVIDER, or the first of LLM_FALLBACK_PROVIDERS that is configured.
+    With several configured (and LLM_ROUTER_ENABLED) returns ("router", LLMRouter) over all of them.
+    Returns (provider, llm).
+    """
+    names = [settings.LLM_PROVIDER] + [name.strip() for name in settings.LLM_FALLBACK_PROVIDERS.split(",")]
+    providers = []
+    for name in dict.fromkeys(name for name in names if name):
+        llm = build_provider(name)
+        if llm is not None:
+            providers.append((name, MeteredLLM(name, llm)))
+    if not providers:
+        return None, None
+    if len(providers) == 1 or not settings.LLM_ROUTER_ENABLED:
+        return providers[0]
+    return "router", LLMRouter(
+        providers,
+        routing=settings.LLM_ROUTING,
+        attempt_timeout=settings.LLM_ATTEMPT_TIMEOUT,
+        hedge=settings.LLM_HEDGE_ENABLED,
+        hedge_min_ms=settings.LLM_HEDGE_MIN_MS,
+        hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+        slot=slot,
+        window=settings.LLM_ROUTER_WINDOW,
+        breaker_failures=settings.LLM_BREAKER_FAILURES,
+        breaker_error_rate=settings.LLM_BREAKER_ERROR_RATE,
+        breaker_min_calls=settings.LLM_BREAKER_MIN_CALLS,
+        cooldown=settings.LLM_BREAKER_COOLDOWN,
+    )
+
+
+def build_embeddings():
+    """Fast embeddings (local HuggingFace), falling back to FakeEmbeddings."""
+    try:
+        if HuggingFaceEmbeddings:
+            return HuggingFaceEmbeddings(model_name=settings.EMBEDDING_MODEL)
+    except Exception as e:
+        print(f"Embedding model load warning: {e}")
+    return FakeEmbeddings(size=settings.EMBEDDING_DIM)
+
+
+class RAGRuntime:
+    """
+    Process-wide holder for the expensive RAG dependencies.
+
+    The embedding model, LLM client and PGVector store are loaded once and
+    shared; RAGService instances handed out by session() are cheap views.
+    Benchmarks and load tests pass llm/embeddings to use local stand-ins.
+    """
+
+    def __init__(self, llm=None, llm_provider: str = None, embeddings=None):
+        self.llm = None
+        self.llm_provider = None
+        self.embeddings = None
+        self._llm_override = (llm_provider or "stub", llm) if llm is not None else None
+        self._embeddings_override = embeddings
+        self.vector_store = None
+        self.connection_string = settings.DATABASE_URL
+        self.collection_name = "study_materials"
+        self.timings = {}
+        self.retrieval_cache = TTLCache(settings.RETRIEVAL_CACHE_SIZE, settings.RETRIEVAL_CACHE_TTL, name="retrieval")
+        self.retrieval_executor = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+        self._llm_semaphores = {}
+        self.background_tasks = {}
+        self.reranker = Reranker(
+            settings.RERANK_MODEL,
+            batch_size=settings.RERANK_BATCH_SIZE,
+            budget_ms=settings.RERANK_BUDGET_MS,
+            cache=TTLCache(settings.RERANK_CACHE_SIZE, settings.RERANK_CACHE_TTL, name="rerank"),
+        )
+        self._collection_id = None
+        # langchain_pg_embedding has filled session_id/source/document_tsv columns (else queries use cmetadata)
+        self.vector_columns = False
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _timed(self, name: str, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 1)
+
+    def load(self) -> "RAGRuntime":
+        """Loads LLM, embeddings and vector store. Safe to call repeatedly."""
+        if self._loaded:
+            return self
+        with self._lock:
+            if self._loaded:
+                return self
+            self.llm_provider, self.llm = self._llm_override or self._timed("llm_load_ms", lambda: build_llm(slot=self.llm_slot))
+            self.embeddings = self._embeddings_override or self._timed("embeddings_load_ms", build_embeddings)
+            if settings.EMBEDDING_CACHE_ENABLED and not isinstance(self.embeddings, FakeEmbeddings):
+                self.embeddings = CachedEmbeddings(
+                    self.embeddings,
+                    settings.EMBEDDING_MODEL,
+                    query_cache=TTLCache(settings.QUERY_EMBED_CACHE_SIZE, settings.QUERY_EMBED_CACHE_TTL, name="query_embedding"),
+                )
+            self.vector_store = self._timed("vector_store_load_ms", self._build_vector_store)
+            if self.vector_store:
+                self._timed("vector_schema_ms", self.prepare_vector_schema)
+            if settings.RERANK_ENABLED:
+                self._timed("reranker_load_ms", self.reranker.load)
+            self._loaded = True
+        return self
+
+    def _build_vector_store(self):
+        try:
+            return PGVector(
+                embeddings=self.embeddings,
+                collection_name=self.collection_name,
+                connection=self.connection_string,
+                use_jsonb=True,
+            )
+        except Exception as e:
+            print(f"PGVector connection warning: {e}")
+            return None
+
+    def prepare_vector_schema(self, migrate: bool = False):
+        """
+        Migrates langchain_pg_embedding with migrate, VECTOR_SCHEMA_AUTO_MIGRATE, or while the
+        table is still empty (nothing to backfill). Otherwise, until migrate_vector_schema.py
+        has run, queries filter on cmetadata instead of the columns.
+        """
+        try:
+            self.vector_columns = vector_schema_ready()
+            if migrate or settings.VECTOR_SCHEMA_AUTO_MIGRATE or (not self.vector_columns and embedding_table_empty()):
+                ensure_vector_schema()
+                self.vector_columns = vector_schema_ready()
+        except Exception as e:
+            print(f"Vector schema migration skipped: {e}")
+        if not self.vector_columns:
+            print("Vector schema not migrated: filtering on cmetadata until migrate_vector_schema.py has run")
+
+    def collection_id(self) -> str:
+        """UUID of the study_materials collection in langchain_pg_collection (looked up once)."""
+        if self._collection_id is None and self.vector_store:
+            from sqlalchemy import text
+            from app.database import engine
+            with engine.connect() as conn:
+                row = conn.execute(
+                    text("SELECT uuid FROM langchain_pg_collection WHERE name = :name"),
+                    {"name": self.collection_name}
+                ).first()
+            self._collection_id = str(row[0]) if row else None
+        return self._collection_id
+
+    def warm_up(self) -> dict:
+        """Loads everything and runs one probe through each component so the first request is not cold."""
+        self.load()
+
+        def _warm_embeddings():
+            try:
+                self.embeddings.embed_query("warm up")
+            except Exception as e:
+                print(f"Embedding warm-up note: {e}")
+
+        def _warm_vector_store():
+            if not self.vector_store:
+                return
+            try:
+                self.vector_store.similarity_search("warm up", k=1, filter={"session_id": "__warmup__"})
+            except Exception as e:
+                print(f"Vector store warm-up note: {e}")
+
+        def _warm_llm():
+            try:
+                self.llm.invoke([{"role": "user", "content": "ping"}], config=llm_config("warmup"))
+            except Exception as e:
+                print(f"LLM warm-up note: {e}")
+
+        self._timed("embeddings_warmup_ms", _warm_embeddings)
+        # Loads (or fails to download) the tokenizer used for context budgets once, up front.
+        self._timed("tokenizer_warmup_ms", lambda: count_tokens("warm up", self.llm_model_name()))
+        self._timed("vector_store_warmup_ms", _warm_vector_store)
+        if self.llm and settings.LLM_WARMUP:
+            self._timed("llm_warmup_ms", _warm_llm)
+
+        print(f"RAG runtime ready: {self.timings}")
+        return self.timings
+
+    def llm_model_name(self) -> str:
+        llm = self.llm
+        return getattr(llm, "model_name", None) or getattr(llm, "model", None) or getattr(llm, "model_id", None)
+
+    def llm_slot(self, provider: str = None) -> asyncio.Semaphore:
+        """
+        Per-provider semaphore bounding concurrent LLM calls (BEDROCK/NVIDIA/GEMINI_MAX_CONCURRENCY).
+        The router's own slot allows the sum of its providers' limits; it takes each provider's slot per attempt.
+        """
+        provider = provider or self.llm_provider or "default"
+        semaphore = self._llm_semaphores.get(provider)
+        if semaphore is None:
+            limits = {
+                "bedrock": settings.BEDROCK_MAX_CONCURRENCY,
+                "nvidia": settings.NVIDIA_MAX_CONCURRENCY,
+                "gemini": settings.GEMINI_MAX_CONCURRENCY,
+            }
+            if isinstance(self.llm, LLMRouter):
+                limits["router"] = sum(limits.get(name, 4) for name, _ in self.llm.providers)
+            semaphore = self._llm_semaphores.setdefault(provider, asyncio.Semaphore(limits.get(provider, 4)))
+        return semaphore
+
+    def spawn(self, key, coro_factory) -> asyncio.Task:
+        """Runs coro_factory() as a background task on the running loop unless one with the same key is in flight."""
+        task = self.background_tasks.get(key)
+        if task and not task.done():
+            return task
+        task = asyncio.get_running_loop().create_task(coro_factory())
+        self.background_tasks[key] = task
+        task.add_done_callback(lambda done: self.background_tasks.pop(key, None) if self.background_tasks.get(key) is done else None)
+        return task
+
+    def session_generation(self, session_id: str):
+        """
+        Version of a session's documents; part of every retrieval cache key. It lives in
+        session_versions, so an ingest or delete in another process (uvicorn workers,
+        ingest_worker.py) invalidates this process's cache too. None if it cannot be read.
+        """
+        if not session_id:
+            return 0
+        try:
+            from sqlalchemy import text
+            from app.database import engine
+            with engine.connect() as conn:
+                return conn.execute(
+                    text("SELECT version FROM session_versions WHERE session_id = :sid"), {"sid": session_id}
+                ).scalar() or 0
+        except Exception as e:
+            print(f"Session version lookup failed, bypassing retrieval cache: {e}")
+            return None
+
+    def invalidate_session(self, session_id: str):
+        """Called after a session's documents change (and the change is committed) so cached retrievals stop matching."""
+        if not session_id:
+            return
+        try:
+            from sqlalchemy import text
+            from app.database import engine
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "INSERT INTO session_versions (session_id, version, updated_at) VALUES (:sid, 1, now()) "
+                    "ON CONFLICT (session_id) DO UPDATE SET version = session_versions.version + 1, updated_at = now()"
+                ), {"sid": session_id})
+        except Exception as e:
+            print(f"Session version bump failed for {session_id}: {e}")
+
+    def session(self, session_id: str = None):
+        """Returns a RAGService bound to session_id that shares this runtime."""
+        from app.services.rag_service import RAGService
+        return RAGService(session_id=session_id, runtime=self)
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._loaded,
+            "llm": type(getattr(self.llm, "llm", self.llm)).__name__ if self.llm else None,
+            "llm_provider": self.llm_provider,
+            "embeddings": type(self.embeddings).__name__ if self.embeddings else None,
+            "vector_store": self.vector_store is not None,
+            "timings": dict(self.timings),
+            "embedding_cache": self.embeddings.stats() if isinstance(self.embeddings, CachedEmbeddings) else None,
+            "retrieval_cache": self.retrieval_cache.stats(),
+            "reranker": self.reranker.stats(),
+            "llm_router": self.llm.stats() if isinstance(self.llm, LLMRouter) else None,
+        }
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> RAGRuntime:
+    """Returns the process-wide runtime, loading it on first use."""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = RAGRuntime()
+    return _runtime.load()
+
+
+def set_runtime(runtime: RAGRuntime):
+    """Replaces the process-wide runtime; load tests install one with local stand-ins before the app starts."""
+    global _runtime
+    with _runtime_lock:
+        _runtime = runtime
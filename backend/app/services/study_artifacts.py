@@ -0,0 +1,196 @@
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models import IngestionJob, SessionDocument, StudyArtifact
+from app.services.metrics import record_cache
+import asyncio
+import hashlib
+import json
+import threading
+import time
+
+ARTIFACT_KINDS = ("summary", "outline", "question_pool")
+ACTIVE_STATES = ("queued", "extracting", "embedding")
+
+
+def session_fingerprint(session_id: str) -> str:
+    """Hash of the session's registered documents; changes whenever a file is added or removed."""
+    db = SessionLocal()
+    try:
+        hashes = [row[0] for row in db.query(SessionDocument.content_hash).filter(
+            SessionDocument.session_id == session_id
+        ).order_by(SessionDocument.content_hash)]
+    finally:
+        db.close()
+    return hashlib.sha256(",".join(hashes).encode()).hexdigest() if hashes else None
+
+
+def get_artifact(session_id: str, kind: str):
+    """The stored artifact, or None if missing or built from a different set of documents."""
+    if not session_id:
+        return None
+    try:
+        db = SessionLocal()
+        try:
+            artifact = db.get(StudyArtifact, (session_id, kind))
+        finally:
+            db.close()
+        if artifact and artifact.fingerprint == session_fingerprint(session_id):
+            record_cache("study_artifact", hits=1)
+            return json.loads(artifact.content)
+    except Exception as e:
+        print(f"Artifact lookup failed for {session_id}/{kind}: {e}")
+    record_cache("study_artifact", misses=1)
+    return None
+
+
+def _current_kinds(session_id: str, fingerprint: str) -> set:
+    db = SessionLocal()
+    try:
+        return {row[0] for row in db.query(StudyArtifact.kind).filter(
+            StudyArtifact.session_id == session_id,
+            StudyArtifact.fingerprint == fingerprint
+        )}
+    finally:
+        db.close()
+
+
+def _has_active_jobs(session_id: str) -> bool:
+    db = SessionLocal()
+    try:
+        return db.query(IngestionJob.id).filter(
+            IngestionJob.session_id == session_id,
+            IngestionJob.status.in_(ACTIVE_STATES)
+        ).first() is not None
+    finally:
+        db.close()
+
+
+def store_artifact(session_id: str, kind: str, fingerprint: str, content, generation_ms: float):
+    db = SessionLocal()
+    try:
+        statement = insert(StudyArtifact).values(
+            session_id=session_id, kind=kind, fingerprint=fingerprint,
+            content=json.dumps(content), generation_ms=generation_ms
+        )
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["session_id", "kind"],
+            set_={column: statement.excluded[column] for column in ("fingerprint", "content", "generation_ms", "created_at")}
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+def delete_artifacts(session_id: str) -> int:
+    db = SessionLocal()
+    try:
+        count = db.query(StudyArtifact).filter(StudyArtifact.session_id == session_id).delete(synchronize_session=False)
+        db.commit()
+        return count
+    finally:
+        db.close()
+
+
+async def build_artifacts(session_id: str) -> dict:
+    """
+    Builds whichever artifacts are stale for the session's current documents.
+    The summary and the starter question bank run concurrently; the outline is derived
+    from the summary. Returns {kind: generation_ms} for what was built.
+    """
+    from app.services.runtime import get_runtime
+    service = get_runtime().session(session_id)
+    if not service.llm:
+        return {}
+    fingerprint = await asyncio.to_thread(session_fingerprint, session_id)
+    if not fingerprint:
+        return {}
+    done = await asyncio.to_thread(_current_kinds, session_id, fingerprint)
+    built = {}
+
+    async def _timed(kind: str, make):
+        start = time.perf_counter()
+        content = await make()
+        built[kind] = round((time.perf_counter() - start) * 1000, 1)
+        await asyncio.to_thread(store_artifact, session_id, kind, fingerprint, content, built[kind])
+        return content
+
+    async def _summary_and_outline():
+        if "summary" in done:
+            summary = await asyncio.to_thread(get_artifact, session_id, "summary")
+        else:
+            summary = await _timed("summary", service._asession_summary)
+        if "outline" not in done and summary:
+            await _timed("outline", lambda: service._aoutline(summary))
+
+    async def _question_pool():
+        async def _make():
+            # Seeds the question bank that default quiz requests draw from.
+            return {"banked": await service.atop_up_questions(count=settings.QUESTION_POOL_SIZE)}
+        if "question_pool" not in done:
+            await _timed("question_pool", _make)
+
+    results = await asyncio.gather(_summary_and_outline(), _question_pool(), return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            print(f"Artifact build error for session {session_id}: {result}")
+    return built
+
+
+class ArtifactBuilder:
+    """
+    Builds study artifacts in the background once a session has no ingestion jobs left.
+
+    Builds run as coroutines on the web server's event loop (bound in start()), so
+    async LLM clients are never shared across loops; processes without one, like
+    ingest_worker.py, get a private loop thread on first use.
+    """
+
+    def __init__(self):
+        self._loop = None
+        # session_id -> whether another build was requested while this one was queued or running
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        with self._lock:
+            if self._loop is None:
+                if loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="artifacts", daemon=True).start()
+                self._loop = loop
+
+    def schedule(self, session_id: str):
+        """
+        Thread-safe. A session has at most one build at a time; calls made while it is
+        queued or running are coalesced into a single rerun once it finishes.
+        """
+        if not settings.PRECOMPUTE_ARTIFACTS:
+            return
+        with self._lock:
+            if session_id in self._in_flight:
+                self._in_flight[session_id] = True
+                return
+            self._in_flight[session_id] = False
+        self.start()
+        asyncio.run_coroutine_threadsafe(self._build(session_id), self._loop)
+
+    async def _build(self, session_id: str):
+        while True:
+            try:
+                # The batch that finishes last for this session triggers the build.
+                if not await asyncio.to_thread(_has_active_jobs, session_id):
+                    built = await build_artifacts(session_id)
+                    if built:
+                        print(f"Study artifacts ready for session {session_id}: {built}")
+            except Exception as e:
+                print(f"Artifact build failed for session {session_id}: {e}")
+            with self._lock:
+                if not self._in_flight.get(session_id):
+                    self._in_flight.pop(session_id, None)
+                    return
+                # Documents changed during the build: rebuild whatever is now stale.
+                self._in_flight[session_id] = False
+
+
+artifact_builder = ArtifactBuilder()
@@ -0,0 +1,189 @@
+from langchain_core.documents import Document
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from app.core.config import settings
+from app.database import SessionLocal, engine
+from app.models import SummaryPartial
+from app.services.context_packer import merge_chunks
+from app.services.metrics import record_cache
+from app.services.vector_schema import column_sql
+import asyncio
+import hashlib
+
+# Bump when the prompts below change, so cached partials are not reused.
+PROMPT_VERSION = "1"
+FINAL_LEVEL = 99
+
+LEAF_PROMPT = """Summarise this part of a study document as concise study notes.
+Keep key definitions, formulas, names, numbers and section titles. Use bullet points, at most 200 words.
+
+Text:
+{text}"""
+
+REDUCE_PROMPT = """Combine these consecutive partial notes from one study document into a single set of study notes.
+Remove repetition, keep the document's order, and keep key definitions, formulas, names and numbers. At most 400 words.
+
+Notes:
+{text}"""
+
+
+def input_hash(model_name: str, level: int, text: str) -> str:
+    payload = f"{PROMPT_VERSION}\x1f{model_name or ''}\x1f{level}\x1f{text}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MapReduceSummarizer:
+    """
+    Summarises every chunk of a session rather than the top retrieved ones.
+
+    Each document is cut into groups of consecutive chunks: SUMMARY_GROUP_CHUNKS each,
+    growing so there are no more than SUMMARY_MAX_GROUPS, but never past
+    SUMMARY_MAX_GROUP_CHUNKS so a group still fits one prompt (longer documents get
+    more groups, one per SUMMARY_MAX_GROUP_CHUNKS chunks). Groups are summarised in
+    parallel, at most SUMMARY_MAX_CONCURRENCY LLM calls at a time (within the
+    provider's own limit), then reduced SUMMARY_FAN_IN at a time until one summary
+    per document is left; the final study guide is written from those.
+
+    Every node is stored in summary_partials under a hash of its model, level and
+    input text. Group boundaries are fixed, so repeating a summary costs no LLM
+    calls, and a new upload only recomputes its own document and the final step.
+    """
+
+    def __init__(self, service):
+        self.service = service
+        self.session_id = service.session_id
+        self.model_name = service.runtime.llm_model_name()
+        self.llm_calls = 0
+        self.cache_hits = 0
+
+    def chunk_count(self, source_filter: str = None) -> int:
+        where, params = self._where(source_filter)
+        with engine.connect() as conn:
+            return conn.execute(text(f"SELECT count(*) FROM langchain_pg_embedding WHERE {where}"), params).scalar()
+
+    def _where(self, source_filter: str = None) -> tuple[str, dict]:
+        ready = self.service.runtime.vector_columns
+        where, params = f"{column_sql('session_id', ready)} = :sid", {"sid": self.session_id}
+        if source_filter and source_filter != "all":
+            where += f" AND {column_sql('source', ready)} = :source"
+            params["source"] = source_filter
+        return where, params
+
+    def load_documents(self, source_filter: str = None) -> dict:
+        """Returns {source: [chunk Documents in reading order]}."""
+        where, params = self._where(source_filter)
+        with engine.connect() as conn:
+            rows = conn.execute(text(
+                f"SELECT document, cmetadata FROM langchain_pg_embedding WHERE {where} "
+                f"ORDER BY {column_sql('source', self.service.runtime.vector_columns)}, (cmetadata->>'char_start')::int NULLS LAST, id"
+            ), params).all()
+        documents = {}
+        for row in rows:
+            metadata = row.cmetadata or {}
+            documents.setdefault(metadata.get("source") or "Uploaded Document", []).append(
+                Document(page_content=row.document, metadata=metadata)
+            )
+        return documents
+
+    def _leaf_texts(self, chunks: list) -> list[str]:
+        # Groups grow with the document to keep the leaf count near SUMMARY_MAX_GROUPS, capped at
+        # SUMMARY_MAX_GROUP_CHUNKS per prompt; past that the leaf count grows with the document.
+        # Sized per document, so another upload never moves this document's group boundaries.
+        size = max(1, settings.SUMMARY_GROUP_CHUNKS, -(-len(chunks) // max(1, settings.SUMMARY_MAX_GROUPS)))
+        size = min(size, max(1, settings.SUMMARY_MAX_GROUP_CHUNKS, settings.SUMMARY_GROUP_CHUNKS))
+        return [
+            "\n\n".join(passage.page_content for passage in merge_chunks(chunks[i:i + size]))
+            for i in range(0, len(chunks), size)
+        ]
+
+    def _lookup(self, hashes: list) -> dict:
+        db = SessionLocal()
+        try:
+            rows = db.query(SummaryPartial.input_hash, SummaryPartial.summary).filter(
+                SummaryPartial.input_hash.in_(hashes)
+            ).all()
+            return dict(rows)
+        finally:
+            db.close()
+
+    def _store(self, rows: list):
+        db = SessionLocal()
+        try:
+            db.execute(insert(SummaryPartial).values(rows).on_conflict_do_nothing(index_elements=["input_hash"]))
+            db.commit()
+        finally:
+            db.close()
+
+    async def _run_level(self, nodes: list, semaphore: asyncio.Semaphore) -> list[str]:
+        """nodes are (level, source, prompt_text, prompt) tuples; returns their summaries in order."""
+        hashes = [input_hash(self.model_name, level, prompt_text) for level, _, prompt_text, _ in nodes]
+        cached = await asyncio.to_thread(self._lookup, list(set(hashes)))
+        hits = sum(1 for h in hashes if h in cached)
+        self.cache_hits += hits
+        record_cache("summary_partial", hits=hits, misses=len(hashes) - hits)
+
+        async def _summarise(prompt: str) -> str:
+            async with semaphore:
+                self.llm_calls += 1
+                return await self.service._ainvoke(prompt, "summary")
+
+        missing = {}
+        for i, h in enumerate(hashes):
+            if h not in cached:
+                missing.setdefault(h, i)
+        results = await asyncio.gather(*(_summarise(nodes[i][3]) for i in missing.values()), return_exceptions=True)
+
+        # Partials that did succeed are kept even if a sibling failed, so a retry only redoes the failures.
+        new_rows = []
+        for (h, i), summary in zip(missing.items(), results):
+            if isinstance(summary, BaseException):
+                continue
+            cached[h] = summary
+            new_rows.append({"input_hash": h, "session_id": self.session_id, "source": nodes[i][1], "level": nodes[i][0], "summary": summary})
+        if new_rows:
+            await asyncio.to_thread(self._store, new_rows)
+        for summary in results:
+            if isinstance(summary, BaseException):
+                raise summary
+        return [cached[h] for h in hashes]
+
+    async def summarize(self, source_filter: str = None) -> str:
+        """Returns the study guide for the session (or one source), or None if it has no chunks."""
+        documents = await asyncio.to_thread(self.load_documents, source_filter)
+        if not documents:
+            return None
+        semaphore = asyncio.Semaphore(max(1, settings.SUMMARY_MAX_CONCURRENCY))
+
+        # Map: every chunk group of every document at once.
+        pending = {source: self._leaf_texts(chunks) for source, chunks in documents.items()}
+        nodes = [(0, source, leaf, LEAF_PROMPT.format(text=leaf)) for source, leaves in pending.items() for leaf in leaves]
+        summaries = iter(await self._run_level(nodes, semaphore))
+        current = {source: [next(summaries) for _ in leaves] for source, leaves in pending.items()}
+
+        # Reduce: all documents step down one level together until each has a single summary.
+        level = 0
+        fan_in = max(2, settings.SUMMARY_FAN_IN)
+        while any(len(parts) > 1 for parts in current.values()):
+            level += 1
+            groups = {
+                source: ["\n\n".join(parts[i:i + fan_in]) for i in range(0, len(parts), fan_in)]
+                for source, parts in current.items() if len(parts) > 1
+            }
+            nodes = [(level, source, group, REDUCE_PROMPT.format(text=group)) for source, texts in groups.items() for group in texts]
+            summaries = iter(await self._run_level(nodes, semaphore))
+            for source, texts in groups.items():
+                current[source] = [next(summaries) for _ in texts]
+
+        combined = "\n\n".join(f"## {source}\n{parts[0]}" for source, parts in current.items())
+        final = await self._run_level([(FINAL_LEVEL, None, combined, self.service._summary_prompt(combined))], semaphore)
+        return final[0]
+
+
+def delete_partials(session_id: str) -> int:
+    db = SessionLocal()
+    try:
+        count = db.query(SummaryPartial).filter(SummaryPartial.session_id == session_id).delete(synchronize_session=False)
+        db.commit()
+        return count
+    finally:
+        db.close()
@@ -0,0 +1,124 @@
+from sqlalchemy import text
+from app.database import engine
+
+# session_id / source / document_tsv mirror cmetadata and document for our own SQL
+# (the session_id column index, and document_tsv for the lexical half of hybrid
+# retrieval, see hybrid_search.py). They are plain nullable columns kept up to date
+# by a trigger, because LangChain's inserts only know the JSONB column. Adding them
+# this way is a catalog-only change; existing rows are backfilled in small batches.
+# Columns created as GENERATED ... STORED by earlier versions are left as they are.
+# column: (type, expression; {row} is "NEW." inside the trigger)
+SCHEMA_COLUMNS = {
+    "session_id": ("varchar", "{row}cmetadata->>'session_id'"),
+    "source": ("varchar", "{row}cmetadata->>'source'"),
+    "document_tsv": ("tsvector", "to_tsvector('english', coalesce({row}document, ''))"),
+}
+VECTOR_INDEX_DDL = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_embedding_session_source "
+    "ON langchain_pg_embedding (session_id, source)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_embedding_document_tsv "
+    "ON langchain_pg_embedding USING gin (document_tsv)",
+    # PGVector filters with jsonb_path_match(cmetadata, ...), which cannot use this expression index.
+    "DROP INDEX CONCURRENTLY IF EXISTS ix_embedding_cmetadata_session_id",
+]
+TRIGGER_FUNCTION = "study_buddy_embedding_columns"
+BACKFILL_BATCH = 5000
+# ADD COLUMN and CREATE TRIGGER need a brief exclusive lock; give up instead of queueing
+# every other query behind a long-running transaction.
+LOCK_TIMEOUT = "5s"
+
+
+def _columns() -> dict:
+    """{column: is_generated} for the SCHEMA_COLUMNS that already exist."""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT column_name, is_generated FROM information_schema.columns "
+            "WHERE table_name = 'langchain_pg_embedding' AND column_name = ANY(:columns)"
+        ), {"columns": list(SCHEMA_COLUMNS)}).all()
+    return {name: generated == "ALWAYS" for name, generated in rows}
+
+
+def _expression(column: str, row: str = "") -> str:
+    return SCHEMA_COLUMNS[column][1].format(row=row)
+
+
+def vector_schema_ready() -> bool:
+    """True once every column exists and no row is still waiting for the backfill."""
+    if len(_columns()) != len(SCHEMA_COLUMNS):
+        return False
+    with engine.connect() as conn:
+        return not conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM langchain_pg_embedding "
+            "WHERE session_id IS NULL AND cmetadata->>'session_id' IS NOT NULL)"
+        )).scalar()
+
+
+def embedding_table_empty() -> bool:
+    with engine.connect() as conn:
+        return not conn.execute(text("SELECT EXISTS (SELECT 1 FROM langchain_pg_embedding)")).scalar()
+
+
+def column_sql(column: str, ready: bool = True) -> str:
+    """The column when the schema is ready, else the expression it mirrors (slower, but correct)."""
+    return column if ready else f"({_expression(column)})"
+
+
+def _add_columns(plain: list[str]):
+    assignments = "\n".join(f"    NEW.{column} := {_expression(column, 'NEW.')};" for column in plain)
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        for column in plain:
+            conn.execute(text(f"ALTER TABLE langchain_pg_embedding ADD COLUMN IF NOT EXISTS {column} {SCHEMA_COLUMNS[column][0]}"))
+        conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {TRIGGER_FUNCTION}() RETURNS trigger AS $$\nBEGIN\n{assignments}\n"
+            "    RETURN NEW;\nEND;\n$$ LANGUAGE plpgsql"
+        ))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {TRIGGER_FUNCTION} ON langchain_pg_embedding"))
+        conn.execute(text(
+            f"CREATE TRIGGER {TRIGGER_FUNCTION} BEFORE INSERT OR UPDATE OF cmetadata, document "
+            f"ON langchain_pg_embedding FOR EACH ROW EXECUTE FUNCTION {TRIGGER_FUNCTION}()"
+        ))
+
+
+def backfill(plain: list[str], batch_size: int = BACKFILL_BATCH) -> int:
+    """
+    Fills the trigger-maintained columns of rows written before the trigger existed.
+    Walks the primary key in batch_size slices, one short transaction each. Returns rows updated.
+    """
+    assignments = ", ".join(f"{column} = {_expression(column)}" for column in plain)
+    stale = " OR ".join(f"({column} IS NULL AND {_expression(column)} IS NOT NULL)" for column in plain)
+    updated, after = 0, ""
+    while True:
+        with engine.begin() as conn:
+            ids = conn.execute(text(
+                "SELECT id FROM langchain_pg_embedding WHERE id > :after ORDER BY id LIMIT :n"
+            ), {"after": after, "n": batch_size}).scalars().all()
+            if not ids:
+                return updated
+            updated += conn.execute(text(
+                f"UPDATE langchain_pg_embedding SET {assignments} WHERE id = ANY(:ids) AND ({stale})"
+            ), {"ids": ids}).rowcount
+        after = ids[-1]
+
+
+def ensure_vector_schema(force_backfill: bool = False, batch_size: int = BACKFILL_BATCH):
+    """
+    Adds the session_id/source/document_tsv columns, their trigger and indexes to
+    langchain_pg_embedding. Idempotent and online: no statement rewrites the table or
+    holds an exclusive lock for more than a moment. Existing rows are backfilled when
+    a column is first added, or always with force_backfill (migrate_vector_schema.py),
+    which also finishes a backfill that was interrupted.
+    """
+    existing = _columns()
+    plain = [column for column in SCHEMA_COLUMNS if not existing.get(column, False)]
+    if plain:
+        added = [column for column in plain if column not in existing]
+        _add_columns(plain)
+        if added or force_backfill:
+            count = backfill(plain, batch_size)
+            if count:
+                print(f"Vector schema: backfilled {', '.join(plain)} on {count} row(s)")
+    # CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for statement in VECTOR_INDEX_DDL:
+            conn.execute(text(statement))
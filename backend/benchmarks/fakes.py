@@ -0,0 +1,137 @@
+"""Local stand-ins for network services, shared by the benchmarks and the load test."""
+from langchain_core.messages import AIMessage, AIMessageChunk
+import asyncio
+import io
+import json
+import random
+import re
+import time
+
+WORDS = (
+    "photosynthesis chlorophyll mitochondria enzyme catalyst osmosis diffusion membrane protein nucleus "
+    "algorithm recursion complexity graph vertex edge matrix vector derivative integral theorem proof "
+    "economics inflation demand supply equilibrium market revolution empire treaty parliament constitution "
+    "voltage current resistance circuit magnetic field momentum energy entropy thermodynamics wavelength"
+).split()
+
+
+def filler_text(words: int, seed: int = 0) -> str:
+    """Deterministic study-material-like prose with sentence breaks."""
+    rng = random.Random(seed)
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+class LatencyProfile:
+    """Lognormal latency around median_ms with an occasional slow tail, like a hosted API."""
+
+    def __init__(self, median_ms: float, sigma: float = 0.35, tail_rate: float = 0.0, tail_ms: float = 0.0, seed: int = None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self._random = random.Random(seed)
+
+    def sample(self) -> float:
+        """Seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        if self.tail_rate and self._random.random() < self.tail_rate:
+            return self.tail_ms * self._random.uniform(0.8, 1.2) / 1000
+        return self.median_ms * self._random.lognormvariate(0, self.sigma) / 1000
+
+
+class FakeChatModel:
+    """
+    Chat model stand-in with invoke/ainvoke/astream and a configurable latency.
+
+    Answers in the shape each prompt asks for (NDJSON quiz questions, a JSON
+    slide outline, prose otherwise), so every feature's parsing path runs.
+    Streams split the answer into chunks spread over the same latency.
+    """
+
+    model_name = "fake-chat"
+
+    def __init__(self, latency: LatencyProfile = None, chunks: int = 20):
+        self.latency = latency or LatencyProfile(0)
+        self.chunks = max(1, chunks)
+        self.calls = 0
+
+    def _prompt(self, messages) -> str:
+        return "\n".join(m["content"] if isinstance(m, dict) else str(getattr(m, "content", m)) for m in messages)
+
+    def _answer(self, prompt: str) -> str:
+        self.calls += 1
+        quiz = re.search(r"Generate exactly (\d+) (\w+) difficulty multiple choice", prompt)
+        if quiz:
+            return "\n".join(json.dumps({
+                "question": f"Question {self.calls}-{i}: {filler_text(10, seed=self.calls * 100 + i)}?",
+                "options": [filler_text(3, seed=self.calls * 1000 + i * 4 + j) for j in range(4)],
+                "answer": filler_text(3, seed=self.calls * 1000 + i * 4),
+                "topic": "general",
+            }) for i in range(int(quiz.group(1))))
+        if "slide outline" in prompt:
+            return json.dumps([
+                {"title": f"Section {i + 1}", "points": [filler_text(6, seed=i * 10 + j) for j in range(3)], "notes": filler_text(15, seed=i)}
+                for i in range(6)
+            ])
+        return filler_text(120, seed=self.calls)
+
+    def invoke(self, messages, **kwargs):
+        answer = self._answer(self._prompt(messages))
+        time.sleep(self.latency.sample())
+        return AIMessage(content=answer)
+
+    async def ainvoke(self, messages, **kwargs):
+        answer = self._answer(self._prompt(messages))
+        await asyncio.sleep(self.latency.sample())
+        return AIMessage(content=answer)
+
+    async def astream(self, messages, **kwargs):
+        answer = self._answer(self._prompt(messages))
+        delay = self.latency.sample() / self.chunks
+        size = max(1, len(answer) // self.chunks + 1)
+        for i in range(0, len(answer), size):
+            await asyncio.sleep(delay)
+            yield AIMessageChunk(content=answer[i:i + size])
+
+
+class FakePolly:
+    """boto3 Polly client stand-in: blocks for the synthesis latency, returns ~16 kB of audio per 100 words."""
+
+    def __init__(self, latency: LatencyProfile = None):
+        self.latency = latency or LatencyProfile(0)
+        self.calls = 0
+
+    def synthesize_speech(self, Text: str, OutputFormat: str = "mp3", VoiceId: str = None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        return {"AudioStream": io.BytesIO(b"\xff\xf3" * (80 * max(1, len(Text.split()))))}
+
+
+class FakeImageHTTP:
+    """Stands in for the requests module where an image API is fetched; get() blocks like requests does."""
+
+    def __init__(self, latency: LatencyProfile = None, size: int = 200_000):
+        self.latency = latency or LatencyProfile(0)
+        self.size = size
+        self.calls = 0
+
+    def get(self, url: str, timeout: float = None, **kwargs):
+        self.calls += 1
+        time.sleep(self.latency.sample())
+        return _FakeResponse(b"\x89PNG" + b"\0" * self.size)
+
+
+class _FakeResponse:
+    status_code = 200
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
@@ -0,0 +1,159 @@
+"""Simulates flaky LLM providers to compare tail latency with and without LLMRouter.
+
+No API keys or network needed: each provider sleeps for a lognormal latency with
+an occasional slow tail, fails at a given rate, and the primary has an outage
+for part of the run. Latencies are scaled down by --scale so a run takes
+seconds; reported numbers are in simulated milliseconds.
+
+    python benchmarks/llm_router_sim.py --requests 400 --concurrency 16
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import AIMessage
+from app.services.llm_router import LLMRouter
+
+
+class SimulatedProvider:
+    """Chat model stand-in with a latency profile, an error rate and an optional outage."""
+
+    def __init__(self, name: str, median_ms: float, tail_ms: float, tail_rate: float, error_rate: float,
+                 scale: float, seed: int, outage=None):
+        self.name = name
+        self.median_ms = median_ms
+        self.tail_ms = tail_ms
+        self.tail_rate = tail_rate
+        self.error_rate = error_rate
+        self.scale = scale
+        self.outage = outage
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        if self.outage and self.outage():
+            await asyncio.sleep(0.05 * self.median_ms / 1000 * self.scale)
+            raise ConnectionError(f"{self.name} unavailable (simulated outage)")
+        latency_ms = self.median_ms * self._random.lognormvariate(0, 0.35)
+        if self._random.random() < self.tail_rate:
+            latency_ms = self.tail_ms * self._random.uniform(0.8, 1.2)
+        await asyncio.sleep(latency_ms / 1000 * self.scale)
+        if self._random.random() < self.error_rate:
+            raise RuntimeError(f"{self.name} returned 429 (simulated)")
+        return AIMessage(content=f"answer from {self.name}")
+
+
+def build_providers(args, progress) -> list:
+    outage = lambda: args.outage_start <= progress["issued"] / args.requests < args.outage_end
+    return [
+        ("nvidia", SimulatedProvider("nvidia", 800, 9000, 0.06, 0.02, args.scale, args.seed, outage)),
+        ("gemini", SimulatedProvider("gemini", 1100, 6000, 0.03, 0.01, args.scale, args.seed + 1)),
+        ("bedrock", SimulatedProvider("bedrock", 1400, 5000, 0.02, 0.01, args.scale, args.seed + 2)),
+    ]
+
+
+async def run_scenario(name: str, args, make_llm) -> dict:
+    progress = {"issued": 0}
+    providers = build_providers(args, progress)
+    llm = make_llm(providers)
+    latencies, fallbacks = [], 0
+    queue = asyncio.Queue()
+    for i in range(args.requests):
+        queue.put_nowait(i)
+
+    async def _worker():
+        nonlocal fallbacks
+        while not queue.empty():
+            queue.get_nowait()
+            progress["issued"] += 1
+            start = time.perf_counter()
+            try:
+                await llm.ainvoke([{"role": "user", "content": "Explain photosynthesis."}])
+            except Exception:
+                fallbacks += 1  # RAGService would answer with canned fallback text
+            latencies.append((time.perf_counter() - start) * 1000 / args.scale)
+
+    # The router prints every provider failure; keep the report readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(_worker() for _ in range(args.concurrency)))
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    return {
+        "scenario": name,
+        "p50": pick(0.5),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": latencies[-1],
+        "fallbacks": fallbacks,
+        "provider_calls": sum(provider.calls for _, provider in providers),
+        "router": llm.stats() if isinstance(llm, LLMRouter) else None,
+    }
+
+
+class SingleProvider:
+    """Today's behaviour: one provider and its request timeout, then fallback text."""
+
+    def __init__(self, llm, timeout: float):
+        self.llm = llm
+        self.timeout = timeout
+
+    async def ainvoke(self, messages, **kwargs):
+        return await asyncio.wait_for(self.llm.ainvoke(messages, **kwargs), self.timeout)
+
+
+async def main(args):
+    request_timeout = 25 * args.scale
+    attempt_timeout = args.attempt_timeout * args.scale
+
+    def router(hedge: bool):
+        return lambda providers: LLMRouter(
+            providers,
+            attempt_timeout=attempt_timeout,
+            hedge=hedge,
+            hedge_min_ms=args.hedge_min_ms * args.scale,
+            hedge_min_samples=20,
+            cooldown=args.cooldown * args.scale,
+        )
+
+    scenarios = [
+        ("single provider", lambda providers: SingleProvider(providers[0][1], request_timeout)),
+        ("router (failover + breakers)", router(False)),
+        ("router + p95 hedging", router(True)),
+    ]
+    print(f"{args.requests} requests, concurrency {args.concurrency}, primary outage for "
+          f"{args.outage_start:.0%}-{args.outage_end:.0%} of the run (simulated ms)\n")
+    print(f"{'scenario':<30} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'fallbacks':>10} {'calls/req':>10}")
+    for name, make_llm in scenarios:
+        result = await run_scenario(name, args, make_llm)
+        print(f"{result['scenario']:<30} {result['p50']:>7.0f} {result['p95']:>7.0f} {result['p99']:>7.0f} "
+              f"{result['max']:>7.0f} {result['fallbacks']:>10} {result['provider_calls'] / args.requests:>10.2f}")
+        if args.verbose and result["router"]:
+            router_stats = result["router"]
+            providers = ", ".join(
+                f"{name} {health['calls']} calls/{health['failures']} failed ({health['state']})"
+                for name, health in router_stats["providers"].items()
+            )
+            print(f"    {providers}; failovers {router_stats['failovers']}, "
+                  f"hedges {router_stats['hedges']} ({router_stats['hedge_wins']} won)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--scale", type=float, default=0.01, help="real seconds per simulated second")
+    parser.add_argument("--attempt-timeout", type=float, default=20, help="router per-attempt timeout (simulated s)")
+    parser.add_argument("--cooldown", type=float, default=30, help="breaker cooldown (simulated s)")
+    parser.add_argument("--hedge-min-ms", type=float, default=1500)
+    parser.add_argument("--outage-start", type=float, default=0.3)
+    parser.add_argument("--outage-end", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--verbose", action="store_true")
+    asyncio.run(main(parser.parse_args()))
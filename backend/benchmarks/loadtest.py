@@ -0,0 +1,434 @@
+"""End-to-end concurrent load test of app.main:app with local stand-ins for every external API.
+
+Starts the real app under uvicorn in this process, then drives it over HTTP with
+--users simulated students (ramped up over --ramp seconds). Each one registers,
+logs in, creates a session, uploads a PDF and polls until it is ingested, then
+until the end of the run picks weighted actions (chat, quiz, summary, teacher
+audio, image, document list) with exponential think time between them.
+
+The LLM is benchmarks.fakes.FakeChatModel, Polly is FakePolly and the image API
+is FakeImageHTTP, each with a lognormal latency plus a slow tail like the hosted
+service. They block the way the real clients do, so event-loop blocking shows up
+as loop lag. Embeddings are FakeEmbeddings unless --embeddings local. The only real
+service is Postgres + pgvector at DATABASE_URL: use a scratch database.
+
+While the run is going, a sampler on the server's event loop records how busy the
+request threadpool (AnyIO default limiter), the SQLAlchemy and PGVector connection
+pools, the retrieval executor and the LLM concurrency slots are, plus event-loop lag.
+
+    python benchmarks/loadtest.py --users 50 --ramp 20 --duration 60 --out load.json
+
+Reports throughput, p50/p95/p99/max per endpoint and saturation per resource.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anyio.to_thread
+import httpx
+import uvicorn
+from langchain_community.embeddings import FakeEmbeddings
+from app.core.config import settings
+from app.database import engine
+from app.services.llm_router import MeteredLLM
+from app.services.runtime import RAGRuntime, build_embeddings, set_runtime
+from benchmarks.fakes import FakeChatModel, FakeImageHTTP, FakePolly, LatencyProfile, filler_text
+
+CHAT_QUERIES = ["Explain the main theorem", "What is osmosis?", "Summarise the section on inflation",
+                "How does a magnetic field relate to current?", "What do mitochondria do?", "Give an example of recursion"]
+CONCEPTS = ["photosynthesis", "supply and demand", "electric circuit", "graph traversal"]
+# Relative weights of what a student does once their document is ready.
+ACTIONS = {"chat": 50, "quiz": 15, "summary": 10, "teacher": 8, "teacher_stream": 7, "image": 3, "documents": 7}
+PDF_VARIANTS = 8
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_pdfs(pages: int) -> list:
+    from fpdf import FPDF
+    pdfs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant in range(PDF_VARIANTS):
+            pdf = FPDF()
+            pdf.set_font("Arial", size=11)
+            for page in range(pages):
+                pdf.add_page()
+                pdf.multi_cell(0, 5, filler_text(450, seed=variant * 1000 + page))
+            path = os.path.join(tmp, f"notes-{variant}.pdf")
+            pdf.output(path)
+            with open(path, "rb") as f:
+                pdfs.append(f.read())
+    return pdfs
+
+
+class Recorder:
+    """Latency and outcome of every request, keyed by endpoint template."""
+
+    def __init__(self):
+        self.calls = {}
+        self.errors = {}
+
+    async def call(self, name: str, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+        except Exception as e:
+            self._record(name, time.perf_counter() - start, f"{type(e).__name__}")
+            return None
+        error = None if response.status_code < 400 else str(response.status_code)
+        self._record(name, time.perf_counter() - start, error)
+        return response if error is None else None
+
+    def _record(self, name: str, seconds: float, error: str = None):
+        self.calls.setdefault(name, []).append(seconds)
+        if error:
+            errors = self.errors.setdefault(name, {})
+            errors[error] = errors.get(error, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, seconds in sorted(self.calls.items()):
+            ms = [s * 1000 for s in seconds]
+            endpoints[name] = {
+                "count": len(ms),
+                "errors": sum(self.errors.get(name, {}).values()),
+                "error_kinds": self.errors.get(name, {}),
+                "rps": round(len(ms) / elapsed, 2),
+                "p50_ms": round(percentile(ms, 0.5), 1),
+                "p95_ms": round(percentile(ms, 0.95), 1),
+                "p99_ms": round(percentile(ms, 0.99), 1),
+                "max_ms": round(max(ms), 1),
+            }
+        return endpoints
+
+
+class Sampler:
+    """Polls resource usage on the server's event loop every interval seconds."""
+
+    def __init__(self, runtime: RAGRuntime, interval: float):
+        self.runtime = runtime
+        self.interval = interval
+        self.samples = {}
+        self.capacity = {}
+        self.limiter = None
+        self._stopped = False
+
+    def _add(self, name: str, value: float, capacity: float = None):
+        self.samples.setdefault(name, []).append(value)
+        if capacity is not None:
+            self.capacity[name] = capacity
+
+    def _pool(self, name: str, pool):
+        if pool is None or not hasattr(pool, "checkedout"):
+            return
+        self._add(f"{name}_checked_out", pool.checkedout(), pool.size() + max(0, getattr(pool, "_max_overflow", 0)))
+
+    async def run(self):
+        """Started from a startup handler, so it shares the loop (and thread limiter) with the app."""
+        loop = asyncio.get_running_loop()
+        self.limiter = anyio.to_thread.current_default_thread_limiter()
+        while not self._stopped:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self._add("event_loop_lag_ms", max(0.0, (loop.time() - start - self.interval) * 1000))
+
+            statistics_ = self.limiter.statistics()
+            self._add("threadpool_busy", self.limiter.borrowed_tokens, self.limiter.total_tokens)
+            self._add("threadpool_waiting", statistics_.tasks_waiting)
+
+            self._pool("db_pool", engine.pool)
+            vector_engine = getattr(self.runtime.vector_store, "_engine", None)
+            if vector_engine is not None and vector_engine is not engine:
+                self._pool("pgvector_pool", vector_engine.pool)
+
+            executor = self.runtime.retrieval_executor
+            self._add("retrieval_queue", executor._work_queue.qsize())
+
+            for provider, semaphore in list(self.runtime._llm_semaphores.items()):
+                self._add(f"llm_slot_{provider}_waiting", len(getattr(semaphore, "_waiters", None) or ()))
+
+    def stop(self):
+        self._stopped = True
+
+    def summary(self) -> dict:
+        report = {}
+        for name, values in sorted(self.samples.items()):
+            entry = {"mean": round(statistics.fmean(values), 2), "max": round(max(values), 2)}
+            capacity = self.capacity.get(name)
+            if capacity:
+                entry["capacity"] = capacity
+                entry["saturated_pct"] = round(100 * sum(v >= capacity for v in values) / len(values), 1)
+            report[name] = entry
+        return report
+
+
+def build_runtime(args) -> RAGRuntime:
+    seed = args.seed
+    llm = FakeChatModel(LatencyProfile(args.llm_median_ms, 0.4, tail_rate=0.03, tail_ms=args.llm_median_ms * 8, seed=seed))
+    # Named like the configured provider so its concurrency limit (e.g. NVIDIA_MAX_CONCURRENCY) applies.
+    provider = settings.LLM_PROVIDER
+    embeddings = FakeEmbeddings(size=384) if args.embeddings == "fake" else build_embeddings()
+    return RAGRuntime(llm=MeteredLLM(provider, llm), llm_provider=provider, embeddings=embeddings)
+
+
+def install_stand_ins(args):
+    from app.routers import audio, image
+    audio.processor.polly_client = FakePolly(LatencyProfile(args.tts_median_ms, 0.3, tail_rate=0.02, tail_ms=args.tts_median_ms * 5, seed=args.seed + 1))
+    image.requests = FakeImageHTTP(LatencyProfile(args.image_median_ms, 0.4, tail_rate=0.05, tail_ms=args.image_median_ms * 4, seed=args.seed + 2))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 120
+    while not server.started:
+        if not thread.is_alive() or time.time() > deadline:
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.1)
+    return server
+
+
+class Student:
+    """One simulated user: onboarding, then weighted actions until the run ends."""
+
+    def __init__(self, index: int, client: httpx.AsyncClient, recorder: Recorder, args, pdfs: list, run_id: str):
+        self.index = index
+        self.client = client
+        self.recorder = recorder
+        self.args = args
+        self.pdfs = pdfs
+        self.run_id = run_id
+        self.random = random.Random(args.seed * 7919 + index)
+        self.headers = {}
+        self.session_id = None
+        self.ready_seconds = None
+        self.audio_chunks = None
+
+    async def onboard(self) -> bool:
+        call = self.recorder.call
+        credentials = {"email": f"load-{self.run_id}-{self.index}@example.com", "password": "load-test-pw"}
+        if not await call("POST /api/auth/register", self.client.post("/api/auth/register", json=credentials)):
+            return False
+        response = await call("POST /api/auth/login", self.client.post("/api/auth/login", json=credentials))
+        if not response:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        response = await call("POST /api/session/create", self.client.post("/api/session/create", json={}, headers=self.headers))
+        if not response:
+            return False
+        self.session_id = response.json()["session_id"]
+
+        pdf = self.pdfs[self.index % len(self.pdfs)]
+        files = {"files": (f"notes-{self.index}.pdf", pdf, "application/pdf")}
+        if not await call("POST /api/upload/", self.client.post("/api/upload/", files=files, data={"session_id": self.session_id})):
+            return False
+        return True
+
+    async def wait_until_ready(self, deadline: float):
+        """Polls the ingestion status like the frontend does; the student starts anyway at the deadline."""
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            response = await self.recorder.call(
+                "GET /api/upload/status/{session_id}", self.client.get(f"/api/upload/status/{self.session_id}")
+            )
+            if response and response.json().get("status") in ("done", "failed"):
+                self.ready_seconds = time.perf_counter() - start
+                break
+            await asyncio.sleep(self.args.poll_interval)
+        await self.recorder.call(
+            "GET /api/quiz/documents/{session_id}", self.client.get(f"/api/quiz/documents/{self.session_id}")
+        )
+
+    async def first_audio(self, client: httpx.AsyncClient, data: dict) -> httpx.Response:
+        """Sends a streamed teacher request and returns once the first audio event arrives (what the listener waits for)."""
+        request = client.build_request("POST", "/api/audio/interact/stream", data=data)
+        response = await client.send(request, stream=True)
+        if response.status_code >= 400:
+            await response.aclose()
+            return response
+        self.audio_chunks = response.aiter_lines()
+        async for line in self.audio_chunks:
+            if line and json.loads(line)["event"] == "audio":
+                break
+        return response
+
+    async def act(self, action: str):
+        call, client, sid = self.recorder.call, self.client, self.session_id
+        if action == "chat":
+            await call("POST /api/chat/", client.post("/api/chat/", json={"query": self.random.choice(CHAT_QUERIES), "session_id": sid}))
+        elif action == "quiz":
+            await call("POST /api/quiz/generate", client.post("/api/quiz/generate", json={"session_id": sid, "num_questions": 5}))
+        elif action == "summary":
+            await call("POST /api/quiz/summary", client.post("/api/quiz/summary", json={"session_id": sid}))
+        elif action == "teacher":
+            data = {"session_id": sid, "text_input": self.random.choice(CHAT_QUERIES)}
+            await call("POST /api/audio/interact", client.post("/api/audio/interact", data=data))
+        elif action == "teacher_stream":
+            data = {"session_id": sid, "text_input": self.random.choice(CHAT_QUERIES)}
+            response = await call("POST /api/audio/interact/stream (first audio)", self.first_audio(client, data))
+            if response:
+                try:
+                    async for _ in self.audio_chunks:
+                        pass
+                except httpx.HTTPError:
+                    pass
+                finally:
+                    await response.aclose()
+        elif action == "image":
+            data = {"session_id": sid, "concept": self.random.choice(CONCEPTS)}
+            await call("POST /api/image/generate-from-context", client.post("/api/image/generate-from-context", data=data))
+        else:
+            await call("GET /api/quiz/documents/{session_id}", client.get(f"/api/quiz/documents/{sid}"))
+
+    async def run(self, end: float):
+        await asyncio.sleep(self.args.ramp * self.index / max(1, self.args.users))
+        if not await self.onboard():
+            return
+        await self.wait_until_ready(end)
+        names, weights = list(ACTIONS), list(ACTIONS.values())
+        while time.perf_counter() < end:
+            await self.act(self.random.choices(names, weights)[0])
+            await asyncio.sleep(self.random.expovariate(1000 / self.args.think_ms) if self.args.think_ms else 0)
+
+    async def cleanup(self):
+        if self.session_id:
+            await self.recorder.call("DELETE /api/session/{session_id}", self.client.delete(f"/api/session/{self.session_id}"))
+
+
+def print_report(report: dict):
+    meta = report["meta"]
+    print(f"\n{meta['users']} users, {meta['elapsed_s']:.0f}s, {report['throughput_rps']:.1f} req/s overall\n")
+    print(f"{'endpoint':<48} {'count':>6} {'err':>5} {'rps':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:<48} {row['count']:>6} {row['errors']:>5} {row['rps']:>6.2f} "
+              f"{row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f} {row['max_ms']:>8.0f}")
+    ready = report["time_to_ready_s"]
+    if ready:
+        print(f"\nupload -> ingested: p50 {ready['p50']:.1f}s, p95 {ready['p95']:.1f}s, "
+              f"{ready['ready']}/{ready['uploads']} ready before the end of the run")
+    print(f"\n{'resource':<48} {'mean':>8} {'max':>8} {'capacity':>9} {'saturated':>10}")
+    for name, row in report["saturation"].items():
+        capacity = row.get("capacity")
+        saturated = f"{row['saturated_pct']:.1f}%" if capacity else ""
+        print(f"{name:<48} {row['mean']:>8.2f} {row['max']:>8.2f} {capacity or '':>9} {saturated:>10}")
+
+
+async def drive(args, base_url: str, pdfs: list, run_id: str) -> tuple:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users + 10, max_keepalive_connections=args.users + 10)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        end = started + args.ramp + args.duration
+        students = [Student(i, client, recorder, args, pdfs, run_id) for i in range(args.users)]
+        await asyncio.gather(*(student.run(end) for student in students))
+        elapsed = time.perf_counter() - started
+        await asyncio.gather(*(student.cleanup() for student in students))
+    return recorder, students, elapsed
+
+
+def main(args):
+    from app.main import app
+    runtime = build_runtime(args)
+    set_runtime(runtime)
+    install_stand_ins(args)
+    sampler = Sampler(runtime, args.sample_interval)
+
+    async def _start_sampler():
+        sampler.task = asyncio.get_running_loop().create_task(sampler.run())
+
+    app.router.on_startup.append(_start_sampler)
+    pdfs = make_pdfs(args.pdf_pages)
+    server = start_server(app, args.port or free_port())
+    run_id = uuid.uuid4().hex[:8]
+    base_url = f"http://127.0.0.1:{server.config.port}"
+    print(f"Load test {run_id}: {args.users} users against {base_url} (LLM {args.llm_median_ms:.0f} ms, "
+          f"TTS {args.tts_median_ms:.0f} ms, image {args.image_median_ms:.0f} ms median)")
+
+    try:
+        # The app prints per-request notes (fallbacks, cache misses); keep the report readable.
+        with contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext():
+            recorder, students, elapsed = asyncio.run(drive(args, base_url, pdfs, run_id))
+    finally:
+        sampler.stop()
+        server.should_exit = True
+
+    ready = [s.ready_seconds for s in students if s.ready_seconds is not None]
+    uploads = sum(1 for s in students if s.session_id)
+    endpoints = recorder.summary(elapsed)
+    report = {
+        "meta": {
+            "run_id": run_id,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "users": args.users,
+            "ramp_s": args.ramp,
+            "duration_s": args.duration,
+            "elapsed_s": round(elapsed, 1),
+            "think_ms": args.think_ms,
+            "llm_median_ms": args.llm_median_ms,
+            "tts_median_ms": args.tts_median_ms,
+            "image_median_ms": args.image_median_ms,
+            "llm_provider": settings.LLM_PROVIDER,
+            "embeddings": args.embeddings,
+            "ingest_workers": settings.INGEST_WORKERS,
+            "retrieval_workers": settings.RETRIEVAL_WORKERS,
+        },
+        "throughput_rps": round(sum(row["count"] for row in endpoints.values()) / elapsed, 2),
+        "endpoints": endpoints,
+        "time_to_ready_s": {
+            "uploads": uploads,
+            "ready": len(ready),
+            "p50": round(percentile(ready, 0.5), 2),
+            "p95": round(percentile(ready, 0.95), 2),
+        } if ready else None,
+        "saturation": sampler.summary(),
+        "runtime": runtime.stats(),
+    }
+    print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nWrote {args.out}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--ramp", type=float, default=20, help="seconds over which users arrive")
+    parser.add_argument("--duration", type=float, default=60, help="seconds of load after the ramp")
+    parser.add_argument("--think-ms", type=float, default=3000, help="mean pause between a user's actions")
+    parser.add_argument("--llm-median-ms", type=float, default=1200)
+    parser.add_argument("--tts-median-ms", type=float, default=800)
+    parser.add_argument("--image-median-ms", type=float, default=3000)
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--embeddings", choices=["fake", "local"], default="fake")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--sample-interval", type=float, default=0.5)
+    parser.add_argument("--timeout", type=float, default=120, help="client timeout per request")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--out")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's own output")
+    main(parser.parse_args())
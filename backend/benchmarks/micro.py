@@ -0,0 +1,320 @@
+"""Offline micro-benchmarks for the ingestion, retrieval and rendering hot paths.
+
+Needs no network: embeddings are FakeEmbeddings (or the local sentence-transformers
+model with --embeddings local), the LLM is benchmarks.fakes.FakeChatModel with a fixed
+latency, and the only service is the Postgres + pgvector at DATABASE_URL. Point it at a
+scratch database: chunks go to a separate "benchmark_chunks" collection, which is
+dropped afterwards unless --keep-data (reruns then only insert the missing rows).
+
+    python benchmarks/micro.py --out bench.json
+    python benchmarks/micro.py --sizes 10000,100000,1000000 --baseline bench.json
+
+Benchmarks: pdf (ProcessorService.process_pdf pages/s), ingest (RAGService.add_document
+chunks/s), retrieval (_get_session_retriever and hybrid query latency at each --sizes
+table size), chat (achat latency minus the fake LLM's), render (PPTX and DOCX).
+With --baseline, metrics that got worse by more than --threshold are listed and the
+exit status is 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+from langchain_community.embeddings import FakeEmbeddings
+from sqlalchemy import text
+from app.core.config import settings
+from app.database import create_db_and_tables, engine
+from app.services.bulk_ingest import copy_embeddings
+from app.services.docx_generator import create_sample_paper_docx
+from app.services.ppt_service import PPTService
+from app.services.processor import ProcessorService
+from app.services.runtime import RAGRuntime, build_embeddings
+from benchmarks.fakes import FakeChatModel, LatencyProfile, WORDS, filler_text
+
+COLLECTION = "benchmark_chunks"
+CHUNKS_PER_SESSION = 500
+QUERIES = ["explain the main theorem", "what is osmosis", "matrix derivative proof", "causes of inflation",
+           "magnetic field and current", "role of mitochondria", "graph algorithm complexity", "treaty and empire"]
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def latency_summary(prefix: str, seconds: list) -> dict:
+    ms = [s * 1000 for s in seconds]
+    return {f"{prefix}p50_ms": round(percentile(ms, 0.5), 2), f"{prefix}p95_ms": round(percentile(ms, 0.95), 2)}
+
+
+def timed_runs(fn, repeat: int) -> list:
+    fn()  # warm-up: imports, process pool start, first-use caches
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - start)
+    return runs
+
+
+def make_pdf(path: str, pages: int):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.set_font("Arial", size=11)
+    for page in range(pages):
+        pdf.add_page()
+        pdf.multi_cell(0, 5, filler_text(450, seed=page))
+    pdf.output(path)
+
+
+def bench_pdf(args) -> dict:
+    processor = ProcessorService()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.pdf")
+        make_pdf(path, args.pdf_pages)
+
+        def _extract():
+            with open(path, "rb") as f:
+                text_out, metadata = processor.process_pdf(f, "bench.pdf")
+            if metadata.get("total_pages") != args.pdf_pages:
+                raise RuntimeError(f"process_pdf failed: {text_out[:200]}")
+
+        runs = timed_runs(_extract, args.repeat)
+    seconds = statistics.median(runs)
+    return {"pages": args.pdf_pages, "seconds": round(seconds, 3), "pages_per_sec": round(args.pdf_pages / seconds, 1)}
+
+
+def bench_ingest(runtime: RAGRuntime, args) -> dict:
+    # Text unique to this run, so the chunk embedding cache (local model) cannot serve it.
+    document = filler_text(args.doc_words, seed=uuid.uuid4().int % 10**9)
+    service = runtime.session(f"bench-ingest-{uuid.uuid4().hex[:8]}")
+    start = time.perf_counter()
+    chunks = service.add_document(document, {"source": "bench.txt", "type": "txt"})
+    seconds = time.perf_counter() - start
+    service.delete_session_documents(service.session_id)
+    return {"chunks": chunks, "seconds": round(seconds, 3), "chunks_per_sec": round(chunks / seconds, 1)}
+
+
+def _collection_rows(collection_id: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(
+            text("SELECT count(*) FROM langchain_pg_embedding WHERE collection_id = :cid"), {"cid": collection_id}
+        ).scalar()
+
+
+def populate(runtime: RAGRuntime, rows: int):
+    """Fills the benchmark collection up to rows chunks, CHUNKS_PER_SESSION per session."""
+    collection_id = runtime.collection_id()
+    existing = _collection_rows(collection_id)
+    if existing >= rows:
+        return
+    rng = numpy.random.default_rng(existing)
+    texts = [filler_text(150, seed=i) for i in range(500)]
+    batch = 10000
+    start = time.perf_counter()
+    for offset in range(existing, rows, batch):
+        count = min(batch, rows - offset)
+        vectors = rng.standard_normal((count, settings.EMBEDDING_DIM), dtype=numpy.float32)
+        vectors /= numpy.linalg.norm(vectors, axis=1, keepdims=True)
+        copy_embeddings(collection_id, [
+            (str(uuid.uuid4()), texts[(offset + i) % len(texts)], vectors[i], {
+                "session_id": f"bench-s{(offset + i) // CHUNKS_PER_SESSION}",
+                "source": "bench.txt",
+                "char_start": ((offset + i) % CHUNKS_PER_SESSION) * 1000,
+                "char_end": ((offset + i) % CHUNKS_PER_SESSION) * 1000 + 1000,
+            })
+            for i in range(count)
+        ])
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE langchain_pg_embedding"))
+    print(f"  populated {rows - existing} chunks in {time.perf_counter() - start:.1f}s")
+
+
+def bench_retrieval(runtime: RAGRuntime, rows: int, args) -> dict:
+    populate(runtime, rows)
+    service = runtime.session("bench-s0")
+    vector_runs, hybrid_runs, vector_hits = [], [], []
+    queries = [QUERIES[i % len(QUERIES)] + f" {WORDS[i % len(WORDS)]}" for i in range(args.queries)]
+    service._get_session_retriever(k=20).invoke(queries[0])  # warm-up
+    for query in queries:
+        start = time.perf_counter()
+        docs = service._get_session_retriever(k=20).invoke(query)
+        vector_runs.append(time.perf_counter() - start)
+        vector_hits.append(len(docs))
+        start = time.perf_counter()
+        service._hybrid_search(query, 20, None)
+        hybrid_runs.append(time.perf_counter() - start)
+    return {
+        "chunks": rows,
+        **latency_summary("vector_", vector_runs),
+        **latency_summary("hybrid_", hybrid_runs),
+        # With an HNSW index, filtering happens after the index scan: a small session in a big table can come back short of k.
+        "vector_results_avg": round(statistics.mean(vector_hits), 1),
+    }
+
+
+def bench_chat(runtime: RAGRuntime, args) -> dict:
+    populate(runtime, CHUNKS_PER_SESSION)
+    service = runtime.session("bench-s0")
+    latency_ms = args.llm_latency_ms
+
+    async def _run():
+        await service.achat(QUERIES[0])
+        runs = []
+        for i in range(args.queries):
+            # A new query each time: the retrieval cache would otherwise answer after the first.
+            start = time.perf_counter()
+            await service.achat(f"{QUERIES[i % len(QUERIES)]} {i}")
+            runs.append(time.perf_counter() - start)
+        return runs
+
+    runs = asyncio.run(_run())
+    summary = latency_summary("", runs)
+    summary["overhead_p50_ms"] = round(summary["p50_ms"] - latency_ms, 2)
+    summary["llm_latency_ms"] = latency_ms
+    return summary
+
+
+def bench_render(args) -> dict:
+    slides = [{"title": f"Section {i + 1}", "points": [filler_text(12, seed=i * 10 + j) for j in range(5)]} for i in range(args.slides)]
+    paper = {"paper": [
+        {"section": f"Section {chr(65 + s)}", "marks": 2 + s * 3, "questions": [
+            {"question": filler_text(25, seed=s * 100 + q), "answer": filler_text(60, seed=s * 100 + q + 50)} for q in range(10)
+        ]} for s in range(3)
+    ]}
+    ppt = PPTService()
+    return {
+        "pptx_slides": args.slides,
+        **latency_summary("pptx_", timed_runs(lambda: ppt.create_presentation(slides, "Benchmark"), args.repeat)),
+        **latency_summary("docx_", timed_runs(lambda: create_sample_paper_docx(paper), args.repeat)),
+    }
+
+
+def build_runtime(args) -> RAGRuntime:
+    embeddings = FakeEmbeddings(size=settings.EMBEDDING_DIM) if args.embeddings == "fake" else build_embeddings()
+    llm = FakeChatModel(LatencyProfile(args.llm_latency_ms, sigma=0))
+    runtime = RAGRuntime(llm=llm, llm_provider="fake", embeddings=embeddings)
+    runtime.collection_name = COLLECTION
+    runtime.load()
+    if not runtime.vector_store or not runtime.collection_id():
+        raise SystemExit(f"No pgvector store at {settings.DATABASE_URL}")
+    # Time the hybrid and delete paths against the migrated columns, not the cmetadata fallback.
+    runtime.prepare_vector_schema(migrate=True)
+    runtime.session().ensure_index()
+    return runtime
+
+
+def metadata(args, runtime: RAGRuntime) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    with engine.connect() as conn:
+        postgres = conn.execute(text("SHOW server_version")).scalar()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "postgres": postgres,
+        "embeddings": type(runtime.embeddings).__name__,
+        "args": vars(args),
+    }
+
+
+def direction(metric: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 for descriptive values."""
+    if metric.endswith("_per_sec"):
+        return 1
+    if (metric.endswith("_ms") and metric != "llm_latency_ms") or metric == "seconds":
+        return -1
+    return 0
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Prints current vs baseline for every comparable metric; returns the regressions."""
+    regressions = []
+    print(f"\n{'benchmark':<20} {'metric':<20} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get("results", {}).get(name, {}).get(metric)
+            sign = direction(metric)
+            if not sign or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            worse = -change * sign > threshold
+            print(f"{name:<20} {metric:<20} {old:>12} {value:>12} {change:>+8.1%}{'  REGRESSION' if worse else ''}")
+            if worse:
+                regressions.append((name, metric, old, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", default="pdf,ingest,retrieval,chat,render", help="comma-separated benchmarks to run")
+    parser.add_argument("--sizes", default="10000,100000", help="table sizes (chunks) for the retrieval benchmark")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--pdf-pages", type=int, default=120)
+    parser.add_argument("--doc-words", type=int, default=150000)
+    parser.add_argument("--slides", type=int, default=12)
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--embeddings", choices=("fake", "local"), default="fake")
+    parser.add_argument("--keep-data", action="store_true", help="keep the benchmark collection for the next run")
+    parser.add_argument("--out", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="earlier --out file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+    selected = set(args.only.split(","))
+
+    create_db_and_tables()
+    runtime = build_runtime(args)
+    results = {}
+    try:
+        if "pdf" in selected:
+            print("pdf extraction...")
+            results["pdf_extract"] = bench_pdf(args)
+        if "ingest" in selected:
+            print("add_document...")
+            results["add_document"] = bench_ingest(runtime, args)
+        if "retrieval" in selected:
+            for rows in sorted(int(size) for size in args.sizes.split(",")):
+                print(f"retrieval at {rows} chunks...")
+                results[f"retrieval_{rows}"] = bench_retrieval(runtime, rows, args)
+        if "chat" in selected:
+            print("chat pipeline...")
+            results["chat_pipeline"] = bench_chat(runtime, args)
+        if "render" in selected:
+            print("pptx/docx rendering...")
+            results["render"] = bench_render(args)
+    finally:
+        if not args.keep_data:
+            runtime.vector_store.delete_collection()
+
+    report = {"meta": metadata(args, runtime), "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
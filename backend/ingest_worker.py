@@ -0,0 +1,27 @@
+"""Standalone ingestion worker: runs the job queue without serving HTTP.
+
+Run web nodes with INGEST_WORKERS=0 and scale this process separately:
+    INGEST_WORKERS=4 python ingest_worker.py
+
+Uploads are spooled to the web node's local UPLOAD_SPOOL_DIR, and workers only claim
+files spooled on their own INGEST_HOST. Run this next to the web process (same
+INGEST_HOST), or put UPLOAD_SPOOL_DIR on shared storage and set UPLOAD_SPOOL_SHARED=true.
+"""
+import os, sys, time
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import create_db_and_tables
+from app.services.runtime import get_runtime
+from app.services.ingestion import IngestionWorkerPool
+from app.core.config import settings
+
+if __name__ == "__main__":
+    create_db_and_tables()
+    get_runtime().warm_up()
+    pool = IngestionWorkerPool(workers=max(1, settings.INGEST_WORKERS))
+    pool.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        pool.stop()
@@ -0,0 +1,23 @@
+"""Adds indexed session_id/source/document_tsv columns to langchain_pg_embedding and backfills existing rows.
+
+Run this as a deploy step before starting the app (VECTOR_SCHEMA_AUTO_MIGRATE is off
+by default; the app only migrates an empty table itself, and until this has run it
+filters on cmetadata, which is correct but slower). It is online: the columns are added as plain nullable columns kept up
+to date by a trigger, existing rows are backfilled in --batch-size primary-key slices
+(one short transaction each), and indexes are built with CREATE INDEX CONCURRENTLY.
+Safe to rerun; a rerun finishes a backfill that was interrupted.
+
+    python migrate_vector_schema.py --batch-size 5000
+"""
+import argparse
+import os, sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.vector_schema import BACKFILL_BATCH, ensure_vector_schema
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH)
+    args = parser.parse_args()
+    ensure_vector_schema(force_backfill=True, batch_size=args.batch_size)
+    print("✅ langchain_pg_embedding has session_id/source/document_tsv columns and indexes")
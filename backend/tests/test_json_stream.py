@@ -0,0 +1,37 @@
+import json
+
+from app.services.json_stream import JSONObjectStream, parse_json_objects
+
+
+def _question(n):
+    return {"question": f"Q{n}?", "options": ["a", "b", "c", "d"], "answer": "a", "topic": "t"}
+
+
+def test_array_split_across_chunks():
+    text = "```json\n" + json.dumps([_question(1), _question(2)]) + "\n```"
+    parser = JSONObjectStream()
+    objects = []
+    for i in range(0, len(text), 7):
+        objects.extend(parser.feed(text[i:i + 7]))
+    assert objects == [_question(1), _question(2)]
+
+
+def test_truncated_object_does_not_swallow_the_rest():
+    truncated = json.dumps(_question(1))[:-20]
+    text = "\n".join([truncated, json.dumps(_question(2)), json.dumps(_question(3))])
+    parser = JSONObjectStream()
+    assert parser.feed(text) == [_question(2), _question(3)]
+    assert parser.skipped == 1
+
+
+def test_truncated_inside_string_and_list():
+    first = '{"question": "What is'
+    second = '{"question": "Q?", "options": ["a", "b"'
+    text = "\n".join([first, second, json.dumps(_question(3))])
+    assert parse_json_objects(text) == [_question(3)]
+
+
+def test_nested_objects_are_kept():
+    nested = {"question": "Q?", "meta": {"tags": [{"a": 1}, {"b": "}{"}]}}
+    text = "[\n  " + json.dumps(nested, indent=2) + ",\n  " + json.dumps(_question(1)) + "\n]"
+    assert parse_json_objects(text) == [nested, _question(1)]